@@ -0,0 +1,214 @@
+import argparse
+import io
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import dedup
+import engine
+import ingest
+import journal
+import metrics
+import output
+import reconcile
+from registry import resolve_vendor
+
+MAX_UPLOAD_MB = 512
+MAX_FINISHED_JOBS = 1000
+
+
+class JobManager:
+    # Jobs wait in a bounded queue and are run by a fixed set of runner
+    # threads that all feed the same warm process pool, so a burst of small
+    # submissions never spawns extra processes. submit() returns None when
+    # the queue is full.
+
+    def __init__(self, executor, runners=2, max_queue=64, use_cache=True):
+        self.executor = executor
+        self.use_cache = use_cache
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        for _ in range(runners):
+            threading.Thread(target=self._run_forever, daemon=True).start()
+
+    def submit(self, data, filename, module_name):
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id, "status": "queued", "vendor": module_name or "auto",
+            "submitted": time.time(), "finished": None, "error": None,
+            "files": {}, "rows": [],
+        }
+        try:
+            self._queue.put_nowait((job, data, filename, module_name))
+        except queue.Full:
+            return None
+        with self._lock:
+            self.jobs[job_id] = job
+            self._prune()
+        return job_id
+
+    def _prune(self):
+        finished = [j for j in self.jobs.values() if j["finished"]]
+        if len(finished) > MAX_FINISHED_JOBS:
+            finished.sort(key=lambda j: j["finished"])
+            for job in finished[:len(finished) - MAX_FINISHED_JOBS]:
+                del self.jobs[job["job_id"]]
+
+    def _run_forever(self):
+        while True:
+            job, data, filename, module_name = self._queue.get()
+            try:
+                self._run(job, data, filename, module_name)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job, data, filename, module_name):
+        with self._lock:
+            job["status"] = "running"
+        try:
+            unreadable = []
+            pdfs = ingest.iter_upload(data, filename, errors=unreadable)
+            results = dedup.parse_unique(self.executor, module_name, pdfs, use_cache=self.use_cache)
+            results = itertools.chain(results, ingest.failed_inputs(unreadable))
+            for fname, module, rows, err, m in reconcile.validate(results):
+                state = journal.file_status(module, rows, err)
+                with self._lock:
+                    job["files"][fname] = {"status": state, **metrics.file_row(fname, module, rows, err, m)}
+                    job["rows"].extend(rows)
+            status = "done"
+        except Exception as e:
+            status = "failed"
+            job["error"] = str(e)
+        with self._lock:
+            job["status"] = status
+            job["finished"] = time.time()
+
+    def status(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            counts = {}
+            for info in job["files"].values():
+                counts[info["status"]] = counts.get(info["status"], 0) + 1
+            return {
+                "job_id": job_id, "status": job["status"], "vendor": job["vendor"],
+                "submitted": job["submitted"], "finished": job["finished"], "error": job["error"],
+                "files_done": len(job["files"]), "counts": counts, "rows": len(job["rows"]),
+                "files": dict(job["files"]),
+            }
+
+    def rows(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else (job["status"], list(job["rows"]))
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    # POST /jobs?vendor=auto&filename=x.pdf   body: ZIP or PDF bytes → 202 {job_id}
+    # GET  /jobs/<id>                         status and per-file progress
+    # GET  /jobs/<id>/results?format=json|csv rows of a finished job
+    # GET  /health
+    manager = None
+
+    def _send(self, code, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._send(404, {"error": "not found"})
+        qs = parse_qs(url.query)
+        try:
+            module_name = resolve_vendor(qs.get("vendor", ["auto"])[0])
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return self._send(400, {"error": "empty body; send a ZIP or PDF"})
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            return self._send(413, {"error": f"upload larger than {MAX_UPLOAD_MB} MB"})
+        data = self.rfile.read(length)
+        filename = qs.get("filename", ["upload.pdf"])[0]
+        job_id = self.manager.submit(data, filename, module_name)
+        if job_id is None:
+            return self._send(429, {"error": "job queue is full, retry later"}, headers={"Retry-After": "5"})
+        self._send(202, {"job_id": job_id, "status": "queued"}, headers={"Location": f"/jobs/{job_id}"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["health"]:
+            return self._send(200, {"status": "ok", "queue_depth": self.manager.queue_depth()})
+        if len(parts) == 2 and parts[0] == "jobs":
+            status = self.manager.status(parts[1])
+            return self._send(200, status) if status else self._send(404, {"error": "unknown job"})
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "results":
+            found = self.manager.rows(parts[1])
+            if found is None:
+                return self._send(404, {"error": "unknown job"})
+            status, rows = found
+            if status not in ("done", "failed"):
+                return self._send(409, {"error": f"job is {status}"})
+            fmt = parse_qs(url.query).get("format", ["json"])[0]
+            if fmt == "csv":
+                buf = io.StringIO()
+                with output.CsvRowWriter(buf) as writer:
+                    writer.write(rows)
+                return self._send(200, buf.getvalue().encode("utf-8"), "text/csv")
+            return self._send(200, [output.normalize_row(r) for r in rows])
+        self._send(404, {"error": "not found"})
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def make_server(executor, host="127.0.0.1", port=8600, runners=2, max_queue=64, use_cache=True):
+    # port=0 picks a free port (server.server_address has the real one)
+    handler = type("Handler", (ApiHandler,), {
+        "manager": JobManager(executor, runners=runners, max_queue=max_queue, use_cache=use_cache),
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Local HTTP job API for invoice parsing.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8600)
+    ap.add_argument("-w", "--workers", type=int, default=engine.DEFAULT_WORKERS,
+                    help="parser processes shared by all jobs")
+    ap.add_argument("--runners", type=int, default=2, help="jobs processed concurrently")
+    ap.add_argument("--max-queue", type=int, default=64,
+                    help="queued jobs beyond this are rejected with HTTP 429")
+    args = ap.parse_args(argv)
+
+    with engine.start_engine(args.workers) as executor:
+        server = make_server(executor, args.host, args.port, args.runners, args.max_queue)
+        print(f"Listening on http://{args.host}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,98 +1,210 @@
 import streamlit as st
-import zipfile
+import itertools
+import json
 import os
+import shutil
 import tempfile
-import importlib.util
+import time
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor
+
+import dedup
+import engine
+import ingest
+import journal
+import metrics
+import output
+import reconcile
+import results
+import registry
+from registry import VENDOR_PARSERS
 
 # Title
 st.title("BRZ Vendor Invoice Parser")
 
-# Vendor parser map (vendor name → module name without .py)
-VENDOR_PARSERS = {
-    "Flint Hills": "parse_flinthills",
-    "Boyett":      "parse_boyett",
-    "Dale":        "parse_dale",
-    "Marathon":    "parse_marathon",
-    "BB Energy":   "parse_bbenergy",
-}
+# Worker pool size (process count); the pool stays warm across reruns and is
+# replaced when the size changes
+workers = st.sidebar.number_input(
+    "Parser workers", min_value=1, max_value=64, value=min(engine.DEFAULT_WORKERS, 64)
+)
+
+
+# Memory budget in MB (0 = unlimited): bounds how far ingest reads ahead of
+# the workers
+memory_mb = st.sidebar.number_input(
+    "Memory budget (MB, 0 = unlimited)", min_value=0, value=engine.MEMORY_MB, step=256
+)
+
+# Every finished PDF is checkpointed in a job journal (journal.py). Running
+# the same ZIP for the same vendor again resumes that job if it did not
+# finish, even after the session or the container restarted.
+resume = st.sidebar.checkbox("Resume interrupted batches", value=True)
+
+# Identical or re-sent PDFs in a batch are parsed once (dedup.py)
+skip_duplicates = st.sidebar.checkbox("Parse duplicate PDFs once", value=True)
+
+# Post-parse validation (reconcile.py): line items against totals and
+# duplicate invoices across files and earlier runs
+cross_check = st.sidebar.checkbox("Check totals and duplicates across invoices", value=True)
+
+
+@st.cache_resource(show_spinner=False)
+def shared_engine():
+    # one pool for all sessions; changing the worker count replaces it
+    return engine.SharedEngine()
+
 
-# 1. Vendor selection
-vendor = st.selectbox("Select vendor", list(VENDOR_PARSERS.keys()))
-parser_module_name = VENDOR_PARSERS[vendor]
+def get_engine(workers):
+    return shared_engine().get(workers)
+
+
+# 1. Vendor selection ("Auto-detect" routes each PDF to its vendor's parser)
+AUTO_DETECT = "Auto-detect"
+vendor = st.selectbox("Select vendor", [AUTO_DETECT] + list(VENDOR_PARSERS.keys()))
+parser_module_name = None if vendor == AUTO_DETECT else VENDOR_PARSERS[vendor]
 
 # 2. File uploader
 uploaded_zip = st.file_uploader(
     "Upload ZIP file containing PDF invoices", type="zip"
 )
 
-@st.cache_data(show_spinner=False)
-def run_full_parse(zip_bytes, parser_module_name):
-    # Unzip and parse all PDFs, returning rows list
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # write and extract zip
-        zip_path = os.path.join(tmpdir, "invoices.zip")
-        with open(zip_path, "wb") as f:
-            f.write(zip_bytes)
-        with zipfile.ZipFile(zip_path, "r") as z:
-            z.extractall(tmpdir)
-
-        # load parser module
-        spec = importlib.util.spec_from_file_location(
-            parser_module_name, os.path.join(os.getcwd(), f"{parser_module_name}.py")
-        )
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        if not hasattr(module, "parse"):
-            raise RuntimeError(f"Parser {parser_module_name}.py has no parse() function.")
-        parse_function = module.parse
-
-        # discover PDF files
-        pdf_files = [fname for fname in os.listdir(tmpdir) if fname.lower().endswith('.pdf')]
-        all_rows = []
-        # parallel parse
-        def parse_one(fname):
-            path = os.path.join(tmpdir, fname)
-            try:
-                with open(path, 'rb') as f:
-                    rows = parse_function(f) or []
-                for row in rows:
-                    row['source_file'] = fname
-                return fname, rows, None
-            except Exception as e:
-                return fname, [], str(e)
-
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            for fname, rows, err in executor.map(parse_one, pdf_files):
-                if rows:
-                    all_rows.extend(rows)
-                # We ignore errors here; rows empty will mark failure
-        return all_rows, pdf_files
+def run_full_parse(zip_source, parser_module_name, executor, out_dir, memory_mb=0, jnl=None, cross_check=True,
+                   skip_duplicates=True):
+    # Stream PDFs out of the ZIP (subfolders included) and parse them. Rows
+    # are written in batches to typed Parquet, CSV and SQLite (the results
+    # explorer's store) files in out_dir as they arrive rather than collected
+    # in memory. Results are cached per PDF on
+    # disk (cache.py), so re-uploads only parse the PDFs that were not seen
+    # before. Per-file stage timings and errors are collected in records.
+    # zip_source is bytes or a seekable file object such as the upload itself.
+    # With a journal, the files it already holds (same name and content) are
+    # replayed from it after the rest are parsed; each new result is
+    # committed to it. Nested
+    # ZIPs and members that cannot be read are reported as failed files.
+    unreadable = []
+    pdfs = ingest.iter_zip_pdfs(zip_source, errors=unreadable)
+    pdf_files = []
+    parsed_files = []
+    quarantined = []
+    records = []
+    parquet_out = output.ParquetRowWriter(os.path.join(out_dir, "parsed_output.parquet"))
+    csv_out = output.CsvRowWriter(os.path.join(out_dir, "parsed_output.csv"))
+    sqlite_out = output.SqliteRowWriter(os.path.join(out_dir, "parsed_output.sqlite"))
+    with parquet_out, csv_out, sqlite_out:
+        # parallel parse in the worker processes
+        parse = dedup.parse_unique if skip_duplicates else engine.parse_pdfs
+        if jnl is None:
+            results = parse(executor, parser_module_name, pdfs, memory_mb=memory_mb)
+            results = itertools.chain(results, ingest.failed_inputs(unreadable))
+        else:
+            replay = set()
+            fresh = parse(executor, parser_module_name, jnl.remaining(pdfs, replay), memory_mb=memory_mb)
+            fresh = itertools.chain(fresh, ingest.failed_inputs(unreadable))
+            results = itertools.chain(jnl.track(fresh), jnl.results(fnames=replay))
+        if cross_check:
+            results = reconcile.validate(results)
+        for fname, module, rows, err, m in results:
+            pdf_files.append(fname)
+            records.append(metrics.file_row(fname, module, rows, err, m))
+            if module is None and err is None:
+                quarantined.append(fname)
+            if rows:
+                parsed_files.append(fname)
+                parquet_out.write(rows)
+                csv_out.write(rows)
+                sqlite_out.write(rows)
+    return pdf_files, parsed_files, quarantined, parquet_out.rows_written, records
 
 if st.button("Run Parser") and uploaded_zip:
-    # Run and cache
-    all_rows, pdf_files = run_full_parse(uploaded_zip.getvalue(), parser_module_name)
+    # Run (per-PDF results come from the cache when possible)
+    # output files of the previous run in this session are no longer needed
+    if st.session_state.get("out_dir"):
+        shutil.rmtree(st.session_state["out_dir"], ignore_errors=True)
+    out_dir = st.session_state["out_dir"] = tempfile.mkdtemp(prefix="invoice-parser-")
+    start = time.perf_counter()
+    journal.prune()
+    job = journal.job_id(journal.upload_digest(uploaded_zip), parser_module_name,
+                         registry.versions(parser_module_name))
+    jnl = journal.open_job(job, resume)
+    done = len(jnl.completed())
+    if done:
+        st.info(f"Resuming job {job}: {done} files already done, parsing the rest.")
+    jnl.start(source=uploaded_zip.name, vendor=vendor)
+    # read the upload in place rather than copying it with getvalue()
+    pdf_files, parsed_files, quarantined, row_count, records = run_full_parse(
+        uploaded_zip, parser_module_name, get_engine(workers), out_dir, memory_mb, jnl, cross_check, skip_duplicates
+    )
+    jnl.finish()
+    summary = metrics.summarize(records, time.perf_counter() - start)
 
     # Compute parsed vs failed
-    parsed_files = set(row['source_file'] for row in all_rows)
+    parsed_files = set(parsed_files)
     total = len(pdf_files)
     parsed = len(parsed_files)
-    failed = sorted(set(pdf_files) - parsed_files)
+    failed = sorted(set(pdf_files) - parsed_files - set(quarantined))
 
     # Display summary
-    st.markdown(f"**Uploaded:** {total}   **Parsed:** {parsed}   **Failed:** {len(failed)}")
+    st.markdown(
+        f"**Uploaded:** {total}   **Parsed:** {parsed}   **Failed:** {len(failed)}"
+        f"   **Unrecognised:** {len(quarantined)}"
+    )
+    if quarantined:
+        st.warning("Files not matched to any vendor (quarantined):")
+        for fn in sorted(quarantined):
+            st.write(f"• {fn}")
     if failed:
+        errors = {r["file"]: r["error"] for r in records}
         st.error("Files with no parsed rows:")
         for fn in failed:
-            st.write(f"• {fn}")
+            st.write(f"• {fn}: {errors.get(fn) or 'no rows found'}")
 
-    # Show DataFrame
-    if all_rows:
-        df = pd.DataFrame(all_rows)
-        st.success(f"Parsed {len(df)} rows total.")
-        st.dataframe(df)
-        csv = df.to_csv(index=False).encode('utf-8')
-        st.download_button("Download CSV", csv, file_name="parsed_output.csv", mime="text/csv")
+    # Per-file stage timings
+    with st.expander("Timings"):
+        st.write(
+            f"Wall {summary['wall_seconds']}s, worker {summary['worker_seconds']}s, "
+            f"{summary['pages']} pages ({summary['ocr_pages']} OCR), {summary['cached']} from cache "
+            f"({summary['duplicates']} duplicates)"
+        )
+        st.dataframe(pd.DataFrame([summary["stage_seconds"]]))
+        st.dataframe(pd.DataFrame(records))
+        st.download_button(
+            "Download metrics JSON",
+            json.dumps({"summary": summary, "files": records}, indent=2),
+            file_name="parse_metrics.json", mime="application/json",
+        )
+
+    st.session_state["row_count"] = row_count
+    if row_count:
+        st.success(f"Parsed {row_count} rows total.")
     else:
         st.warning("No rows parsed.")
+
+# 3. Results explorer. Rows stay in the run's SQLite file on the server and
+# are fetched one page at a time through indexed filters, so results of any
+# size (and the reruns every filter change triggers) stay fast.
+out_dir = st.session_state.get("out_dir")
+if out_dir and st.session_state.get("row_count"):
+    store = results.ResultStore(os.path.join(out_dir, "parsed_output.sqlite"))
+    st.subheader("Results")
+    c1, c2, c3, c4 = st.columns(4)
+    only_check = c1.checkbox("Check needed only")
+    invoice = c2.text_input("Invoice number", help="exact; end with * to match a prefix")
+    source = c3.text_input("Source file", help="exact; end with * to match a prefix")
+    vendor_filter = c4.selectbox("Vendor", ["All"] + store.distinct("vendor_name"))
+    filters = dict(
+        check_needed=True if only_check else None, invoice_number=invoice, source_file=source,
+        vendor_name="" if vendor_filter == "All" else vendor_filter,
+    )
+    matching = store.count(**filters)
+    n_pages = max(1, -(-matching // results.PAGE_SIZE))
+    page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1,
+                           key=f"page-{out_dir}-{n_pages}")
+    st.caption(f"{matching} matching rows")
+    st.dataframe(pd.DataFrame(store.page(page - 1, **filters), columns=output.COLUMNS))
+
+    with open(os.path.join(out_dir, "parsed_output.csv"), "rb") as fh:
+        st.download_button("Download CSV", fh, file_name="parsed_output.csv", mime="text/csv")
+    with open(os.path.join(out_dir, "parsed_output.parquet"), "rb") as fh:
+        st.download_button(
+            "Download Parquet", fh, file_name="parsed_output.parquet",
+            mime="application/vnd.apache.parquet",
+        )
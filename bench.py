@@ -0,0 +1,188 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import synth
+
+VARIANTS = ("text", "scanned")
+
+
+def _run_case(module_name, variant, docs, pages, items, result_queue):
+    # Runs in a fresh process so peak RSS belongs to this parser alone.
+    # Result and OCR caches point at an empty directory with no budget, so
+    # every page is really parsed and OCR'd. One extra document is parsed
+    # untimed first, so the PDF/OCR library imports and first-use setup are
+    # not counted against the parser.
+    import importlib
+
+    import ocr
+    import raster
+
+    timings = {"render_seconds": 0.0, "ocr_seconds": 0.0, "text_pages": 0, "ocr_pages": 0}
+
+    def timed(fn, key):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[key] += time.perf_counter() - start
+        return wrapper
+
+    def timed_render(*args, **kwargs):
+        # render_pages is a generator: time each step, not just the call
+        gen = raster.render_pages.__wrapped__(*args, **kwargs)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(gen)
+            except StopIteration:
+                timings["render_seconds"] += time.perf_counter() - start
+                return
+            timings["render_seconds"] += time.perf_counter() - start
+            yield item
+
+    def counted_pages(*args, **kwargs):
+        for item in counted_pages.__wrapped__(*args, **kwargs):
+            timings["ocr_pages" if item[3] is not None else "text_pages"] += 1
+            yield item
+
+    timed_render.__wrapped__ = raster.render_pages
+    counted_pages.__wrapped__ = raster.iter_page_text
+    raster.render_pages = timed_render
+    raster.iter_page_text = counted_pages
+    ocr.images_to_data = timed(ocr.images_to_data, "ocr_seconds")
+    ocr.preprocess = timed(ocr.preprocess, "ocr_seconds")
+
+    result = {"parser": module_name, "variant": variant, "docs": docs, "pages": docs * pages,
+              "rows": 0, "error": None}
+    try:
+        parse = importlib.import_module(module_name).parse
+        blobs = [synth.generate(module_name, pages, items, variant == "scanned", seed=i) for i in range(docs + 1)]
+        warm_up = BytesIO(blobs.pop())
+        warm_up.name = "warm_up.pdf"
+        parse(warm_up)
+        timings.update(dict.fromkeys(timings, 0))
+        start = time.perf_counter()
+        for i, data in enumerate(blobs):
+            f = BytesIO(data)
+            f.name = f"synthetic_{i}.pdf"
+            result["rows"] += len(parse(f) or [])
+        seconds = time.perf_counter() - start
+        result.update(timings)
+        result["seconds"] = seconds
+        result["pages_per_sec"] = result["pages"] / seconds if seconds else 0.0
+        result["rows_per_sec"] = result["rows"] / seconds if seconds else 0.0
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    # ru_maxrss is in KiB on Linux
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result_queue.put(result)
+
+
+def run(parsers, variants, docs, pages, items):
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for module_name in parsers:
+        for variant in variants:
+            q = ctx.Queue()
+            p = ctx.Process(target=_run_case, args=(module_name, variant, docs, pages, items, q))
+            p.start()
+            result = q.get()
+            p.join()
+            results.append(result)
+            _print_result(result)
+    return results
+
+
+def _print_result(r):
+    name = f"{r['parser']}/{r['variant']}"
+    if r["error"]:
+        print(f"{name:28} ERROR {r['error']}")
+        return
+    print(f"{name:28} {r['pages_per_sec']:8.1f} pages/s {r['rows_per_sec']:9.1f} rows/s "
+          f"{r['peak_rss_mb']:7.1f} MB  text/ocr pages {r['text_pages']}/{r['ocr_pages']} "
+          f"ocr {r['ocr_seconds']:.1f}s render {r['render_seconds']:.1f}s")
+
+
+# run parameters two reports must share to be compared
+COMPARED_META = ("docs", "pages", "items")
+
+
+def compare(results, baseline, threshold, meta):
+    # → list of regression messages (pages/sec dropped by more than threshold);
+    # ValueError if the baseline was run with other parameters
+    base_meta = baseline.get("meta", {})
+    differ = [f"{k} {base_meta.get(k)} → {meta.get(k)}" for k in COMPARED_META if base_meta.get(k) != meta.get(k)]
+    if differ:
+        raise ValueError(f"baseline was run with other parameters: {', '.join(differ)}")
+    old = {(r["parser"], r["variant"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        prev = old.get((r["parser"], r["variant"]))
+        if not prev or prev.get("error") or r["error"]:
+            continue
+        if r["pages_per_sec"] < prev["pages_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{r['parser']}/{r['variant']}: {prev['pages_per_sec']:.1f} → {r['pages_per_sec']:.1f} pages/s"
+            )
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-vendor parser throughput benchmark on synthetic invoices.")
+    ap.add_argument("--parsers", nargs="+", default=sorted(synth.LAYOUTS), choices=sorted(synth.LAYOUTS))
+    ap.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=VARIANTS)
+    ap.add_argument("--docs", type=int, default=20, help="documents per case")
+    ap.add_argument("--pages", type=int, default=3, help="pages per document")
+    ap.add_argument("--items", type=int, default=12, help="line items per page")
+    ap.add_argument("-o", "--output", help="write results as JSON")
+    ap.add_argument("--compare", help="previous results JSON to check for regressions")
+    ap.add_argument("--threshold", type=float, default=0.2,
+                    help="flag a regression when pages/sec drops by more than this fraction")
+    args = ap.parse_args(argv)
+
+    # empty caches with no budget, inherited by the spawned case processes
+    os.environ["PARSER_CACHE_DIR"] = tempfile.mkdtemp(prefix="invoice-bench-")
+    os.environ["PARSER_CACHE_MAX_MB"] = "0"
+    os.environ["OCR_CACHE_MAX_MB"] = "0"
+
+    results = run(args.parsers, args.variants, args.docs, args.pages, args.items)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "docs": args.docs, "pages": args.pages, "items": args.items,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        try:
+            regressions = compare(results, baseline, args.threshold, report["meta"])
+        except ValueError as e:
+            print(f"Cannot compare with {args.compare}: {e}", file=sys.stderr)
+            return 2
+        for msg in regressions:
+            print(f"REGRESSION {msg}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+CACHE_DIR = os.environ.get("PARSER_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "invoice-parser"
+)
+RESULT_CACHE_MAX_MB = int(os.environ.get("PARSER_CACHE_MAX_MB", "1024"))
+OCR_CACHE_MAX_MB = int(os.environ.get("OCR_CACHE_MAX_MB", "256"))
+
+
+class DiskCache:
+    # SQLite key/value store bounded by total value size; least recently
+    # used entries are evicted first. Safe to share between processes.
+    # Triggers keep the total size in meta, so a put does not sum the table.
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, tag TEXT, value BLOB,"
+                " size INTEGER, last_used REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+            # caches written before the total was kept start from a full sum
+            db.execute(
+                "INSERT OR IGNORE INTO meta SELECT 'total_size', COALESCE(SUM(size), 0) FROM entries"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN"
+                " UPDATE meta SET value = value + new.size WHERE key = 'total_size'; END"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN"
+                " UPDATE meta SET value = value - old.size + new.size WHERE key = 'total_size'; END"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN"
+                " UPDATE meta SET value = value - old.size WHERE key = 'total_size'; END"
+            )
+            db.execute("COMMIT")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key):
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, value, tag=""):
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            # an upsert, not INSERT OR REPLACE: the replaced row's size has to
+            # reach the update trigger
+            db.execute(
+                "INSERT INTO entries (key, tag, value, size, last_used) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET tag = excluded.tag, value = excluded.value,"
+                " size = excluded.size, last_used = excluded.last_used",
+                (key, tag, value, len(value), time.time()),
+            )
+            self._evict(db)
+            db.execute("COMMIT")
+
+    def total_size(self):
+        with closing(self._connect()) as db:
+            return _total_size(db)
+
+    def _evict(self, db):
+        total = _total_size(db)
+        if total <= self.max_bytes:
+            return
+        # drop oldest entries until we are back under 90% of the budget
+        excess = total - int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for key, size in db.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def clear(self, tag=None):
+        with closing(self._connect()) as db:
+            if tag is None:
+                cur = db.execute("DELETE FROM entries")
+            else:
+                cur = db.execute("DELETE FROM entries WHERE tag = ?", (tag,))
+            db.execute("VACUUM")
+            return cur.rowcount
+
+    def stats(self):
+        with closing(self._connect()) as db:
+            return db.execute(
+                "SELECT tag, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY tag ORDER BY tag"
+            ).fetchall()
+
+
+def _total_size(db):
+    return db.execute("SELECT value FROM meta WHERE key = 'total_size'").fetchone()[0]
+
+
+_result_cache = None
+_ocr_cache = None
+
+
+def result_cache():
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = DiskCache(
+            os.path.join(CACHE_DIR, "results.sqlite"), RESULT_CACHE_MAX_MB * 1024 * 1024
+        )
+    return _result_cache
+
+
+def ocr_cache():
+    global _ocr_cache
+    if _ocr_cache is None:
+        _ocr_cache = DiskCache(
+            os.path.join(CACHE_DIR, "ocr.sqlite"), OCR_CACHE_MAX_MB * 1024 * 1024
+        )
+    return _ocr_cache
+
+
+def pdf_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def result_key(digest, module_name):
+    # content address: same PDF bytes + same parser version → same rows.
+    # registry is imported here: loading it imports the parsers, which use
+    # this module through ocr
+    import registry
+
+    return f"{digest}:{module_name}:{registry.parser_version(module_name)}"
+
+
+def get_rows(key):
+    value = result_cache().get(key)
+    return None if value is None else json.loads(value)
+
+
+def put_rows(key, module_name, rows):
+    result_cache().put(key, json.dumps(rows, default=str).encode("utf-8"), tag=module_name)
+
+
+def _vendor_key(digest):
+    import classify
+    return f"{digest}:classify:{classify.CLASSIFIER_VERSION}"
+
+
+def get_vendor(digest):
+    # parser module an auto-detected PDF was routed to last time ("" = unknown)
+    value = result_cache().get(_vendor_key(digest))
+    return None if value is None else value.decode("utf-8")
+
+
+def put_vendor(digest, module_name):
+    result_cache().put(_vendor_key(digest), (module_name or "").encode("utf-8"), tag="classify")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Inspect or invalidate the parsed-PDF and OCR caches.")
+    ap.add_argument("--ocr", action="store_true", help="operate on the OCR text cache instead of parsed rows")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="show entry count and size per parser")
+    clear = sub.add_parser("clear", help="drop cached results")
+    clear.add_argument("--parser", help="only drop results of this parser module, e.g. parse_dale")
+    args = ap.parse_args(argv)
+
+    cache = ocr_cache() if args.ocr else result_cache()
+    if args.command == "stats":
+        for tag, count, size in cache.stats():
+            print(f"{tag:20} {count:8d} entries {size / 1e6:10.1f} MB")
+    else:
+        print(f"Removed {cache.clear(args.parser)} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import re
+
+import metrics
+import ocr
+import raster
+
+CLASSIFIER_VERSION = "1"
+HEADER_OCR_DPI = 100
+HEADER_REGION_FRAC = (0.0, 0.0, 1.0, 0.4)
+
+# parser module → (pattern, weight) fingerprints looked for on the first page.
+# Vendor names are decisive; invoice-number formats and table headers break
+# ties when the name is in a logo image.
+FINGERPRINTS = {
+    "parse_flinthills": [
+        (r"Flint\s*Hills\s*Resources", 10),
+        (r"TICKET\s+DATE\s+TIME", 2),
+        (r"PLEASE\s+REFERENCE\s+NOTE", 1),
+    ],
+    "parse_boyett": [
+        (r"Boyett\s*Petroleum", 10),
+        (r"Tax\s*and\s*Other\s*Charges\s*Summary", 2),
+        (r"Invoice\s*No\W*[:\-]?\s*\d{4}-\d+[A-Z]?\b", 1),
+    ],
+    "parse_dale": [
+        (r"Dale\s*Petroleum", 10),
+        (r"Invoice\s*No\W*:\s*IN-", 2),
+        (r"Product\s+Total", 1),
+    ],
+    "parse_marathon": [
+        (r"Marathon\s*Petroleum", 10),
+        (r"Ship\s*Date.*Price\s*USD", 2),
+        (r"Basis\s+Rate\s+Amount", 2),
+        (r"You\s*Owe", 1),
+    ],
+    "parse_bbenergy": [
+        (r"BB\s*Energy", 10),
+        (r"Date\s+Time\s+BOL", 2),
+        (r"Invoice\s+Terms", 1),
+    ],
+}
+
+def _compile_fingerprints():
+    # one alternation over every fingerprint so the header text is scanned once;
+    # group name → (parser module, weight)
+    groups = {}
+    parts = []
+    for module, prints in FINGERPRINTS.items():
+        for pattern, weight in prints:
+            name = f"g{len(groups)}"
+            groups[name] = (module, weight)
+            parts.append(f"(?P<{name}>{pattern})")
+    return re.compile("|".join(parts), re.IGNORECASE), groups
+
+
+FINGERPRINT_RX, _GROUPS = _compile_fingerprints()
+
+
+def classify_text(text):
+    # returns the best-scoring parser module, or None if nothing matched or
+    # two vendors tie
+    scores = {}
+    seen = set()
+    for m in FINGERPRINT_RX.finditer(text):
+        name = m.lastgroup
+        if name in seen:
+            continue
+        seen.add(name)
+        module, weight = _GROUPS[name]
+        scores[module] = scores.get(module, 0) + weight
+    if not scores:
+        return None
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+    if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+        return None
+    return ranked[0][0]
+
+
+def classify(pdf_bytes):
+    # Look only at the first page: its text layer, or for scans a low-DPI OCR
+    # of the top of the page. Far cheaper than a full parse.
+    with raster.open_pdf(pdf_bytes) as pdf:
+        if not pdf.pages:
+            return None
+        with metrics.stage("extract_text"):
+            page = pdf.pages[0]
+            text = page.extract_text() or ""
+            page.flush_cache()
+    if raster.needs_ocr(text):
+        for _, image in raster.render_pages(pdf_bytes, [0], HEADER_OCR_DPI):
+            w, h = image.size
+            x0f, y0f, x1f, y1f = HEADER_REGION_FRAC
+            header = image.crop((int(x0f * w), int(y0f * h), int(x1f * w), int(y1f * h)))
+            with metrics.stage("ocr"):
+                text = ocr.image_to_string(header, HEADER_OCR_DPI)
+    return classify_text(text)
@@ -0,0 +1,166 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import sys
+import time
+
+import dedup
+import engine
+import ingest
+import journal
+import metrics
+import output
+import pipeline
+import reconcile
+import registry
+import workqueue
+
+# exit codes
+EXIT_OK = 0
+EXIT_FILE_FAILURES = 1
+EXIT_USAGE = 2
+
+
+def vendor_arg(name):
+    try:
+        return registry.resolve_vendor(name)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def stage_limits_arg(text):
+    try:
+        return pipeline.parse_limits(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Parse invoice PDFs and ZIPs of PDFs without the Streamlit UI."
+    )
+    ap.add_argument("inputs", nargs="+", help="PDF/ZIP files, directories or glob patterns")
+    ap.add_argument("-o", "--output", required=True, help="output file (.csv, .parquet or .sqlite)")
+    ap.add_argument("--format", choices=["csv", "parquet", "sqlite"], help="default: from the output extension")
+    ap.add_argument("--vendor", default="auto", type=vendor_arg,
+                    help="vendor name or parser module; 'auto' detects per PDF (default)")
+    ap.add_argument("-r", "--recursive", action="store_true",
+                    help="descend into subdirectories and expand ** in patterns")
+    ap.add_argument("-w", "--workers", type=int, default=engine.DEFAULT_WORKERS)
+    ap.add_argument("--no-cache", action="store_true", help="ignore and do not fill the result cache")
+    ap.add_argument("--memory-mb", type=int, default=engine.MEMORY_MB,
+                    help="RSS budget; reading ahead pauses above it (default: PARSER_MEMORY_MB, 0 = none)")
+    ap.add_argument("--journal", help="checkpoint journal file; an interrupted run of the same inputs, "
+                                      "vendor and parsers with the same journal resumes where it stopped")
+    ap.add_argument("--no-dedup", action="store_true",
+                    help="parse every copy of identical or re-sent PDFs")
+    ap.add_argument("--no-reconcile", action="store_true",
+                    help="skip the cross-invoice total and duplicate checks")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--pipeline", action="store_true",
+                      help="run read/extract/render/OCR/parse as overlapping stages (see pipeline.py)")
+    mode.add_argument("--queue", help="coordinate: put the PDFs on this work queue and collect what "
+                                      "`workqueue.py worker` processes parse (see workqueue.py)")
+    ap.add_argument("--stage-limits", type=stage_limits_arg, default={},
+                    help="per-stage concurrency with --pipeline, e.g. ocr=8,render=2")
+    ap.add_argument("--metrics", help="write per-file stage timings and errors as JSON")
+    args = ap.parse_args(argv)
+    if args.stage_limits and not args.pipeline:
+        ap.error("--stage-limits only applies with --pipeline")
+
+    paths = ingest.expand_inputs(args.inputs, recursive=args.recursive)
+    if not paths:
+        print("No PDF or ZIP files found.", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.queue:
+        try:
+            runner = contextlib.nullcontext(workqueue.open_queue(args.queue))
+        except ValueError as e:
+            ap.error(str(e))
+    else:
+        runner = engine.start_engine(args.workers)
+
+    total = parsed = rows_out = 0
+    stats = None
+    failed = []
+    unrecognised = []
+    records = []
+    start = time.perf_counter()
+    jnl = None
+    if args.journal:
+        # keyed like the app's jobs; another run's journal starts over
+        job = journal.job_id(journal.inputs_digest(paths), args.vendor, registry.versions(args.vendor))
+        jnl = journal.open_job(os.path.abspath(args.journal), key=job)
+        jnl.start(source=" ".join(args.inputs), vendor=args.vendor, key=job)
+    writer = output.open_writer(args.output, args.format)
+    try:
+        with runner as executor:
+            # archives and files that cannot be read are reported as failed
+            # after the parse results
+            unreadable = []
+            pdfs = ingest.iter_paths(paths, errors=unreadable)
+            replay = set()  # inputs whose journaled result is replayed
+            if jnl is not None:
+                pdfs = jnl.remaining(pdfs, replay)
+            kwargs = {"use_cache": not args.no_cache}
+            backend = engine.parse_pdfs
+            if args.queue:
+                backend = workqueue.parse_pdfs
+            else:
+                kwargs["memory_mb"] = args.memory_mb
+            if args.pipeline:
+                limits = {**pipeline.default_limits(args.workers), **pipeline.ENV_LIMITS, **args.stage_limits}
+                stats = pipeline.PipelineStats(limits)
+                backend = pipeline.parse_pdfs
+                kwargs.update(limits=limits, stats=stats)
+            if args.no_dedup:
+                results = backend(executor, args.vendor, pdfs, **kwargs)
+            else:
+                results = dedup.parse_unique(executor, args.vendor, pdfs, parse_pdfs=backend, **kwargs)
+            results = itertools.chain(results, ingest.failed_inputs(unreadable))
+            if jnl is not None:
+                results = itertools.chain(jnl.track(results), jnl.results(fnames=replay))
+            if not args.no_reconcile:
+                results = reconcile.validate(results)
+            for fname, module, rows, err, m in results:
+                total += 1
+                records.append(metrics.file_row(fname, module, rows, err, m))
+                if rows:
+                    parsed += 1
+                    rows_out += len(rows)
+                    writer.write(rows)
+                    continue
+                if module is None and err is None:
+                    # no vendor's fingerprints matched: quarantined, as in the app
+                    unrecognised.append(fname)
+                    print(f"UNRECOGNISED {fname}", file=sys.stderr)
+                    continue
+                failed.append(fname)
+                print(f"FAILED {fname}: {err or 'no rows parsed'}", file=sys.stderr)
+    finally:
+        writer.close()
+    if jnl is not None:
+        jnl.finish()
+
+    if args.metrics:
+        with open(args.metrics, "w") as fh:
+            report = {"summary": metrics.summarize(records, time.perf_counter() - start), "files": records}
+            if stats is not None:
+                report["pipeline"] = stats.summary()
+            json.dump(report, fh, indent=2)
+
+    if stats is not None:
+        print(f"Stage occupancy: {stats.format()}", file=sys.stderr)
+    print(
+        f"Files: {total}  Parsed: {parsed}  Failed: {len(failed)}  Unrecognised: {len(unrecognised)}"
+        f"  Rows: {rows_out}  → {args.output}",
+        file=sys.stderr,
+    )
+    return EXIT_FILE_FAILURES if failed or unrecognised else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import Counter, deque
+
+import cache
+import engine
+
+# Pre-parse deduplication. Every PDF gets two keys: the SHA-256 of its bytes
+# and a content fingerprint that survives re-sends (new filename, new
+# metadata or document ID, re-saved by another tool). Only the first PDF
+# with a given key is parsed; later copies get its rows under their own
+# name.
+#
+# The fingerprint hashes, page by page, the normalized text layer, or for
+# pages without one the raw (still encoded) bytes of their image streams.
+# Both come straight from pdfium without rendering or decoding, about a
+# millisecond per file. Scans are matched on their exact image data rather
+# than a perceptual hash: two scans of different invoices from one template
+# can be perceptually near-identical, and merging them would drop an
+# invoice. A PDF with a page that has neither (vector drawings, a short
+# text layer) gets no fingerprint, and only exact copies of it are merged.
+
+MIN_TEXT_CHARS = 20  # fewer non-space chars: the page is treated as a scan
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(data):
+    # content fingerprint of a PDF, or None when pdfium cannot read it or a
+    # page has neither enough text nor an image to tell it apart
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+
+    try:
+        doc = pdfium.PdfDocument(data)
+    except Exception:
+        return None
+    h = hashlib.sha256()
+    try:
+        for page in doc:
+            textpage = page.get_textpage()
+            text = textpage.get_text_range()
+            textpage.close()
+            text = _SPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+            h.update(b"\x00page")
+            found = len(text.replace(" ", "")) >= MIN_TEXT_CHARS
+            if found:
+                h.update(b"T" + text.encode("utf-8"))
+            else:
+                for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,)):
+                    h.update(b"I" + hashlib.sha256(bytes(obj.get_data(decode_simple=False))).digest())
+                    found = True
+            page.close()
+            if not found:
+                return None
+    except Exception:
+        return None
+    finally:
+        doc.close()
+    return "fp:" + h.hexdigest()
+
+
+def parse_unique(executor, module_name, pdfs, use_cache=True, parse_pdfs=engine.parse_pdfs, **kwargs):
+    # engine.parse_pdfs() (or pipeline.parse_pdfs()) that parses one
+    # representative per group of identical or re-sent PDFs. Same arguments
+    # and results, in input order; a copy's result has the representative's
+    # rows with its own source_file, and metrics {"file", "cached": True,
+    # "duplicate_of"}. A representative's rows are held in memory until its
+    # copies read so far are out; a copy read after that gets them from the
+    # result cache, or is parsed itself if they are no longer there.
+    reps = {}  # sha256 / fingerprint → representative fname
+    order = deque()  # (fname, representative or None, sha256) in input order
+    copies = Counter()  # representative → copies in order not yet yielded
+    parsing = set()  # representatives whose result is not back yet
+    held = {}  # representative → (module, rows, err, sha256) while it has copies
+    released = {}  # representative → (module, sha256) of a cached result
+    lock = threading.Lock()  # pipeline.parse_pdfs() reads pdfs on its own thread
+
+    def available(rep):
+        if rep in parsing or rep in held:
+            return True
+        if rep not in released:
+            return False
+        module, digest = released.pop(rep)
+        rows = cache.get_rows(cache.result_key(digest, module))
+        if rows is None:
+            return False
+        held[rep] = (module, rows, None, digest)
+        return True
+
+    def unique():
+        for fname, data in pdfs:
+            digest = cache.pdf_digest(data)
+            keys = [digest]
+            rep = reps.get(digest)
+            if rep is None:
+                fp = fingerprint(data)
+                if fp is not None:
+                    keys.append(fp)
+                    rep = reps.get(fp)
+            with lock:
+                if rep is not None and available(rep):
+                    copies[rep] += 1
+                    order.append((fname, rep, digest))
+                    continue
+                for key in keys:
+                    reps[key] = fname
+                parsing.add(fname)
+                order.append((fname, None, digest))
+            yield fname, data
+
+    def release(rep, module, err, digest):
+        if use_cache and module and not err and digest:
+            released[rep] = (module, digest)
+
+    def remember(result):
+        fname, module, rows, err, m = result
+        digest = (m or {}).get("sha256")
+        with lock:
+            parsing.discard(fname)
+            if copies[fname]:
+                # a snapshot: reconcile flags the yielded rows in place
+                held[fname] = (module, [dict(r) for r in rows], err, digest)
+            else:
+                release(fname, module, err, digest)
+
+    def copy(fname, rep, digest):
+        with lock:
+            module, rows, err, rep_digest = held[rep]
+            copies[rep] -= 1
+            if not copies[rep]:
+                del copies[rep], held[rep]
+                release(rep, module, err, rep_digest)
+        rows = [dict(r, source_file=fname) for r in rows]
+        return fname, module, rows, err, {"file": fname, "cached": True, "duplicate_of": rep, "sha256": digest}
+
+    for result in parse_pdfs(executor, module_name, unique(), use_cache=use_cache, **kwargs):
+        while order[0][1] is not None:
+            yield copy(*order.popleft())
+        order.popleft()
+        remember(result)
+        yield result
+    while order:
+        yield copy(*order.popleft())
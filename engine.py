@@ -0,0 +1,312 @@
+import os
+import multiprocessing
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+
+import cache
+import classify
+import metrics
+import raster
+import registry
+
+DEFAULT_WORKERS = int(os.environ.get("PARSER_WORKERS") or os.cpu_count() or 1)
+# PARSER_PRELOAD_OCR=1 also imports the OCR libraries at worker start, for
+# batches that are mostly scans
+PRELOAD_OCR = os.environ.get("PARSER_PRELOAD_OCR", "") not in ("", "0")
+
+# Documents with at least SPLIT_MIN_PAGES pages whose parser is
+# PAGE_INDEPENDENT are parsed as PAGES_PER_TASK-page tasks on several workers
+SPLIT_MIN_PAGES = 50
+PAGES_PER_TASK = 25
+
+# Memory bounds. At most MAX_INFLIGHT PDFs are read ahead of the results
+# being consumed, so a slow consumer (writer, UI) holds back ingest instead
+# of the whole batch piling up in the executor queue. With a budget
+# (PARSER_MEMORY_MB, 0 = none) reading ahead also stops while this process's
+# RSS is over it or the PDFs in flight take more than half of it.
+MAX_INFLIGHT = int(os.environ.get("PARSER_MAX_INFLIGHT") or 0) or max(64, 4 * DEFAULT_WORKERS)
+MEMORY_MB = int(os.environ.get("PARSER_MEMORY_MB") or 0)
+# PARSER_WORKER_MAX_TASKS restarts a worker after that many tasks, returning
+# whatever its PDF/OCR libraries have kept hold of
+WORKER_MAX_TASKS = int(os.environ.get("PARSER_WORKER_MAX_TASKS") or 0)
+
+# parse() functions loaded once per worker process (module name → parse)
+_parsers = {}
+
+
+def _init_worker():
+    # import every vendor parser (compiling its spec) and the PDF libraries
+    # once, when the worker starts
+    for module_name in registry.VENDOR_PARSERS.values():
+        _parsers[module_name] = registry.load_parser(module_name).parse
+    raster.preload(PRELOAD_OCR)
+
+
+def _ready():
+    return os.getpid()
+
+
+def start_engine(workers=DEFAULT_WORKERS, warm=True, max_tasks_per_child=WORKER_MAX_TASKS):
+    # spawn, not fork: the Streamlit server is multi-threaded. warm starts
+    # the worker processes now, in the background, rather than on the first
+    # batch.
+    kwargs = {"max_tasks_per_child": max_tasks_per_child} if max_tasks_per_child else {}
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        **kwargs,
+    )
+    if warm:
+        for _ in range(workers):
+            executor.submit(_ready)
+    return executor
+
+
+class SharedEngine:
+    # The one process pool of a long-running server (the Streamlit app),
+    # sized on demand: asking for another size starts a new pool and shuts
+    # the previous one down (tasks already queued on it still finish)
+    # instead of leaving its worker processes behind.
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.workers = None
+        self.executor = None
+        self._lock = threading.Lock()
+
+    def get(self, workers):
+        with self._lock:
+            if self.executor is None or workers != self.workers:
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                self.executor = start_engine(workers, **self.kwargs)
+                self.workers = workers
+            return self.executor
+
+    def shutdown(self):
+        with self._lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+            self.executor = self.workers = None
+
+
+def parse_pdf(module_name, fname, data, pages=None):
+    # Runs inside a worker and returns (fname, module name, rows, error,
+    # metrics) with plain dicts so results pickle cheaply. module_name None
+    # means detect the vendor from the first page; PDFs no fingerprint matches
+    # come back with module name None and no rows (quarantined). error is
+    # "ExceptionType: message"; the full traceback is in metrics["traceback"].
+    # pages (0-based indices) parses only that range of the document.
+    metrics.begin(fname)
+    rows, err, tb = [], None, None
+    try:
+        if module_name is None:
+            module_name = classify.classify(data)
+        if module_name is not None:
+            f = BytesIO(data)
+            f.name = fname
+            if pages is None:
+                rows = _parsers[module_name](f) or []
+            else:
+                rows = _parsers[module_name](f, pages=pages) or []
+            for row in rows:
+                row['source_file'] = fname
+    except Exception as e:
+        rows, err, tb = [], f"{type(e).__name__}: {e}", traceback.format_exc()
+    m = metrics.end()
+    if tb:
+        m["traceback"] = tb
+    return fname, module_name, rows, err, m
+
+
+def detect_vendor(fname, data):
+    # classification alone, as a worker task; same result shape as parse_pdf
+    metrics.begin(fname)
+    module_name, err, tb = None, None, None
+    try:
+        module_name = classify.classify(data)
+    except Exception as e:
+        err, tb = f"{type(e).__name__}: {e}", traceback.format_exc()
+    m = metrics.end()
+    if tb:
+        m["traceback"] = tb
+    return fname, module_name, [], err, m
+
+
+def _merge_results(fname, module_name, parts):
+    # Reassemble page-range results in page order into one parse_pdf result.
+    # Like a whole-document parse, any failed range fails the file.
+    rows, err = [], None
+    m = {"file": fname, "seconds": 0.0, "stages": {}, "pages": [], "counts": {}, "tasks": len(parts)}
+    for _, _, part_rows, part_err, pm in parts:
+        rows.extend(part_rows)
+        if part_err and err is None:
+            err = part_err
+            m["traceback"] = pm.get("traceback")
+        m["seconds"] += pm["seconds"]
+        for key in ("stages", "counts"):
+            for name, v in pm[key].items():
+                m[key][name] = m[key].get(name, 0) + v
+        m["pages"].extend(pm["pages"])
+    return fname, module_name, [] if err else rows, err, m
+
+
+class _SplitTask:
+    # pending result of a document parsed as page-range tasks, optionally
+    # preceded by a vendor detection task (prefix)
+    def __init__(self, fname, module_name, futures, prefix=None):
+        self.fname, self.module_name, self.futures, self.prefix = fname, module_name, futures, prefix
+
+    def result(self):
+        parts = [f.result() for f in self.futures]
+        if self.prefix is not None:
+            parts.insert(0, self.prefix)
+        return _merge_results(self.fname, self.module_name, parts)
+
+
+class _Deferred:
+    # result of a task that is only submitted once another one finishes
+    def __init__(self, outer):
+        self.outer = outer
+
+    def result(self):
+        return self.outer.result().result()
+
+
+def _submit_split(executor, module_name, fname, data, n_pages, pages_per_task, prefix=None):
+    futures = [
+        executor.submit(parse_pdf, module_name, fname, data, range(first, min(first + pages_per_task, n_pages)))
+        for first in range(0, n_pages, pages_per_task)
+    ]
+    return _SplitTask(fname, module_name, futures, prefix)
+
+
+def _submit_detected(executor, fname, data, n_pages, pages_per_task):
+    # Large document of unknown vendor: detect it on a worker, then split it
+    # from the detection callback so later files are not held up waiting.
+    outer = Future()
+
+    def detected(fut):
+        try:
+            result = fut.result()
+            module = result[1]
+            if result[3] or module is None:
+                task = fut
+            elif registry.page_independent(module):
+                task = _submit_split(executor, module, fname, data, n_pages, pages_per_task, prefix=result)
+            else:
+                task = _SplitTask(fname, module, [executor.submit(parse_pdf, module, fname, data)], prefix=result)
+            outer.set_result(task)
+        except Exception as e:
+            outer.set_exception(e)
+
+    executor.submit(detect_vendor, fname, data).add_done_callback(detected)
+    return _Deferred(outer)
+
+
+def _submit(executor, module_name, fname, data, pages_per_task):
+    n_pages = 0
+    if module_name is None or registry.page_independent(module_name):
+        try:
+            n_pages = raster.page_count(data)
+        except Exception:
+            pass  # unreadable: let the worker report the error
+    if n_pages < SPLIT_MIN_PAGES:
+        return executor.submit(parse_pdf, module_name, fname, data)
+    if module_name is None:
+        return _submit_detected(executor, fname, data, n_pages, pages_per_task)
+    return _submit_split(executor, module_name, fname, data, n_pages, pages_per_task)
+
+
+def rss_mb():
+    # resident set size of this process in MB (peak RSS where /proc is missing)
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def over_budget(inflight_bytes, memory_mb):
+    # a submitted PDF is held twice: in the executor queue and in the worker
+    if not memory_mb:
+        return False
+    return inflight_bytes > memory_mb * 2**20 // 2 or rss_mb() > memory_mb
+
+
+def lookup_cached(module_name, fname, digest, use_cache=True):
+    # → (module name, rows) from the result cache. rows is None when these
+    # bytes were not parsed before (module name is then the vendor they were
+    # detected as, if known); (None, []) means seen before and quarantined.
+    if not digest or not use_cache:
+        return module_name, None
+    module = module_name
+    if module is None:
+        module = cache.get_vendor(digest)
+        if module == "":
+            return None, []
+    rows = cache.get_rows(cache.result_key(digest, module)) if module else None
+    for row in rows or ():
+        row['source_file'] = fname
+    return module, rows
+
+
+def store_result(module_name, digest, result, use_cache=True):
+    # cache a parse_pdf()-style result (unless it failed or use_cache is
+    # off) and tag it with the PDF's sha256
+    fname, module, rows, err, m = result
+    if use_cache and digest and err is None:
+        if module_name is None:
+            cache.put_vendor(digest, module)
+        if module:
+            cache.put_rows(cache.result_key(digest, module), module, rows)
+    if digest:
+        m["sha256"] = digest
+    return fname, module, rows, err, m
+
+
+def _finish(module_name, fname, digest, result, use_cache):
+    if isinstance(result, tuple):
+        return (fname,) + result + (None, {"file": fname, "cached": True, "sha256": digest})
+    return store_result(module_name, digest, result.result(), use_cache)
+
+
+def parse_pdfs(executor, module_name, pdfs, use_cache=True, pages_per_task=PAGES_PER_TASK,
+               max_inflight=MAX_INFLIGHT, memory_mb=MEMORY_MB):
+    # pdfs: iterable of (fname, pdf bytes), e.g. ingest.iter_zip_pdfs();
+    # module_name None routes every PDF to its detected vendor.
+    # Yields (fname, module name, rows, error, metrics) in input order; cache
+    # hits report metrics {"file", "cached": True}, and the metrics always
+    # carry the PDF's "sha256" (reconcile needs it). PDFs already in
+    # the result cache (same bytes, same parser version) never reach a worker;
+    # one PDF per task keeps workers balanced, and documents of
+    # page-independent parsers with SPLIT_MIN_PAGES or more pages are split
+    # into page ranges so one huge file does not set the wall-clock time.
+    # pdfs is only read max_inflight files (and memory_mb) ahead of the
+    # results taken from this generator.
+    pending = deque()
+    inflight_bytes = 0
+    for fname, data in pdfs:
+        while pending and (len(pending) >= max_inflight
+                           or over_budget(inflight_bytes + len(data), memory_mb)):
+            fname_, digest_, size, result = pending.popleft()
+            inflight_bytes -= size
+            yield _finish(module_name, fname_, digest_, result, use_cache)
+        digest = cache.pdf_digest(data)
+        module, rows = lookup_cached(module_name, fname, digest, use_cache)
+        if rows is not None:
+            pending.append((fname, digest, 0, (module, rows)))
+        else:
+            pending.append((fname, digest, len(data), _submit(executor, module, fname, data, pages_per_task)))
+            inflight_bytes += len(data)
+        del data
+
+    while pending:
+        fname, digest, _, result = pending.popleft()
+        yield _finish(module_name, fname, digest, result, use_cache)
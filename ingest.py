@@ -0,0 +1,104 @@
+import glob
+import os
+import posixpath
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO
+
+# nested ZIPs bigger than this are unpacked to a temporary file, not memory
+NESTED_ZIP_SPOOL_BYTES = 64 * 2**20
+
+
+def _is_junk(name):
+    # macOS resource-fork entries that zip tools add next to each file
+    return name.startswith("__MACOSX/") or posixpath.basename(name).startswith("._")
+
+
+def _failed(errors, name, e):
+    # record an input that could not be read, or raise without an errors list
+    if errors is None:
+        raise e
+    errors.append((name, f"{type(e).__name__}: {e}"))
+
+
+def iter_zip_pdfs(source, prefix="", errors=None):
+    # Walk every member of the archive, subfolders and nested ZIPs included, and
+    # yield (member path, pdf bytes), one PDF in memory at a time. `source` can
+    # be bytes or any seekable file object (e.g. a Streamlit UploadedFile).
+    # A nested ZIP or member that cannot be read is added to errors as
+    # (member path, "ExceptionType: message") and the walk goes on; without
+    # an errors list the exception is raised.
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    with zipfile.ZipFile(source) as z:
+        for info in z.infolist():
+            if info.is_dir() or _is_junk(info.filename):
+                continue
+            name = prefix + info.filename
+            if info.filename.lower().endswith(".zip"):
+                try:
+                    with z.open(info) as nested, tempfile.SpooledTemporaryFile(NESTED_ZIP_SPOOL_BYTES) as spool:
+                        shutil.copyfileobj(nested, spool)
+                        spool.seek(0)
+                        yield from iter_zip_pdfs(spool, prefix=name + "/", errors=errors)
+                except Exception as e:
+                    _failed(errors, name, e)
+            elif info.filename.lower().endswith(".pdf"):
+                try:
+                    data = z.read(info)
+                except Exception as e:
+                    _failed(errors, name, e)
+                    continue
+                yield name, data
+
+
+def failed_inputs(errors):
+    # parse_pdfs()-style failed results for an errors list; chained after
+    # the parse results, it is read once every input has been
+    for name, err in errors:
+        yield name, None, [], err, {"file": name}
+
+
+def expand_inputs(patterns, recursive=False):
+    # files, directories and glob patterns → sorted list of PDF/ZIP paths
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=recursive) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    paths.extend(os.path.join(root, f) for f in files)
+                    if not recursive:
+                        break
+            else:
+                paths.append(path)
+    return sorted(p for p in set(paths) if p.lower().endswith((".pdf", ".zip")))
+
+
+def iter_paths(paths, errors=None):
+    # yield (name, pdf bytes) for loose PDFs and for every PDF inside ZIPs;
+    # ZIP members are named "archive.zip/member/path.pdf". Archives and
+    # files that cannot be read go to errors, as in iter_zip_pdfs().
+    for path in paths:
+        if path.lower().endswith(".zip"):
+            try:
+                yield from iter_zip_pdfs(path, prefix=path + "/", errors=errors)
+            except Exception as e:
+                _failed(errors, path, e)
+            continue
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except OSError as e:
+            _failed(errors, path, e)
+            continue
+        yield path, data
+
+
+def iter_upload(data, filename="upload.pdf", errors=None):
+    # a single uploaded blob: a ZIP of PDFs or one PDF
+    if data[:4] == b"PK\x03\x04":
+        yield from iter_zip_pdfs(data, errors=errors)
+    else:
+        yield filename, data
@@ -0,0 +1,241 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+import cache
+
+JOURNAL_DIR = os.environ.get("PARSER_JOURNAL_DIR") or os.path.join(cache.CACHE_DIR, "jobs")
+# journals of finished jobs are deleted this many days after they finished
+KEEP_DAYS = float(os.environ.get("PARSER_JOURNAL_KEEP_DAYS") or 7)
+
+
+def file_status(module, rows, err):
+    if rows:
+        return "parsed"
+    if err:
+        return "failed"
+    return "unrecognised" if module is None else "no_rows"
+
+
+def upload_digest(fh, chunk_size=1 << 20):
+    # SHA-256 of a file object, read in chunks; leaves it rewound
+    h = hashlib.sha256()
+    fh.seek(0)
+    for chunk in iter(lambda: fh.read(chunk_size), b""):
+        h.update(chunk)
+    fh.seek(0)
+    return h.hexdigest()
+
+
+def inputs_digest(paths):
+    # the CLI's inputs: the same files, however their paths were given
+    return hashlib.sha256("\n".join(sorted(os.path.realpath(p) for p in paths)).encode()).hexdigest()
+
+
+def job_id(source_digest, module_name, versions=""):
+    # the same upload parsed for the same vendor by the same parser versions
+    # (registry.versions()) is the same job, so submitting it again resumes it
+    key = f"{source_digest}:{module_name or 'auto'}:{versions}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def job_path(job):
+    # job id or path of a journal file → path
+    if os.sep in job or job.endswith(".sqlite"):
+        return job
+    return os.path.join(JOURNAL_DIR, f"{job}.sqlite")
+
+
+def open_job(job, resume=True, key=None):
+    # the journal of a job id; a job that finished (or resume off) starts
+    # over, as does a journal file last used for another key (job id)
+    jnl = Journal(job_path(job))
+    meta = jnl.meta()
+    if not resume or meta.get("status") == "done" or (key is not None and meta.get("key") != key):
+        jnl.reset()
+    return jnl
+
+
+class Journal:
+    # Checkpoint journal of one batch job: every finished PDF is committed
+    # with its status, rows and metrics as soon as its result arrives. WAL
+    # mode lets other processes read finished results while the job runs.
+    # "failed" files are retried when the job is resumed; the rest are not.
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, fname TEXT UNIQUE, sha256 TEXT,"
+                " parser TEXT, status TEXT, error TEXT, n_rows INTEGER, rows TEXT,"
+                " metrics TEXT, finished REAL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def start(self, **meta):
+        # (re)open the job: set its metadata and mark it running
+        meta.setdefault("started", time.time())
+        with closing(self._connect()) as db:
+            db.execute("INSERT OR IGNORE INTO meta VALUES ('created', ?)", (json.dumps(time.time()),))
+            db.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                [(k, json.dumps(v)) for k, v in dict(meta, status="running", finished=None).items()],
+            )
+
+    def finish(self, status="done"):
+        with closing(self._connect()) as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                [("status", json.dumps(status)), ("finished", json.dumps(time.time()))],
+            )
+
+    def meta(self):
+        with closing(self._connect()) as db:
+            return {k: json.loads(v) for k, v in db.execute("SELECT key, value FROM meta")}
+
+    def record(self, fname, module, rows, err, m):
+        m = m or {}
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO files"
+                " (fname, sha256, parser, status, error, n_rows, rows, metrics, finished)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (fname, m.get("sha256"), module, file_status(module, rows, err), err, len(rows),
+                 json.dumps(rows, default=str), json.dumps(m, default=str), time.time()),
+            )
+
+    def track(self, results):
+        # pass parse_pdfs() results through, committing each one as it arrives
+        for result in results:
+            self.record(*result)
+            yield result
+
+    def completed(self):
+        # fname → sha256 of the files with a final result
+        with closing(self._connect()) as db:
+            return dict(db.execute("SELECT fname, sha256 FROM files WHERE status != 'failed'"))
+
+    def remaining(self, pdfs, replay):
+        # the (fname, pdf bytes) of pdfs the journal has no final result for
+        # (by name and content); the names of the others are added to replay
+        done = self.completed()
+        for fname, data in pdfs:
+            if fname in done and done[fname] == cache.pdf_digest(data):
+                replay.add(fname)
+            else:
+                yield fname, data
+
+    def results(self, include_failed=False, fnames=None):
+        # finished files as parse_pdfs-style tuples, in completion order;
+        # fnames limits them to those files
+        sql = "SELECT fname, parser, rows, error, sha256 FROM files"
+        if not include_failed:
+            sql += " WHERE status != 'failed'"
+        with closing(self._connect()) as db:
+            for fname, module, rows, err, sha in db.execute(sql + " ORDER BY seq"):
+                if fnames is not None and fname not in fnames:
+                    continue
+                m = {"file": fname, "cached": True, "resumed": True, "sha256": sha}
+                yield fname, module, json.loads(rows), err, m
+
+    def counts(self):
+        with closing(self._connect()) as db:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM files GROUP BY status"))
+            counts["rows"] = db.execute("SELECT COALESCE(SUM(n_rows), 0) FROM files").fetchone()[0]
+            return counts
+
+    def reset(self):
+        with closing(self._connect()) as db:
+            db.execute("DELETE FROM files")
+            db.execute("DELETE FROM meta")
+
+
+def list_jobs():
+    if not os.path.isdir(JOURNAL_DIR):
+        return []
+    jobs = []
+    for name in sorted(os.listdir(JOURNAL_DIR)):
+        if name.endswith(".sqlite"):
+            jnl = Journal(os.path.join(JOURNAL_DIR, name))
+            jobs.append((name[:-len(".sqlite")], jnl.meta(), jnl.counts()))
+    return jobs
+
+
+def remove(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def prune(keep_days=KEEP_DAYS):
+    # delete the journals of jobs that finished more than keep_days ago
+    # → their job ids; unfinished jobs are kept for resuming
+    cutoff = time.time() - keep_days * 86400
+    removed = []
+    for job, meta, _ in list_jobs():
+        if meta.get("status") == "done" and (meta.get("finished") or 0) < cutoff:
+            remove(job_path(job))
+            removed.append(job)
+    return removed
+
+
+def main(argv=None):
+    import output
+
+    ap = argparse.ArgumentParser(description="Inspect batch job journals, also while a job is running.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="journaled jobs with their progress")
+    status = sub.add_parser("status", help="per-file status of a job")
+    status.add_argument("job", help="job id or journal path")
+    rows = sub.add_parser("rows", help="rows of the files a job has finished so far")
+    rows.add_argument("job", help="job id or journal path")
+    rows.add_argument("-o", "--output", help=".csv or .parquet file (default: CSV on stdout)")
+    remove_job = sub.add_parser("remove", help="delete a job's journal")
+    remove_job.add_argument("job", help="job id or journal path")
+    prune_jobs = sub.add_parser("prune", help="delete the journals of jobs that finished a while ago")
+    prune_jobs.add_argument("--days", type=float, default=KEEP_DAYS,
+                            help="finished more than this many days ago (default: PARSER_JOURNAL_KEEP_DAYS, 7)")
+    args = ap.parse_args(argv)
+
+    if args.command == "list":
+        for job, meta, counts in list_jobs():
+            done = sum(v for k, v in counts.items() if k != "rows")
+            print(f"{job}  {meta.get('status', '?'):8} {meta.get('source', '')}  "
+                  f"{done} files, {counts['rows']} rows, {counts.get('failed', 0)} failed")
+        return 0
+    if args.command == "prune":
+        print(f"Removed {len(prune(args.days))} journals")
+        return 0
+    path = job_path(args.job)
+    if not os.path.exists(path):
+        print(f"No journal at {path}", file=sys.stderr)
+        return 2
+    if args.command == "remove":
+        remove(path)
+        return 0
+    jnl = Journal(path)
+    if args.command == "status":
+        print(json.dumps({"meta": jnl.meta(), "counts": jnl.counts()}, indent=2))
+        for fname, module, rows, err, _ in jnl.results(include_failed=True):
+            print(f"{file_status(module, rows, err):12} {len(rows):5d}  {fname}  {err or ''}")
+        return 0
+    writer = output.open_writer(args.output) if args.output else output.CsvRowWriter(sys.stdout)
+    with writer:
+        for _, _, rows, _, _ in jnl.results():
+            writer.write(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# Word-level page layout. Every word is stored with its box: from
+# pdfplumber's text map for text pages, or from Tesseract's word boxes for
+# OCR'd pages. Each page is extracted once, and the words are indexed on a
+# coarse grid. Region lookups such as "text in this box" or a header corner
+# then filter that index instead of re-running pdfplumber's char clustering
+# on a crop.
+
+GRID_CELLS = 8  # grid cells per page side
+
+
+class PageLayout:
+    def __init__(self, words, size, text):
+        # words: [(text, x0, top, x1, bottom, line_no)] in reading order;
+        # size: (width, height) in the words' units (points or pixels)
+        self.words = words
+        self.size = size
+        self.text = text
+        self._grid = None
+
+    @classmethod
+    def from_page(cls, page):
+        # one clustering pass: .text is exactly page.extract_text()
+        textmap = page.get_textmap()
+        words = []
+        line_no = 0
+        cur = None
+        for ch, obj in textmap.tuples:
+            if obj is None or ch.isspace():
+                if cur is not None:
+                    words.append(tuple(cur))
+                    cur = None
+                if ch == "\n":
+                    line_no += 1
+                continue
+            if cur is None:
+                cur = [ch, obj["x0"], obj["top"], obj["x1"], obj["bottom"], line_no]
+            else:
+                cur[0] += ch
+                cur[1] = min(cur[1], obj["x0"])
+                cur[2] = min(cur[2], obj["top"])
+                cur[3] = max(cur[3], obj["x1"])
+                cur[4] = max(cur[4], obj["bottom"])
+        if cur is not None:
+            words.append(tuple(cur))
+        return cls(words, (page.width, page.height), textmap.as_string)
+
+    @classmethod
+    def from_ocr(cls, result):
+        # result: ocr.image_to_data() output, coordinates in pixels
+        words = [(text, x0, top, x1, bottom, line_no)
+                 for text, _, x0, top, x1, bottom, line_no in result["words"]]
+        return cls(words, tuple(result["size"]), result["text"])
+
+    def _index(self):
+        # grid cell → indices of the words whose centre falls in it
+        w, h = self.size
+        cw, ch = max(w, 1) / GRID_CELLS, max(h, 1) / GRID_CELLS
+        grid = {}
+        for i, (_, x0, top, x1, bottom, _) in enumerate(self.words):
+            cell = (int((x0 + x1) / 2 // cw), int((top + bottom) / 2 // ch))
+            grid.setdefault(cell, []).append(i)
+        self._grid = (grid, cw, ch)
+        return self._grid
+
+    def words_in(self, bbox):
+        # words whose centre lies inside bbox (x0, top, x1, bottom), in
+        # reading order
+        grid, cw, ch = self._grid or self._index()
+        x0, y0, x1, y1 = bbox
+        hits = []
+        for cx in range(int(x0 // cw), int(x1 // cw) + 1):
+            for cy in range(int(y0 // ch), int(y1 // ch) + 1):
+                for i in grid.get((cx, cy), ()):
+                    _, wx0, wtop, wx1, wbottom, _ = self.words[i]
+                    mx, my = (wx0 + wx1) / 2, (wtop + wbottom) / 2
+                    if x0 <= mx <= x1 and y0 <= my <= y1:
+                        hits.append(i)
+        return [self.words[i] for i in sorted(hits)]
+
+    def lines_in(self, bbox):
+        # text of each line that has words inside bbox
+        lines = {}
+        for text, _, _, _, _, line_no in self.words_in(bbox):
+            lines.setdefault(line_no, []).append(text)
+        return [" ".join(lines[k]) for k in sorted(lines)]
+
+    def text_in(self, bbox):
+        return "\n".join(self.lines_in(bbox))
+
+    def region(self, region_frac):
+        # fractional (x0, y0, x1, y1) of the page → bbox in word units
+        w, h = self.size
+        x0f, y0f, x1f, y1f = region_frac
+        return x0f * w, y0f * h, x1f * w, y1f * h
+
+    def region_lines(self, region_frac):
+        return self.lines_in(self.region(region_frac))
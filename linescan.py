@@ -0,0 +1,385 @@
+import os
+import re
+from decimal import Decimal, InvalidOperation
+
+import raster
+
+# Declarative vendor layouts. Each parser module holds a SPEC dict naming its
+# header fields, line-item tables (start/end markers, skip patterns, amount
+# column) and invoice total labels; compile_spec() turns it into a Scanner
+# that walks every page's lines once, testing only the patterns the current
+# state needs.
+#
+# Patterns given as strings are case-insensitive; pass re.compile(...) for
+# other flags. A list of patterns for one role (skip lines, end markers) is
+# compiled into a single alternation. Group 1, when present, is the value.
+#
+# SPEC keys:
+#   vendor_name
+#   scope            "page" (every page is an invoice) or "document"
+#   amount           amount column at the end of a line (tables inherit it)
+#   fields           {name: {"pattern", "in", "pick", "fallback", "extract"}}
+#                      in: "text" (joined lines), "lines", "head" (first
+#                      head_lines lines) or "region" (header_region of the page)
+#                      pick: "first" or "last"; fallback: searched in the text
+#                      when nothing matched; extract: narrows the value
+#   head_lines       default 10
+#   header_region    (x0, y0, x1, y1) page fractions for "region" fields
+#   tables           [{"start", "end", "end_anywhere", "skip", "skip_desc",
+#                      "amount", "desc_skip_tokens", "desc_strip", "optional",
+#                      "keep_unparsed"}]
+#                      rows between the first start line and the next end line;
+#                      no start means from the first line. end_anywhere: an end
+#                      line before the start closes the table too.
+#                      keep_unparsed: an amount that does not parse is kept as
+#                      0.00 with an "unparsed_amount" issue on its row
+#   total            {"labels", "in", "pick", "amount_on", "fallback", "default"}
+#                      pick: "first", "last", "first_label" (stop at the first
+#                      label line even without an amount) or, in "text", "sum"
+#                      amount_on (labels without a group): "label", "next_line"
+#                      or "label_or_next_line"
+#                      fallback: "last_amount_covering_items" or "largest_item"
+#   ocr_keys         patterns that must be found or OCR is retried sharper
+#   ocr_regions      [{"box", "psm", "whitelist"}] page fractions OCR reads
+#                      (header, table area), each with its Tesseract page
+#                      segmentation mode and character whitelist; neighbouring
+#                      boxes overlap so no line is cut in two. Only used with
+#                      PARSER_OCR_REGIONS=1, otherwise whole pages are read
+#   ocr_dpi_steps, ascii_threshold
+#   issue_labels, issue_separator, check_issues   vendor wording of issues
+
+OCR_DPI_STEPS = (150, raster.PDF_DPI)
+# PARSER_OCR_REGIONS=1 OCRs scans by the parsers' ocr_regions instead of
+# whole pages (check a vendor's rows against full-page OCR first)
+OCR_REGIONS = os.environ.get("PARSER_OCR_REGIONS", "") not in ("", "0")
+TOLERANCE = Decimal("0.01")
+WAITING, ACTIVE, DONE = 0, 1, 2
+
+
+def _compile(patterns):
+    # str | compiled | list of them → one compiled regex (None stays None)
+    if patterns is None:
+        return None
+    if isinstance(patterns, (str, re.Pattern)):
+        patterns = [patterns]
+    if len(patterns) == 1:
+        p = patterns[0]
+        return re.compile(p, re.IGNORECASE) if isinstance(p, str) else p
+    parts = []
+    for p in patterns:
+        if isinstance(p, str):
+            parts.append(f"(?i:{p})")
+        else:
+            parts.append(f"(?{'i' if p.flags & re.IGNORECASE else '-i'}:{p.pattern})")
+    return re.compile("|".join(parts))
+
+
+def _value(m):
+    return m.group(1) if m.re.groups else m.group(0)
+
+
+def parse_amount(txt):
+    # "1,234.50", "(1,234.50)" and "1,234.50-" → Decimal; raises InvalidOperation
+    t = txt.replace(",", "").strip()
+    sign = 1
+    if t.startswith("(") and t.endswith(")"):
+        t, sign = t[1:-1], -1
+    elif t.endswith("-"):
+        t, sign = t[:-1], -1
+    return Decimal(t) * sign
+
+
+def _amount_or_none(m):
+    try:
+        return parse_amount(_value(m))
+    except InvalidOperation:
+        return None
+
+
+class Scanner:
+    def __init__(self, spec):
+        self.vendor_name = spec["vendor_name"]
+        self.per_page = spec.get("scope", "page") == "page"
+        self.amount = _compile(spec.get("amount"))
+        self.head_lines = spec.get("head_lines", 10)
+        self.header_region = spec.get("header_region")
+        self.ocr_keys = tuple(_compile(p) for p in spec.get("ocr_keys", ()))
+        self.ocr_dpi_steps = spec.get("ocr_dpi_steps", OCR_DPI_STEPS)
+        self.ocr_regions = spec.get("ocr_regions") if OCR_REGIONS else None
+        self.ascii_threshold = spec.get("ascii_threshold", raster.ASCII_RATIO_THRESHOLD)
+        self.issue_labels = spec.get("issue_labels", {})
+        self.issue_separator = spec.get("issue_separator", ";")
+        self.check_issues = spec.get("check_issues")
+
+        self.fields = []
+        for name, f in spec.get("fields", {}).items():
+            self.fields.append({
+                "name": name, "rx": _compile(f["pattern"]), "in": f.get("in", "lines"),
+                "pick": f.get("pick", "first"), "fallback": _compile(f.get("fallback")),
+                "extract": _compile(f.get("extract")),
+            })
+        self.line_fields = [f for f in self.fields if f["in"] in ("lines", "head")]
+
+        self.tables = []
+        for t in spec.get("tables", ()):
+            self.tables.append({
+                "start": _compile(t.get("start")), "end": _compile(t.get("end")),
+                "end_anywhere": t.get("end_anywhere", False), "skip": _compile(t.get("skip")),
+                "skip_desc": frozenset(t.get("skip_desc", ())),
+                "amount": _compile(t["amount"]) if "amount" in t else self.amount,
+                "desc_skip_tokens": t.get("desc_skip_tokens", 0), "desc_strip": t.get("desc_strip", ""),
+                "optional": t.get("optional", False), "keep_unparsed": t.get("keep_unparsed", False),
+            })
+
+        total = spec.get("total", {})
+        self.total_labels = [_compile(p) for p in total.get("labels", ())]
+        # one search tells whether any label is on the line at all
+        self.total_gate = _compile(total["labels"]) if total.get("labels") else None
+        self.total_in = total.get("in", "lines")
+        self.total_pick = total.get("pick", "first")
+        self.total_amount_on = total.get("amount_on", "label")
+        self.total_fallback = total.get("fallback")
+        self.total_default = Decimal(total["default"]) if "default" in total else None
+
+    def _line_total(self, ln, state):
+        # state: {"total", "done", "pending"}; labels with a group carry the
+        # amount, others point at the amount column on the line or the next
+        if state["pending"]:
+            state["pending"] = False
+            m = self.amount.search(ln)
+            if m:
+                state["total"] = _amount_or_none(m)
+                state["done"] = True
+            elif self.total_pick == "first_label":
+                state["done"] = True
+        if state["done"]:
+            return
+        for rx in self.total_labels:
+            m = rx.search(ln)
+            if not m:
+                continue
+            if rx.groups:
+                amt = _amount_or_none(m)
+                if amt is None:
+                    continue
+                state["total"] = amt
+                state["done"] = self.total_pick != "last"
+                return
+            if self.total_amount_on in ("label", "label_or_next_line"):
+                m = self.amount.search(ln)
+                if m:
+                    state["total"] = _amount_or_none(m)
+                    state["done"] = True
+                    return
+            if self.total_amount_on in ("next_line", "label_or_next_line"):
+                state["pending"] = True
+            elif self.total_pick == "first_label":
+                state["done"] = True
+            return
+
+    def scan(self, lines, line_dpis, region_lines=()):
+        # → {"fields", "total", "total_missing", "items": [(desc, amount, dpi)],
+        #    "unparsed": {item index: amount text}, "required_items"} for one
+        #    invoice's stripped, non-empty lines
+        text = "\n".join(lines)
+        values = {}
+        for f in self.fields:
+            if f["in"] == "text":
+                m = f["rx"].search(text)
+                if m:
+                    values[f["name"]] = _value(m).strip()
+            elif f["in"] == "region":
+                for ln in region_lines:
+                    m = f["rx"].search(ln)
+                    if m:
+                        values[f["name"]] = _value(m).strip()
+                        break
+
+        tables = self.tables
+        states = [WAITING if t["start"] is not None else ACTIVE for t in tables]
+        items = [[] for _ in tables]
+        unparsed = [{} for _ in tables]
+        total = {"total": None, "done": self.total_in != "lines" or self.total_gate is None, "pending": False}
+        total_gate = self.total_gate
+        line_fields = self.line_fields
+        head_lines = self.head_lines
+
+        for i, ln in enumerate(lines):
+            # fields still being looked for; found "first" fields drop out
+            if i == head_lines:
+                line_fields = [f for f in line_fields if f["in"] != "head"]
+            for f in line_fields:
+                m = f["rx"].search(ln)
+                if m:
+                    values[f["name"]] = _value(m).strip()
+                    if f["pick"] == "first":
+                        line_fields = [g for g in line_fields if g is not f]
+
+            if not total["done"] and (total["pending"] or total_gate.search(ln)):
+                self._line_total(ln, total)
+
+            for k, t in enumerate(tables):
+                state = states[k]
+                if state == DONE:
+                    continue
+                if state == WAITING:
+                    if t["end_anywhere"] and t["end"].search(ln):
+                        states[k] = DONE
+                    elif t["start"].search(ln):
+                        states[k] = ACTIVE
+                    continue
+                if t["end"] is not None and t["end"].search(ln):
+                    states[k] = DONE
+                    continue
+                if t["skip"] is not None and t["skip"].search(ln):
+                    continue
+                m = t["amount"].search(ln)
+                if not m:
+                    continue
+                desc = ln[:m.start()]
+                if t["desc_skip_tokens"]:
+                    desc = " ".join(desc.split()[t["desc_skip_tokens"]:])
+                else:
+                    desc = desc.strip()
+                desc = desc.rstrip(t["desc_strip"])
+                if desc in t["skip_desc"]:
+                    continue
+                amt = _amount_or_none(m)
+                if amt is None:
+                    if not t["keep_unparsed"]:
+                        continue
+                    unparsed[k][len(items[k])] = _value(m).strip()
+                    amt = Decimal("0")
+                items[k].append((desc, amt, line_dpis[i]))
+
+        for f in self.fields:
+            name = f["name"]
+            if not values.get(name) and f["fallback"] is not None:
+                m = f["fallback"].search(text)
+                values[name] = _value(m).strip() if m else ""
+            if values.get(name) and f["extract"] is not None:
+                m = f["extract"].search(values[name])
+                if m:
+                    values[name] = _value(m)
+
+        all_items, all_unparsed = [], {}
+        for table_items, table_unparsed in zip(items, unparsed):
+            all_unparsed.update((len(all_items) + j, txt) for j, txt in table_unparsed.items())
+            all_items.extend(table_items)
+        total_amt = total["total"] if self.total_in == "lines" else self._text_total(text)
+        if self.total_pick == "sum" and not total_amt:
+            total_amt = None
+        if total_amt is None and self.total_fallback:
+            total_amt = self._fallback_total(lines, all_items)
+        total_missing = total_amt is None
+        if total_missing:
+            total_amt = self.total_default
+        return {
+            "fields": values, "total": total_amt, "total_missing": total_missing, "items": all_items,
+            "unparsed": all_unparsed, "required_items": any(items[k] for k, t in enumerate(tables) if not t["optional"]),
+        }
+
+    def _text_total(self, text):
+        if self.total_pick == "sum":
+            return sum((_amount_or_none(m) or 0) for rx in self.total_labels for m in rx.finditer(text))
+        for rx in self.total_labels:
+            m = rx.search(text)
+            if m:
+                return _amount_or_none(m)
+        return None
+
+    def _fallback_total(self, lines, items):
+        item_sum = sum(amt for _, amt, _ in items)
+        if self.total_fallback == "last_amount_covering_items":
+            for ln in reversed(lines):
+                m = self.amount.search(ln)
+                if m:
+                    amt = _amount_or_none(m)
+                    if amt is not None and amt >= item_sum:
+                        return amt
+        elif self.total_fallback == "largest_item" and items:
+            candidates = [amt for _, amt, _ in items if abs(amt) >= abs(item_sum)]
+            if candidates:
+                return max(candidates, key=abs)
+        return None
+
+    def rows(self, invoice, source_name):
+        items = invoice["items"]
+        if not items:
+            return []
+        values, total = invoice["fields"], invoice["total"]
+        issues = [f"{f['name']}_missing" for f in self.fields if not values.get(f["name"])]
+        if not invoice["required_items"]:
+            issues.append("no_line_items")
+        if invoice["total_missing"]:
+            issues.append("total_missing")
+        mismatch = ["total_mismatch"] if total is not None and abs(sum(amt for _, amt, _ in items) - total) > TOLERANCE else []
+        unparsed = invoice.get("unparsed", {})
+
+        rows = []
+        for n, (desc, amt, dpi) in enumerate(items):
+            row_issues = issues + ["unparsed_amount"] * (n in unparsed) + mismatch
+            if self.check_issues is not None:
+                check = any(i in self.check_issues for i in row_issues)
+            else:
+                check = bool(row_issues)
+            # labels may show the unparsed amount text as {}
+            labels = [self.issue_labels.get(i, i).format(unparsed.get(n)) for i in row_issues]
+            rows.append({
+                "source_file": source_name,
+                "vendor_name": self.vendor_name,
+                "invoice_number": values.get("invoice_number", ""),
+                "invoice_date": values.get("invoice_date", ""),
+                "total_amount": f"{total:.2f}" if total is not None else "",
+                "line_item_description": desc,
+                "line_item_amount": f"{amt:.2f}",
+                "check_needed": "TRUE" if check else "FALSE",
+                "parsing_issues": self.issue_separator.join(labels),
+                "ocr_dpi": dpi,
+            })
+        return rows
+
+    def parse(self, f, pages=None):
+        # parse() for a parser module: open the PDF, read (or OCR) each page
+        # and scan its lines, per page or as one document
+        pdf_bytes = f.read()
+        source_name = os.path.basename(getattr(f, "name", "") or "")
+        with raster.open_pdf(pdf_bytes) as pdf:
+            pages = raster.iter_page_text(
+                pdf, pdf_bytes, self.ocr_dpi_steps, self.ascii_threshold, self.ocr_keys, pages=pages,
+                regions=self.ocr_regions)
+            return self.parse_pages(self._with_region(pages), source_name)
+
+    def _with_region(self, pages):
+        for pidx, page, layout, ocr_result in pages:
+            region = ()
+            if self.per_page and self.header_region:
+                region = raster.region_lines(page, layout, ocr_result, self.header_region, self.ascii_threshold)
+            yield pidx, layout, ocr_result["dpi"] if ocr_result else "", region
+
+    def parse_pages(self, pages, source_name):
+        # rows from pages already read: (page index, layout, OCR dpi or "",
+        # header_region lines) each, in page order. Every row carries the
+        # 1-based page its invoice starts on.
+        rows = []
+        doc_lines, doc_dpis, first = [], [], None
+        for pidx, layout, dpi, region in pages:
+            lines = [ln.strip() for ln in layout.text.splitlines() if ln.strip()]
+            if not self.per_page:
+                doc_lines.extend(lines)
+                doc_dpis.extend([dpi] * len(lines))
+                first = pidx if first is None else first
+                continue
+            page_rows = self.rows(self.scan(lines, [dpi] * len(lines), region), source_name)
+            for row in page_rows:
+                row["page"] = pidx + 1
+            rows.extend(page_rows)
+        if doc_lines:
+            rows = self.rows(self.scan(doc_lines, doc_dpis), source_name)
+            for row in rows:
+                row["page"] = first + 1
+        return rows
+
+
+def compile_spec(spec):
+    return Scanner(spec)
@@ -0,0 +1,89 @@
+import time
+from contextlib import contextmanager
+
+# Wall-time instrumentation for one file at a time per process (each worker
+# parses a single PDF at a time). Parsers and the raster/OCR layers wrap their
+# work in stage(); the engine calls begin()/end() around each file and ships
+# the resulting plain dict back with the rows.
+
+STAGES = ("open", "extract_text", "render", "ocr", "parse")
+
+_current = None
+
+
+def begin(fname):
+    global _current
+    _current = {
+        "file": fname, "start": time.perf_counter(),
+        "stages": dict.fromkeys(STAGES, 0.0), "pages": {},
+        "counts": {"pages": 0, "ocr_pages": 0, "ocr_escalations": 0},
+    }
+
+
+@contextmanager
+def stage(name, page=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _current is not None:
+            elapsed = time.perf_counter() - start
+            _current["stages"][name] = _current["stages"].get(name, 0.0) + elapsed
+            # page: one page index, or a list of them sharing the time equally
+            pages = page if isinstance(page, list) else [] if page is None else [page]
+            for p in pages:
+                page_stages = _current["pages"].setdefault(p, {})
+                page_stages[name] = page_stages.get(name, 0.0) + elapsed / len(pages)
+
+
+def count(name, n=1):
+    if _current is not None:
+        _current["counts"][name] = _current["counts"].get(name, 0) + n
+
+
+def end():
+    # → {"file", "seconds", "stages", "pages", "counts"}; whatever time no
+    # stage claimed is the parser's own regex / row building ("parse")
+    global _current
+    m, _current = _current, None
+    if m is None:
+        return None
+    m["seconds"] = time.perf_counter() - m.pop("start")
+    timed = sum(v for k, v in m["stages"].items() if k != "parse")
+    m["stages"]["parse"] += max(0.0, m["seconds"] - timed)
+    m["pages"] = [dict(page=p, **v) for p, v in sorted(m["pages"].items())]
+    return m
+
+
+def file_row(fname, module, rows, err, m):
+    # one flat record per file for tables and JSON export
+    m = m or {}
+    rec = {
+        "file": fname, "parser": module or "", "rows": len(rows), "error": err or "",
+        "cached": bool(m.get("cached")), "seconds": round(m.get("seconds", 0.0), 4),
+        "duplicate_of": m.get("duplicate_of", ""),
+    }
+    for name in STAGES:
+        rec[f"{name}_s"] = round(m.get("stages", {}).get(name, 0.0), 4)
+    for name, n in m.get("counts", {}).items():
+        rec[name] = n
+    return rec
+
+
+def summarize(records, wall_seconds=None):
+    # batch totals over file_row() records
+    summary = {
+        "files": len(records),
+        "failed": sum(1 for r in records if r["error"]),
+        "cached": sum(1 for r in records if r["cached"]),
+        "duplicates": sum(1 for r in records if r.get("duplicate_of")),
+        "rows": sum(r["rows"] for r in records),
+        "pages": sum(r.get("pages", 0) for r in records),
+        "ocr_pages": sum(r.get("ocr_pages", 0) for r in records),
+        "ocr_escalations": sum(r.get("ocr_escalations", 0) for r in records),
+        "worker_seconds": round(sum(r["seconds"] for r in records), 3),
+        "stage_seconds": {s: round(sum(r[f"{s}_s"] for r in records), 3) for s in STAGES},
+    }
+    if wall_seconds is not None:
+        summary["wall_seconds"] = round(wall_seconds, 3)
+    return summary
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import re
+
+import cache
+
+# Region OCR: instead of one default-config pass over the whole page, the
+# page is cleaned up (grayscale, deskew, binarize) and only the vendor's
+# regions are recognised, each with its own page-segmentation mode and
+# character whitelist. Amount tokens are then re-read together in one
+# digits-only pass.
+AMOUNT_WHITELIST = "0123456789.,$()-"
+AMOUNT_LIKE = re.compile(r"^[\dOoIlSB$(.,-]*\d[\dOoIlSB.,)-]*$")  # digits possibly misread as letters
+MAX_SKEW = 3.0  # degrees searched either way when deskewing
+SKEW_STEP = 0.25
+
+_tesseract_version = None
+
+
+def _engine_version():
+    # part of the cache key: a Tesseract upgrade can change recognised text
+    global _tesseract_version
+    if _tesseract_version is None:
+        import pytesseract
+        _tesseract_version = str(pytesseract.get_tesseract_version())
+    return _tesseract_version
+
+
+def image_key(image, dpi, config=""):
+    h = hashlib.sha256()
+    h.update(f"{_engine_version()}|{dpi}|{config}|{image.mode}|{image.size}|".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def image_to_string(image, dpi, config=""):
+    # pytesseract.image_to_string backed by the on-disk OCR cache; identical
+    # rendered pages (re-sent invoices, re-runs) are recognised only once
+    key = image_key(image, dpi, config)
+    hit = cache.ocr_cache().get(key)
+    if hit is not None:
+        return json.loads(hit)["text"]
+
+    import pytesseract
+    text = pytesseract.image_to_string(image, config=config)
+    cache.ocr_cache().put(key, json.dumps({"text": text}).encode("utf-8"), tag="text")
+    return text
+
+
+def image_to_data(image, dpi, config=""):
+    # Recognise a page and return {"text", "confidence", "words", "size"}.
+    # words are [text, conf, x0, top, x1, bottom, line_no] in image pixels;
+    # confidence is the mean word confidence (0-100). Cached like
+    # image_to_string.
+    key = image_key(image, dpi, "data|" + config)
+    hit = cache.ocr_cache().get(key)
+    if hit is not None:
+        return json.loads(hit)
+
+    import pytesseract
+    data = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+    result = _from_tesseract_data(data, image.size)
+    cache.ocr_cache().put(key, json.dumps(result).encode("utf-8"), tag="words")
+    return result
+
+
+def images_to_data(images, dpi, config=""):
+    # image_to_data() for many images with a single Tesseract process: the
+    # images missing from the cache are written out and passed as one list
+    # file, so the engine and language model are loaded once per batch
+    # instead of once per image. Results are in input order.
+    results = [None] * len(images)
+    misses = []
+    for i, image in enumerate(images):
+        key = image_key(image, dpi, "data|" + config)
+        hit = cache.ocr_cache().get(key)
+        if hit is not None:
+            results[i] = json.loads(hit)
+        else:
+            misses.append((i, key))
+    if misses:
+        pages = _tesseract_batch([images[i] for i, _ in misses], config)
+        for n, (i, key) in enumerate(misses):
+            result = _from_tesseract_data(pages.get(n + 1, _EMPTY_DATA), images[i].size)
+            cache.ocr_cache().put(key, json.dumps(result).encode("utf-8"), tag="words")
+            results[i] = result
+    return results
+
+
+_TSV_INT = ("level", "page_num", "block_num", "par_num", "line_num", "word_num", "left", "top", "width", "height")
+_EMPTY_DATA = {k: [] for k in _TSV_INT + ("conf", "text")}
+
+
+def _tesseract_batch(images, config=""):
+    # run `tesseract <list file> <out> [config] tsv` → {page_num: data dict
+    # in pytesseract's Output.DICT layout}; page_num is the 1-based position
+    # in the list
+    import csv
+    import shlex
+    import subprocess
+    import tempfile
+
+    import pytesseract
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = []
+        for n, image in enumerate(images):
+            path = os.path.join(tmpdir, f"{n:05d}.png")
+            image.save(path)
+            paths.append(path)
+        list_path = os.path.join(tmpdir, "images.txt")
+        with open(list_path, "w") as fh:
+            fh.write("\n".join(paths) + "\n")
+        out_base = os.path.join(tmpdir, "out")
+        cmd = [pytesseract.pytesseract.tesseract_cmd, list_path, out_base, *shlex.split(config), "tsv"]
+        proc = subprocess.run(cmd, capture_output=True)
+        if proc.returncode:
+            raise pytesseract.TesseractError(proc.returncode, proc.stderr.decode("utf-8", "replace").strip())
+        pages = {}
+        with open(out_base + ".tsv", encoding="utf-8", newline="") as fh:
+            reader = csv.reader(fh, delimiter="\t", quoting=csv.QUOTE_NONE)
+            next(reader, None)
+            for rec in reader:
+                if len(rec) < 11:
+                    continue
+                data = pages.setdefault(int(rec[1]), {k: [] for k in _EMPTY_DATA})
+                for k, v in zip(_TSV_INT, rec):
+                    data[k].append(int(v))
+                data["conf"].append(float(rec[10]))
+                data["text"].append(rec[11] if len(rec) > 11 else "")
+    return pages
+
+
+def _from_tesseract_data(data, size):
+    words = []
+    lines = []
+    line_keys = {}
+    for i, text in enumerate(data["text"]):
+        text = (text or "").strip()
+        conf = float(data["conf"][i])
+        if not text or conf < 0:
+            continue
+        line_key = (data["page_num"][i], data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if line_key not in line_keys:
+            line_keys[line_key] = len(lines)
+            lines.append([])
+        line_no = line_keys[line_key]
+        lines[line_no].append(text)
+        left, top = data["left"][i], data["top"][i]
+        words.append([text, conf, left, top, left + data["width"][i], top + data["height"][i], line_no])
+    confidence = sum(w[1] for w in words) / len(words) if words else 0.0
+    return {
+        "text": "\n".join(" ".join(ln) for ln in lines),
+        "confidence": confidence,
+        "words": words,
+        "size": list(size),
+    }
+
+
+def tesseract_config(psm=None, whitelist=None):
+    parts = []
+    if psm is not None:
+        parts.append(f"--psm {psm}")
+    if whitelist:
+        parts.append(f"-c tessedit_char_whitelist={whitelist}")
+    return " ".join(parts)
+
+
+def _otsu(image):
+    # global threshold that best separates ink from paper (Otsu's method)
+    hist = image.histogram()[:256]
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    best, threshold, w_bg, sum_bg = 0.0, 127, 0, 0
+    for t, h in enumerate(hist):
+        w_bg += h
+        if w_bg == 0 or w_bg == total:
+            continue
+        sum_bg += t * h
+        w_fg = total - w_bg
+        diff = sum_bg / w_bg - (sum_all - sum_bg) / w_fg
+        between = w_bg * w_fg * diff * diff
+        if between > best:
+            best, threshold = between, t
+    return threshold
+
+
+def skew_angle(image):
+    # Rotation (degrees, PIL's counter-clockwise) that makes text lines
+    # horizontal: the angle whose row profile of ink is the most peaked,
+    # searched on a thumbnail.
+    import numpy as np
+    from PIL import Image
+
+    small = image.convert("L")
+    small.thumbnail((800, 800))
+    t = _otsu(small)
+    ink = small.point([255 if p <= t else 0 for p in range(256)])
+    best, best_score = 0.0, -1.0
+    steps = int(MAX_SKEW / SKEW_STEP)
+    for k in range(-steps, steps + 1):
+        angle = k * SKEW_STEP
+        rows = np.asarray(ink.rotate(angle, resample=Image.NEAREST), dtype=np.float32).sum(axis=1)
+        score = float(np.square(np.diff(rows)).sum())
+        if score > best_score:
+            best, best_score = angle, score
+    return best
+
+
+def preprocess(image, deskew=True):
+    # grayscale → deskew → binarize (black text on white, a 1-bit image)
+    from PIL import Image
+
+    img = image.convert("L")
+    if deskew:
+        angle = skew_angle(img)
+        if angle:
+            img = img.rotate(angle, resample=Image.BILINEAR, fillcolor=255)
+    t = _otsu(img)
+    return img.point([255 if p > t else 0 for p in range(256)], "1")
+
+
+def _group_lines(words):
+    # [text, conf, x0, top, x1, bottom] in page pixels → the same words with
+    # a line number appended, in reading order: words whose vertical centres
+    # are within half a word height are on one line
+    lines = []
+    for w in sorted(words, key=lambda w: (w[3] + w[5]) / 2):
+        cy, h = (w[3] + w[5]) / 2, w[5] - w[3]
+        if lines and abs(cy - lines[-1]["cy"]) <= max(h, lines[-1]["h"]) / 2:
+            line = lines[-1]
+            line["words"].append(w)
+            line["cy"] += (cy - line["cy"]) / len(line["words"])
+        else:
+            lines.append({"cy": cy, "h": h, "words": [w]})
+    out = []
+    for line_no, line in enumerate(lines):
+        out.extend(list(w) + [line_no] for w in sorted(line["words"], key=lambda w: w[2]))
+    return out
+
+
+def _result(words, size):
+    lines = {}
+    for w in words:
+        lines.setdefault(w[6], []).append(w[0])
+    return {
+        "text": "\n".join(" ".join(lines[k]) for k in sorted(lines)),
+        "confidence": sum(w[1] for w in words) / len(words) if words else 0.0,
+        "words": words,
+        "size": list(size),
+    }
+
+
+def regions_to_data(pages, dpi, regions):
+    # images_to_data() over preprocessed pages, reading only `regions`:
+    # [{"box": (x0, y0, x1, y1) page fractions, "psm", "whitelist"}]. Words
+    # are mapped back to page pixels and regrouped into lines across
+    # regions; where regions overlap the earlier one wins. One Tesseract run
+    # per region for all pages, plus one for the amount re-read.
+    page_words = [[] for _ in pages]
+    page_boxes = [[] for _ in pages]
+    for region in regions:
+        x0f, y0f, x1f, y1f = region["box"]
+        boxes = [(int(x0f * w), int(y0f * h), int(x1f * w), int(y1f * h)) for w, h in (p.size for p in pages)]
+        config = tesseract_config(region.get("psm"), region.get("whitelist"))
+        parts = images_to_data([p.crop(box) for p, box in zip(pages, boxes)], dpi, config)
+        for words, seen, box, part in zip(page_words, page_boxes, boxes, parts):
+            for text, conf, wx0, wtop, wx1, wbottom, _ in part["words"]:
+                x0, top, x1, bottom = wx0 + box[0], wtop + box[1], wx1 + box[0], wbottom + box[1]
+                cx, cy = (x0 + x1) / 2, (top + bottom) / 2
+                if any(b[0] <= cx <= b[2] and b[1] <= cy <= b[3] for b in seen):
+                    continue
+                words.append([text, conf, x0, top, x1, bottom])
+            seen.append(box)
+    page_words = [_group_lines(words) for words in page_words]
+    _reread_amounts(pages, dpi, page_words)
+    return [_result(words, page.size) for page, words in zip(pages, page_words)]
+
+
+def _amount_strip(page, words, pad=4, gap=12):
+    # The last word of each line that looks like an amount, cropped and
+    # stacked into one strip image → (strip, [(word index, y range)]), or
+    # None when the page has no such word
+    from PIL import Image
+
+    last = {}
+    for i, w in enumerate(words):
+        last[w[6]] = i
+    picks = [i for i in last.values() if AMOUNT_LIKE.match(words[i][0])]
+    if not picks:
+        return None
+    crops = [page.crop((words[i][2] - pad, words[i][3] - pad, words[i][4] + pad, words[i][5] + pad)) for i in picks]
+    strip = Image.new("L", (max(c.width for c in crops) + 2 * gap, sum(c.height + gap for c in crops) + gap), 255)
+    slots, y = [], gap
+    for i, crop in zip(picks, crops):
+        strip.paste(crop, (gap, y))
+        slots.append((i, y - gap / 2, y + crop.height + gap / 2))
+        y += crop.height + gap
+    return strip, slots
+
+
+def _reread_amounts(pages, dpi, page_words):
+    # amount-like words read again with a digits-and-punctuation whitelist;
+    # a word is replaced when exactly one token with a digit is read back
+    strips = [(k, _amount_strip(page, words)) for k, (page, words) in enumerate(zip(pages, page_words))]
+    strips = [(k, s) for k, s in strips if s is not None]
+    if not strips:
+        return
+    datas = images_to_data([strip for _, (strip, _) in strips], dpi, tesseract_config(6, AMOUNT_WHITELIST))
+    for (k, (_, slots)), data in zip(strips, datas):
+        reread = {}
+        for text, conf, _, top, _, bottom, _ in data["words"]:
+            cy = (top + bottom) / 2
+            for i, s_top, s_bottom in slots:
+                if s_top <= cy <= s_bottom:
+                    reread.setdefault(i, []).append((text, conf))
+        words = page_words[k]
+        for i, got in reread.items():
+            if len(got) == 1 and any(ch.isdigit() for ch in got[0][0]):
+                words[i][0], words[i][1] = got[0][0], max(words[i][1], got[0][1])
@@ -0,0 +1,191 @@
+import csv
+import os
+from decimal import Decimal, InvalidOperation
+
+# Fixed output schema: column → type. Parser rows carry strings (amounts as
+# "1050.00", check_needed as "TRUE"/"FALSE"); they are coerced to it, so
+# total_amount is a float and check_needed a real boolean.
+SCHEMA = {
+    "source_file":           "string",
+    "vendor_name":           "string",
+    "invoice_number":        "string",
+    "invoice_date":          "string",
+    "total_amount":          "float64",
+    "line_item_description": "string",
+    "line_item_amount":      "float64",
+    "check_needed":          "bool",
+    "parsing_issues":        "string",
+    "ocr_dpi":               "int32",
+}
+COLUMNS = list(SCHEMA)
+# columns results are filtered on; SqliteRowWriter indexes them
+INDEXED_COLUMNS = ("invoice_number", "source_file", "vendor_name", "check_needed")
+DEFAULT_BATCH_ROWS = 10000
+
+
+def _to_float(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+    txt = str(value).replace(",", "").replace("$", "").strip()
+    try:
+        return float(Decimal(txt))
+    except InvalidOperation:
+        return None
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None or value == "":
+        return None
+    return str(value).strip().upper() in ("TRUE", "1", "YES")
+
+
+def _to_int(value):
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def normalize_row(row):
+    # coerce a parser row to SCHEMA
+    out = {}
+    for col, kind in SCHEMA.items():
+        value = row.get(col)
+        if kind == "float64":
+            out[col] = _to_float(value)
+        elif kind == "bool":
+            out[col] = _to_bool(value)
+        elif kind == "int32":
+            out[col] = _to_int(value)
+        else:
+            out[col] = "" if value is None else str(value)
+    return out
+
+
+def _csv_value(kind, value):
+    if value is None:
+        return ""
+    if kind == "float64":
+        return f"{value:.2f}"
+    if kind == "bool":
+        return "TRUE" if value else "FALSE"
+    return value
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    types = {"string": pa.string(), "float64": pa.float64(), "bool": pa.bool_(), "int32": pa.int32()}
+    return pa.schema([(col, types[kind]) for col, kind in SCHEMA.items()])
+
+
+class _BatchWriter:
+    # buffers up to batch_rows normalised rows, then hands them to _write_batch
+
+    def __init__(self, batch_rows=DEFAULT_BATCH_ROWS):
+        self._batch_rows = batch_rows
+        self._buffer = []
+        self.rows_written = 0
+
+    def write(self, rows):
+        self._buffer.extend(normalize_row(r) for r in rows)
+        if len(self._buffer) >= self._batch_rows:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvRowWriter(_BatchWriter):
+    # CSV in SCHEMA column order, written batch by batch.
+    # target is a path or an open text file (left open on close())
+
+    def __init__(self, target, batch_rows=DEFAULT_BATCH_ROWS):
+        super().__init__(batch_rows)
+        if isinstance(target, str):
+            self._fh = open(target, "w", newline="", encoding="utf-8")
+        else:
+            self._fh = None
+        self._writer = csv.DictWriter(self._fh or target, fieldnames=COLUMNS)
+        self._writer.writeheader()
+
+    def _write_batch(self, rows):
+        self._writer.writerows({c: _csv_value(SCHEMA[c], v) for c, v in r.items()} for r in rows)
+
+    def _close(self):
+        if self._fh is not None:
+            self._fh.close()
+
+
+class ParquetRowWriter(_BatchWriter):
+    # typed Parquet (arrow_schema()); every batch becomes one row group
+
+    def __init__(self, path, batch_rows=DEFAULT_BATCH_ROWS):
+        super().__init__(batch_rows)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = arrow_schema()
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def _write_batch(self, rows):
+        columns = {c: [r[c] for r in rows] for c in COLUMNS}
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+
+    def _close(self):
+        self._writer.close()
+
+
+class SqliteRowWriter(_BatchWriter):
+    # SQLite table "rows" in SCHEMA order (results.py reads it a page at a
+    # time); bools are stored as 0/1. The lookup indexes are built once, on
+    # close(), rather than maintained through every insert.
+
+    def __init__(self, path, batch_rows=DEFAULT_BATCH_ROWS):
+        super().__init__(batch_rows)
+        import sqlite3
+
+        types = {"string": "TEXT", "float64": "REAL", "bool": "INTEGER", "int32": "INTEGER"}
+        self._db = sqlite3.connect(path)
+        self._db.execute("DROP TABLE IF EXISTS rows")
+        self._db.execute(
+            "CREATE TABLE rows (" + ", ".join(f"{c} {types[k]}" for c, k in SCHEMA.items()) + ")"
+        )
+        self._insert = f"INSERT INTO rows VALUES ({', '.join('?' * len(COLUMNS))})"
+
+    def _write_batch(self, rows):
+        with self._db:
+            self._db.executemany(self._insert, [[r[c] for c in COLUMNS] for r in rows])
+
+    def _close(self):
+        with self._db:
+            for col in INDEXED_COLUMNS:
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS rows_{col} ON rows ({col})")
+        self._db.close()
+
+
+def open_writer(path, fmt=None, batch_rows=DEFAULT_BATCH_ROWS):
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    fmt = fmt or {"parquet": "parquet", "sqlite": "sqlite", "db": "sqlite"}.get(ext, "csv")
+    if fmt == "parquet":
+        return ParquetRowWriter(path, batch_rows)
+    if fmt == "sqlite":
+        return SqliteRowWriter(path, batch_rows)
+    return CsvRowWriter(path, batch_rows)
@@ -0,0 +1,415 @@
+import asyncio
+import os
+import queue
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import cache
+import classify
+import engine
+import metrics
+import ocr
+import raster
+import registry
+from layout import PageLayout
+
+# Staged alternative to engine.parse_pdfs(). Every PDF moves through
+#   read → extract → (render → ocr, once per DPI step) → parse
+# and the stages are connected by bounded asyncio queues, each stage with its
+# own concurrency limit. Reading the ZIP, poppler and Tesseract (external
+# processes, driven from threads) and the Python work (text layer, vendor
+# detection and the regex scan, on the worker processes) then overlap instead
+# of running one after another inside each file's parse.
+#
+# A PDF whose pages all have a text layer is finished by its extract task.
+# Scanned pages go through render and OCR raster.OCR_BATCH_PAGES pages per
+# item, so the pages of one large scan are rendered and recognised in
+# parallel. The DPI ladder, key patterns and region fallback work as in
+# raster.iter_page_text(). Parsers without a SPEC are parsed whole by the
+# extract stage.
+
+STAGES = ("read", "extract", "render", "ocr", "parse")
+QUEUE_PER_WORKER = 2  # items a stage's queue holds per worker before upstream waits
+
+
+def default_limits(workers=engine.DEFAULT_WORKERS):
+    # reading is one sequential pass over the inputs; the process stages
+    # share the engine's workers, the tool stages run in threads
+    return {"read": 1, "extract": workers, "render": max(1, workers // 2), "ocr": workers,
+            "parse": max(1, workers // 2)}
+
+
+def parse_limits(text):
+    # "ocr=8,render=2" → {"ocr": 8, "render": 2}
+    limits = {}
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        stage, _, n = part.partition("=")
+        stage = stage.strip()
+        if stage not in STAGES or stage == "read":
+            raise ValueError(f"unknown stage {stage!r}; choose from {', '.join(STAGES[1:])}")
+        limits[stage] = max(1, int(n))
+    return limits
+
+
+# PARSER_STAGE_LIMITS="ocr=8,render=2" overrides the defaults
+ENV_LIMITS = parse_limits(os.environ.get("PARSER_STAGE_LIMITS"))
+LIMITS = {**default_limits(), **ENV_LIMITS}
+
+
+class PipelineStats:
+    # per stage: concurrency limit, items handled, busy seconds (summed over
+    # its workers) and the deepest its input queue got; occupancy is busy
+    # time over limit × wall time
+    def __init__(self, limits):
+        self.limits = dict(limits)
+        self.items = dict.fromkeys(STAGES, 0)
+        self.busy = dict.fromkeys(STAGES, 0.0)
+        self.max_queue = dict.fromkeys(STAGES, 0)
+        self.wall = 0.0
+
+    def summary(self):
+        wall = self.wall or 1e-9
+        return {
+            stage: {
+                "limit": self.limits[stage], "items": self.items[stage],
+                "busy_seconds": round(self.busy[stage], 3),
+                "occupancy": round(self.busy[stage] / (self.limits[stage] * wall), 3),
+                "max_queue": self.max_queue[stage],
+            }
+            for stage in STAGES
+        }
+
+    def format(self):
+        return "  ".join(f"{stage} {v['occupancy']:.0%} of {v['limit']}" for stage, v in self.summary().items())
+
+
+def extract(module_name, fname, data):
+    # Worker task: detect the vendor (module_name None), read the text layer
+    # and the header region of text pages. → ("done", parse_pdf()-style
+    # result) when nothing needs OCR, else ("ocr", module name, layouts,
+    # header region lines, pages to OCR, metrics)
+    metrics.begin(fname)
+    try:
+        if module_name is None:
+            module_name = classify.classify(data)
+        scanner = registry.scanner(module_name) if module_name else None
+        if module_name is not None and scanner is None:
+            metrics.end()
+            return "done", engine.parse_pdf(module_name, fname, data)
+        if scanner is None:
+            return "done", (fname, None, [], None, metrics.end())
+        with raster.open_pdf(data) as pdf:
+            layouts = raster.read_layouts(pdf, range(len(pdf.pages)))
+            pending = [i for i, lay in layouts.items() if raster.needs_ocr(lay.text, scanner.ascii_threshold)]
+            regions = {}
+            if scanner.per_page and scanner.header_region:
+                for pidx, lay in layouts.items():
+                    if pidx not in pending:
+                        regions[pidx] = raster.region_lines(
+                            pdf.pages[pidx], lay, None, scanner.header_region, scanner.ascii_threshold)
+        if pending:
+            return "ocr", module_name, layouts, regions, pending, metrics.end()
+        rows = _scan(scanner, fname, layouts, regions, {})
+        return "done", (fname, module_name, rows, None, metrics.end())
+    except Exception as e:
+        m = metrics.end()
+        m["traceback"] = traceback.format_exc()
+        return "done", (fname, module_name, [], f"{type(e).__name__}: {e}", m)
+
+
+def parse_read(module_name, fname, layouts, regions, ocr_results):
+    # Worker task: scan a document once its scanned pages are OCR'd → (rows,
+    # seconds)
+    start = time.perf_counter()
+    rows = _scan(registry.scanner(module_name), fname, layouts, regions, ocr_results)
+    return rows, time.perf_counter() - start
+
+
+def _scan(scanner, fname, layouts, regions, ocr_results):
+    pages = []
+    for pidx in sorted(layouts):
+        result = ocr_results.get(pidx)
+        if result is None:
+            pages.append((pidx, layouts[pidx], "", regions.get(pidx, ())))
+            continue
+        layout = PageLayout.from_ocr(result)
+        region = layout.region_lines(scanner.header_region) if scanner.per_page and scanner.header_region else ()
+        pages.append((pidx, layout, result["dpi"], region))
+    rows = scanner.parse_pages(pages, os.path.basename(fname))
+    for row in rows:
+        row['source_file'] = fname
+    return rows
+
+
+class _Doc:
+    # one PDF on its way through the stages
+    def __init__(self, seq, fname, data, digest):
+        self.seq, self.fname, self.data, self.digest = seq, fname, data, digest
+        self.size = 0  # bytes counted against the memory budget
+        self.module = self.scanner = None
+        self.layouts, self.regions, self.results = {}, {}, {}
+        self.steps, self.pending, self.step, self.dpi, self.ocr_regions = (), [], 0, None, None
+        self.fallback = False
+        self.outstanding = 0
+        self.finished = False
+        self.m = None
+
+
+class Pipeline:
+    def __init__(self, loop, executor, module_name, use_cache=True, limits=None, stats=None,
+                 max_inflight=engine.MAX_INFLIGHT, memory_mb=engine.MEMORY_MB):
+        self.executor = executor
+        self.module_name = module_name
+        self.use_cache = use_cache
+        self.limits = dict(LIMITS, **(limits or {}))
+        self.stats = stats or PipelineStats(self.limits)
+        self.stats.limits = self.limits
+        self.max_inflight = max_inflight
+        self.memory_mb = memory_mb
+        self.out = queue.Queue()
+        self.loop = loop
+
+    @contextmanager
+    def _busy(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stats.busy[stage] += time.perf_counter() - start
+            self.stats.items[stage] += 1
+
+    async def _put(self, stage, item):
+        q = self.queues[stage]
+        await q.put(item)
+        self.stats.max_queue[stage] = max(self.stats.max_queue[stage], q.qsize())
+
+    def _spawn(self, coro):
+        # a put that must not block its caller (OCR feeding render again)
+        task = asyncio.ensure_future(coro)
+        self.spawned.add(task)
+        task.add_done_callback(self.spawned.discard)
+
+    async def run(self, pdfs):
+        self.threads = ThreadPoolExecutor(max_workers=self.limits["render"] + self.limits["ocr"] + 1)
+        self.slots = asyncio.Semaphore(self.max_inflight)
+        self.queues = {stage: asyncio.Queue(QUEUE_PER_WORKER * self.limits[stage]) for stage in STAGES[1:]}
+        self.spawned = set()
+        self.ready, self.next_seq, self.read_count, self.done_count = {}, 0, 0, 0
+        self.inflight_bytes = 0
+        self.reading = True
+        self.drained = asyncio.Event()
+        handlers = {"extract": self._extract, "render": self._render, "ocr": self._ocr, "parse": self._parse}
+        workers = [
+            asyncio.ensure_future(self._worker(stage, handlers[stage]))
+            for stage in STAGES[1:] for _ in range(self.limits[stage])
+        ]
+        start = time.perf_counter()
+        try:
+            await self._read(pdfs)
+            self.reading = False
+            if self.done_count < self.read_count:
+                await self.drained.wait()
+        finally:
+            self.stats.wall = time.perf_counter() - start
+            tasks = workers + list(self.spawned)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.threads.shutdown(wait=False, cancel_futures=True)
+
+    def _read_next(self, it):
+        # thread: next input PDF, its digest and any cached result
+        item = next(it, None)
+        if item is None:
+            return None
+        fname, data = item
+        digest = cache.pdf_digest(data)
+        return fname, data, digest, engine.lookup_cached(self.module_name, fname, digest, self.use_cache)
+
+    async def _read(self, pdfs):
+        it = iter(pdfs)
+        while True:
+            await self.slots.acquire()
+            while self.inflight_bytes and engine.over_budget(self.inflight_bytes, self.memory_mb):
+                await asyncio.sleep(0.05)
+            with self._busy("read"):
+                item = await self.loop.run_in_executor(self.threads, self._read_next, it)
+            if item is None:
+                self.slots.release()
+                return
+            fname, data, digest, (module, rows) = item
+            doc = _Doc(self.read_count, fname, data, digest)
+            self.read_count += 1
+            if rows is not None:
+                self._complete(doc, (fname, module, rows, None, {"file": fname, "cached": True, "sha256": digest}))
+                continue
+            doc.module, doc.size = module, len(data)
+            self.inflight_bytes += doc.size
+            await self._put("extract", doc)
+
+    async def _worker(self, stage, handler):
+        q = self.queues[stage]
+        while True:
+            item = await q.get()
+            doc = item[0] if isinstance(item, tuple) else item
+            if doc.finished:
+                continue
+            try:
+                await handler(item)
+            except Exception as e:
+                self._fail(doc, e)
+
+    async def _extract(self, doc):
+        with self._busy("extract"):
+            res = await self.loop.run_in_executor(self.executor, extract, doc.module, doc.fname, doc.data)
+        if res[0] == "done":
+            self._complete(doc, res[1])
+            return
+        _, doc.module, doc.layouts, doc.regions, pending, doc.m = res
+        doc.scanner = registry.scanner(doc.module)
+        steps = doc.scanner.ocr_dpi_steps
+        doc.steps = (steps,) if isinstance(steps, int) else tuple(steps)
+        await self._ocr_round(doc, pending, doc.steps[0], doc.scanner.ocr_regions)
+
+    async def _ocr_round(self, doc, pages, dpi, regions):
+        doc.pending, doc.dpi, doc.ocr_regions = pages, dpi, regions
+        chunks = [pages[i:i + raster.OCR_BATCH_PAGES] for i in range(0, len(pages), raster.OCR_BATCH_PAGES)]
+        doc.outstanding = len(chunks)
+        for chunk in chunks:
+            await self._put("render", (doc, chunk))
+
+    def _render_chunk(self, doc, chunk):
+        # thread: poppler render (and preprocess for region OCR) → [(page, image)]
+        images = list(raster.render_pages(doc.data, chunk, doc.dpi))
+        if doc.ocr_regions:
+            images = [(pidx, ocr.preprocess(image)) for pidx, image in images]
+        return images
+
+    async def _render(self, item):
+        doc, chunk = item
+        start = time.perf_counter()
+        with self._busy("render"):
+            images = await self.loop.run_in_executor(self.threads, self._render_chunk, doc, chunk)
+        self._add_time(doc, "render", time.perf_counter() - start)
+        await self._put("ocr", (doc, images))
+
+    async def _ocr(self, item):
+        doc, images = item
+        start = time.perf_counter()
+        with self._busy("ocr"):
+            results = await self.loop.run_in_executor(
+                self.threads, raster.ocr_batch, [image for _, image in images], doc.dpi, doc.ocr_regions)
+        self._add_time(doc, "ocr", time.perf_counter() - start)
+        for (pidx, _), result in zip(images, results):
+            result["dpi"] = doc.dpi
+            doc.results[pidx] = result
+        doc.outstanding -= 1
+        if doc.outstanding == 0:
+            await self._next_round(doc)
+
+    async def _next_round(self, doc):
+        # the same decisions as raster.iter_page_text() after each DPI step
+        keys = doc.scanner.ocr_keys
+        if not doc.fallback and doc.step < len(doc.steps) - 1:
+            pending = raster.escalate(doc.pending, doc.results, doc.layouts, keys)
+            if pending:
+                doc.step += 1
+                self._count(doc, "ocr_escalations", len(pending))
+                self._spawn(self._ocr_round(doc, pending, doc.steps[doc.step], doc.ocr_regions))
+                return
+        if not doc.fallback and doc.ocr_regions and raster.keys_missing(doc.results, doc.layouts, keys):
+            doc.fallback = True
+            self._count(doc, "ocr_region_fallbacks", len(doc.results))
+            self._spawn(self._ocr_round(doc, sorted(doc.results), doc.steps[-1], None))
+            return
+        await self._put("parse", doc)
+
+    async def _parse(self, doc):
+        with self._busy("parse"):
+            rows, seconds = await self.loop.run_in_executor(
+                self.executor, parse_read, doc.module, doc.fname, doc.layouts, doc.regions, doc.results)
+        self._add_time(doc, "parse", seconds)
+        self._count(doc, "ocr_pages", len(doc.results))
+        self._complete(doc, (doc.fname, doc.module, rows, None, doc.m))
+
+    def _add_time(self, doc, stage, seconds):
+        doc.m["stages"][stage] = doc.m["stages"].get(stage, 0.0) + seconds
+        doc.m["seconds"] += seconds
+
+    def _count(self, doc, name, n):
+        doc.m["counts"][name] = doc.m["counts"].get(name, 0) + n
+
+    def _fail(self, doc, e):
+        m = doc.m or {"file": doc.fname, "seconds": 0.0, "stages": {}, "pages": [], "counts": {}}
+        m["traceback"] = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+        self._complete(doc, (doc.fname, doc.module, [], f"{type(e).__name__}: {e}", m))
+
+    def _complete(self, doc, result):
+        if doc.finished:
+            return
+        doc.finished = True
+        self.inflight_bytes -= doc.size
+        doc.data = doc.layouts = doc.results = None
+        if result[4] is None or not result[4].get("cached"):
+            result = engine.store_result(self.module_name, doc.digest, result, self.use_cache)
+        self.ready[doc.seq] = result
+        while self.next_seq in self.ready:
+            self.out.put(self.ready.pop(self.next_seq))
+            self.next_seq += 1
+        self.done_count += 1
+        if not self.reading and self.done_count == self.read_count:
+            self.drained.set()
+
+    def call_soon(self, fn):
+        # from the consumer's thread; a no-op once the run is over
+        try:
+            self.loop.call_soon_threadsafe(fn)
+        except RuntimeError:
+            pass
+
+
+_END = object()
+
+
+def parse_pdfs(executor, module_name, pdfs, use_cache=True, limits=None, stats=None,
+               max_inflight=engine.MAX_INFLIGHT, memory_mb=engine.MEMORY_MB):
+    # Drop-in for engine.parse_pdfs(): same arguments (limits: stage →
+    # concurrency, see LIMITS) and results, in input order. The event loop
+    # runs on a background thread; at most max_inflight PDFs are read ahead
+    # of the results taken from this generator. stats, a PipelineStats, is
+    # filled in as the run goes.
+    loop = asyncio.new_event_loop()
+    pipe = Pipeline(loop, executor, module_name, use_cache, limits, stats, max_inflight, memory_mb)
+    main = loop.create_task(pipe.run(pdfs))
+
+    def run():
+        try:
+            loop.run_until_complete(main)
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            pipe.out.put(e)
+        finally:
+            loop.close()
+            pipe.out.put(_END)
+
+    thread = threading.Thread(target=run, name="parse-pipeline", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pipe.out.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+            # the consumer took a result: one more PDF may be read
+            pipe.call_soon(pipe.slots.release)
+    finally:
+        pipe.call_soon(main.cancel)
+        thread.join()
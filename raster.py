@@ -0,0 +1,233 @@
+import os
+import tempfile
+from io import BytesIO
+
+import metrics
+import ocr
+from layout import PageLayout
+
+ASCII_RATIO_THRESHOLD = 0.5
+PDF_DPI = 300
+MIN_OCR_CONFIDENCE = 75
+# scanned pages handed to one Tesseract process (see ocr.images_to_data)
+OCR_BATCH_PAGES = int(os.environ.get("PARSER_OCR_BATCH_PAGES", "8"))
+
+
+# PDF and OCR libraries are imported on first use. Long-lived workers call
+# preload() at start instead so no PDF pays for the text-path imports; the
+# OCR stack (pytesseract pulls in pandas, ~0.5 s) only if asked for.
+TEXT_MODULES = ("pdfplumber", "pypdfium2")
+OCR_MODULES = ("pdf2image", "PIL.Image", "pytesseract")
+
+
+def preload(ocr_modules=False):
+    import importlib
+
+    for name in TEXT_MODULES + (OCR_MODULES if ocr_modules else ()):
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def open_pdf(pdf_bytes):
+    import pdfplumber
+
+    # loading the page tree here keeps broken-PDF errors and their cost in
+    # the "open" stage
+    with metrics.stage("open"):
+        pdf = pdfplumber.open(BytesIO(pdf_bytes))
+        try:
+            pdf.pages
+        except Exception:
+            pdf.close()
+            raise
+        return pdf
+
+
+def page_count(pdf_bytes):
+    # cheap page count without building pdfplumber page objects
+    import pypdfium2
+
+    doc = pypdfium2.PdfDocument(pdf_bytes)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def needs_ocr(txt, threshold=ASCII_RATIO_THRESHOLD):
+    # scanned pages have no text layer, or one full of glyph garbage
+    ratio = sum(1 for c in txt if ord(c) < 128) / max(len(txt), 1)
+    return ratio < threshold
+
+
+def _page_runs(page_indices):
+    # [0, 1, 2, 5, 6] -> [(0, 2), (5, 6)]
+    runs = []
+    for idx in sorted(set(page_indices)):
+        if runs and idx == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], idx)
+        else:
+            runs.append((idx, idx))
+    return runs
+
+
+def render_pages(pdf_bytes, page_indices, dpi=PDF_DPI):
+    # Render the given 0-based pages and yield (page index, PIL image) in page
+    # order. poppler parses the document once per run of consecutive pages
+    # (once in total for a fully scanned file) instead of once per page; the
+    # rendered pages wait on disk and are loaded one at a time.
+    from pdf2image import convert_from_path
+    from PIL import Image
+
+    if not page_indices:
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pdf_path = os.path.join(tmpdir, "doc.pdf")
+        with open(pdf_path, "wb") as fh:
+            fh.write(pdf_bytes)
+        for first, last in _page_runs(page_indices):
+            with metrics.stage("render"):
+                paths = convert_from_path(
+                    pdf_path, dpi=dpi, first_page=first + 1, last_page=last + 1,
+                    output_folder=tmpdir, fmt="png", paths_only=True,
+                )
+            for idx, path in zip(range(first, last + 1), sorted(paths)):
+                with metrics.stage("render", page=idx):
+                    with Image.open(path) as img:
+                        img.load()
+                    os.remove(path)
+                yield idx, img
+
+
+def region_lines(page, layout, ocr_result, region_frac, threshold=ASCII_RATIO_THRESHOLD, dpi=PDF_DPI):
+    # Lines of text inside a fractional page region (x0, y0, x1, y1), looked
+    # up in the page's word index. On a text page whose region has no usable
+    # text (e.g. a header pasted in as an image) just that crop is OCR'd.
+    lines = layout.region_lines(region_frac)
+    if ocr_result is not None or not needs_ocr("\n".join(lines), threshold):
+        return lines
+    x0f, y0f, x1f, y1f = region_frac
+    w, h = page.width, page.height
+    pidx = page.page_number - 1
+    with metrics.stage("render", page=pidx):
+        cropped = page.crop((int(x0f * w), int(y0f * h), int(x1f * w), int(y1f * h)))
+        img = cropped.to_image(resolution=dpi).original
+    with metrics.stage("ocr", page=pidx):
+        return ocr.image_to_string(ocr.preprocess(img), dpi, ocr.tesseract_config(psm=6)).splitlines()
+
+
+def ocr_pages(pdf_bytes, page_indices, dpi=PDF_DPI, regions=None, batch_pages=OCR_BATCH_PAGES):
+    # Render and OCR pages, yielding (page index, ocr result) in page order.
+    # Pages are recognised batch_pages at a time by a single Tesseract run
+    # (per region); with regions each page is preprocessed as soon as it is
+    # rendered, so a batch waits as 1-bit images.
+    batch = []
+
+    def flush():
+        indices = [pidx for pidx, _ in batch]
+        with metrics.stage("ocr", page=indices):
+            results = ocr_batch([image for _, image in batch], dpi, regions)
+        batch.clear()
+        return zip(indices, results)
+
+    for pidx, image in render_pages(pdf_bytes, page_indices, dpi):
+        if regions:
+            with metrics.stage("ocr", page=pidx):
+                image = ocr.preprocess(image)
+        batch.append((pidx, image))
+        if len(batch) >= batch_pages:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+
+def ocr_batch(images, dpi, regions=None):
+    # OCR results of rendered pages (preprocessed when there are regions)
+    if regions:
+        return ocr.regions_to_data(images, dpi, regions)
+    return ocr.images_to_data(images, dpi)
+
+
+def read_layouts(pdf, indices):
+    # page index → PageLayout of the text layer
+    layouts = {}
+    for pidx in indices:
+        page = pdf.pages[pidx]
+        with metrics.stage("extract_text", page=pidx):
+            layouts[pidx] = PageLayout.from_page(page)
+            # close(), not just flush_cache(): the page's lru-cached text map
+            # holds every char object and would otherwise stay with the
+            # document until it is closed
+            page.close()
+    metrics.count("pages", len(layouts))
+    return layouts
+
+
+def keys_missing(results, layouts, key_patterns):
+    full_text = "\n".join(results[i]["text"] if i in results else lay.text for i, lay in layouts.items())
+    return any(not rx.search(full_text) for rx in key_patterns)
+
+
+def escalate(pending, results, layouts, key_patterns, min_confidence=MIN_OCR_CONFIDENCE):
+    # pages to OCR again at the next DPI step after `pending` were read
+    if keys_missing(results, layouts, key_patterns):
+        # a key field is missing: read every OCR'd page again, sharper
+        return sorted(results)
+    return [pidx for pidx in pending if results[pidx]["confidence"] < min_confidence]
+
+
+def iter_page_text(pdf, pdf_bytes, dpi=PDF_DPI, threshold=ASCII_RATIO_THRESHOLD,
+                   key_patterns=(), min_confidence=MIN_OCR_CONFIDENCE, pages=None, regions=None):
+    # Yield (page index, page, layout, ocr result) for every page of an open
+    # pdfplumber document; layout is the page's PageLayout (words with boxes,
+    # .text the page text) from the text layer or from OCR. The text layer of
+    # all pages is read first so every page that needs OCR is known up front
+    # and rendered in a single pass. `ocr result` is None for text-layer
+    # pages, otherwise the dict from ocr.image_to_data plus the "dpi" the
+    # page was finally read at.
+    #
+    # `dpi` may be a ladder such as (150, 300): pages are OCR'd at the first
+    # resolution and re-rendered at the next one only if their mean word
+    # confidence is below `min_confidence`, or if any of `key_patterns`
+    # (the vendor's invoice number / total regexes) matches nowhere in the
+    # document text.
+    #
+    # `pages` limits the walk to those 0-based page indices (a page-range
+    # task); key patterns are then checked over those pages only.
+    #
+    # `regions` (see ocr.regions_to_data) restricts OCR to the vendor's
+    # header and table areas of the preprocessed page, each read with its
+    # own Tesseract config. If a key pattern is still missing after the last
+    # step, the OCR'd pages are read once more whole, with default settings.
+    steps = (dpi,) if isinstance(dpi, int) else tuple(dpi)
+    indices = range(len(pdf.pages)) if pages is None else list(pages)
+
+    layouts = read_layouts(pdf, indices)
+    pending = [i for i, lay in layouts.items() if needs_ocr(lay.text, threshold)]
+
+    results = {}
+    for step, step_dpi in enumerate(steps):
+        if not pending:
+            break
+        if step:
+            metrics.count("ocr_escalations", len(pending))
+        for pidx, result in ocr_pages(pdf_bytes, pending, step_dpi, regions):
+            result["dpi"] = step_dpi
+            results[pidx] = result
+        if step == len(steps) - 1:
+            break
+        pending = escalate(pending, results, layouts, key_patterns, min_confidence)
+
+    if regions and results and keys_missing(results, layouts, key_patterns):
+        # the regions missed something (a layout change?): whole pages
+        metrics.count("ocr_region_fallbacks", len(results))
+        for pidx, result in ocr_pages(pdf_bytes, sorted(results), steps[-1]):
+            result["dpi"] = steps[-1]
+            results[pidx] = result
+
+    metrics.count("ocr_pages", len(results))
+    for pidx in indices:
+        result = results.get(pidx)
+        yield pidx, pdf.pages[pidx], PageLayout.from_ocr(result) if result else layouts.pop(pidx), result
@@ -0,0 +1,182 @@
+import argparse
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import cache
+
+# Post-parse validation over the whole row set. Rows are checked a batch at a
+# time with pandas group-bys rather than invoice by invoice:
+#   - line items against the invoice total, per (file, page, vendor,
+#     invoice number, total), in integer cents;
+#   - duplicate invoices: the same vendor and invoice number in another file,
+#     in this batch, an earlier batch or an earlier run. The persisted invoice
+#     index remembers every (vendor, invoice number, file) with its total;
+#     the first file seen with an invoice is the original, later ones are
+#     flagged as duplicates of it (the same file parsed again is not, however
+#     its path was given: files are compared by real path and content).
+# Flags are only ever added: check_needed is set and the issue appended to
+# parsing_issues; nothing a parser flagged is cleared.
+
+INDEX_PATH = os.environ.get("PARSER_INVOICE_INDEX") or os.path.join(cache.CACHE_DIR, "invoices.sqlite")
+BATCH_ROWS = 20000
+TOLERANCE_CENTS = 1
+
+
+class InvoiceIndex:
+    # SQLite (vendor, invoice number, file) → total and first-seen order
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS invoices ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, vendor TEXT, invoice_number TEXT,"
+                " sha256 TEXT, source_file TEXT, total_cents INTEGER, seen REAL,"
+                " UNIQUE (vendor, invoice_number, sha256, source_file))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def originals(self, keys):
+        # keys: DataFrame (vendor, invoice_number, sha256, source_file,
+        # total_cents) in arrival order. Adds them, then returns the original
+        # (first-seen) entry of every (vendor, invoice_number) among them.
+        import pandas as pd
+
+        cols = ["vendor", "invoice_number", "sha256", "source_file", "total_cents"]
+        totals = [None if pd.isna(t) else int(t) for t in keys["total_cents"].tolist()]
+        entries = zip(*(keys[c].tolist() for c in cols[:4]), totals, [time.time()] * len(keys))
+        distinct = keys[["vendor", "invoice_number"]].drop_duplicates()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN")
+            db.executemany(
+                "INSERT OR IGNORE INTO invoices (vendor, invoice_number, sha256, source_file, total_cents, seen)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                entries,
+            )
+            db.execute("CREATE TEMP TABLE batch_keys (vendor TEXT, invoice_number TEXT)")
+            db.executemany(
+                "INSERT INTO batch_keys VALUES (?, ?)",
+                zip(distinct["vendor"].tolist(), distinct["invoice_number"].tolist()),
+            )
+            # bare columns next to MIN(seq) come from the row holding the minimum
+            found = db.execute(
+                "SELECT i.vendor, i.invoice_number, i.sha256, i.source_file, i.total_cents, MIN(i.seq)"
+                " FROM invoices i JOIN batch_keys k"
+                " ON i.vendor = k.vendor AND i.invoice_number = k.invoice_number"
+                " GROUP BY i.vendor, i.invoice_number"
+            ).fetchall()
+            db.execute("DROP TABLE batch_keys")
+            db.execute("COMMIT")
+        orig = pd.DataFrame(found, columns=["vendor", "invoice_number"] + [f"orig_{c}" for c in cols[2:]] + ["seq"])
+        return orig.drop(columns="seq")
+
+    def clear(self):
+        with closing(self._connect()) as db:
+            return db.execute("DELETE FROM invoices").rowcount
+
+    def stats(self):
+        with closing(self._connect()) as db:
+            return db.execute(
+                "SELECT vendor, COUNT(*), COUNT(DISTINCT invoice_number) FROM invoices GROUP BY vendor ORDER BY vendor"
+            ).fetchall()
+
+
+def _cents(series):
+    import pandas as pd
+
+    txt = series.astype(str).str.replace(r"[,$\s]", "", regex=True)
+    return (pd.to_numeric(txt, errors="coerce") * 100).round().astype("Int64")
+
+
+def check_batch(results, index):
+    # Flag the rows of a batch of parse_pdfs() results in place.
+    import pandas as pd
+
+    flat, meta = [], []
+    for fname, _, rows, _, m in results:
+        sha = (m or {}).get("sha256") or ""
+        source = os.path.realpath(fname)
+        for row in rows:
+            flat.append(row)
+            meta.append((source, sha))
+    if not flat:
+        return
+    df = pd.DataFrame({
+        "source_file": [f for f, _ in meta],
+        "sha256": [s for _, s in meta],
+        "page": [r.get("page") for r in flat],
+        "vendor": [r.get("vendor_name") or "" for r in flat],
+        "invoice_number": [str(r.get("invoice_number") or "").strip() for r in flat],
+        "total_cents": _cents(pd.Series([r.get("total_amount") for r in flat], dtype=object).fillna("")),
+        "amount_cents": _cents(pd.Series([r.get("line_item_amount") for r in flat], dtype=object).fillna("")),
+        "check": pd.Series([str(r.get("check_needed")).strip().upper() in ("TRUE", "1", "YES") for r in flat]),
+    })
+    issues = pd.Series("", index=df.index)
+
+    # line items vs total, per invoice
+    invoice = ["source_file", "page", "vendor", "invoice_number", "total_cents"]
+    item_sum = df.groupby(invoice, sort=False, dropna=False)["amount_cents"].transform("sum")
+    mismatch = df["total_cents"].notna() & ((item_sum - df["total_cents"]).abs() > TOLERANCE_CENTS)
+    mismatch = mismatch.fillna(False) & ~df["check"]
+    issues[mismatch] = "total_mismatch"
+
+    # duplicates against the persisted index
+    numbered = df[df["invoice_number"] != ""]
+    if len(numbered):
+        keys = numbered.drop_duplicates(["vendor", "invoice_number", "sha256", "source_file"])
+        orig = index.originals(keys)
+        merged = numbered.reset_index().merge(orig, on=["vendor", "invoice_number"], how="left").set_index("index")
+        dup = (merged["orig_sha256"] != merged["sha256"]) | (merged["orig_source_file"] != merged["source_file"])
+        dup &= merged["orig_source_file"].notna()
+        same_total = merged["orig_total_cents"].astype("Int64").eq(merged["total_cents"]).fillna(False)
+        label = same_total.map({True: "duplicate_invoice", False: "duplicate_invoice_number"})
+        label = label + " (first seen in " + merged["orig_source_file"].fillna("") + ")"
+        dup_issue = pd.Series("", index=df.index)
+        dup_issue[merged.index[dup]] = label[dup]
+        issues = issues.str.cat(dup_issue, sep=";").str.strip(";")
+
+    flagged = issues[issues != ""]
+    for pos, issue in zip(flagged.index.tolist(), flagged.tolist()):
+        row = flat[pos]
+        row["parsing_issues"] = ";".join(x for x in (row.get("parsing_issues") or "", issue) if x)
+        row["check_needed"] = "TRUE"
+
+
+def validate(results, index=None, batch_rows=BATCH_ROWS):
+    # Pass parse_pdfs()-style results through in order, checking them in
+    # batches of about batch_rows rows (whole files; a batch is yielded once
+    # it has been checked).
+    index = index or InvoiceIndex()
+    batch, n = [], 0
+    for result in results:
+        batch.append(result)
+        n += len(result[2])
+        if n >= batch_rows:
+            check_batch(batch, index)
+            yield from batch
+            batch, n = [], 0
+    if batch:
+        check_batch(batch, index)
+        yield from batch
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Inspect or reset the invoice index used for duplicate detection.")
+    ap.add_argument("command", choices=["stats", "clear"])
+    args = ap.parse_args(argv)
+    index = InvoiceIndex()
+    if args.command == "stats":
+        for vendor, files, numbers in index.stats():
+            print(f"{vendor:20} {numbers:8d} invoice numbers in {files:8d} file entries")
+    else:
+        print(f"Removed {index.clear()} entries")
+
+
+if __name__ == "__main__":
+    main()
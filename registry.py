@@ -0,0 +1,94 @@
+import glob
+import importlib
+import os
+
+import linescan
+
+# Vendor parsers are the parse_*.py modules next to this file. They are found
+# and imported once per process, so a parser's SPEC (and every regex in it)
+# is compiled when the module loads, not per PDF. Each module names its
+# vendor with VENDOR_LABEL.
+PARSER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# module name → loaded module
+_modules = {}
+# module name → linescan.Scanner (None for parsers without a SPEC)
+_scanners = {}
+
+
+def load_parser(module_name):
+    module = _modules.get(module_name)
+    if module is None:
+        module = importlib.import_module(module_name)
+        if not hasattr(module, "parse"):
+            raise RuntimeError(f"Parser {module_name}.py has no parse() function.")
+        _modules[module_name] = module
+    return module
+
+
+def discover_parsers(parser_dir=PARSER_DIR):
+    # → {vendor label: module name}, sorted by label
+    found = {}
+    for path in glob.glob(os.path.join(parser_dir, "parse_*.py")):
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        found[getattr(load_parser(module_name), "VENDOR_LABEL", module_name)] = module_name
+    return dict(sorted(found.items()))
+
+
+# Vendor parser map (vendor label → module name without .py)
+VENDOR_PARSERS = discover_parsers()
+
+
+def resolve_vendor(name):
+    # "auto" (or empty) → None, i.e. detect per PDF; otherwise accepts the
+    # vendor label ("Flint Hills") or the module name ("parse_flinthills")
+    if not name or name.lower() == "auto":
+        return None
+    for label, module_name in VENDOR_PARSERS.items():
+        if name.lower() in (label.lower(), module_name):
+            return module_name
+    raise ValueError(f"unknown vendor {name!r}; choose auto or one of: {', '.join(VENDOR_PARSERS)}")
+
+
+def parser_version(module_name):
+    # bump PARSER_VERSION in a parser module whenever its output changes;
+    # cached results are keyed on it (and on whether scans are read by
+    # region, see linescan.OCR_REGIONS)
+    module = load_parser(module_name)
+    version = str(getattr(module, "PARSER_VERSION", "0"))
+    if linescan.OCR_REGIONS and (getattr(module, "SPEC", None) or {}).get("ocr_regions"):
+        version += "+regions"
+    return version
+
+
+def versions(module_name=None):
+    # the parser versions results for module_name depend on: all parsers'
+    # (and the classifier's) when None, i.e. auto-detection
+    if module_name:
+        return f"{module_name}:{parser_version(module_name)}"
+    import classify
+
+    names = sorted(VENDOR_PARSERS.values())
+    return ",".join([f"classify:{classify.CLASSIFIER_VERSION}"] + [f"{n}:{parser_version(n)}" for n in names])
+
+
+def vendor_name(module_name):
+    # the vendor_name a parser's rows carry ("Dale" → "Dale Petroleum
+    # Company"); None if the parser does not say
+    module = load_parser(module_name)
+    return (getattr(module, "SPEC", None) or {}).get("vendor_name") or getattr(module, "VENDOR_NAME", None)
+
+
+def page_independent(module_name):
+    # parsers that build rows from each page on its own set PAGE_INDEPENDENT
+    # and accept parse(f, pages=...); the engine may split their documents
+    return bool(getattr(load_parser(module_name), "PAGE_INDEPENDENT", False))
+
+
+def scanner(module_name):
+    # the compiled SPEC of a declarative parser, for callers that drive its
+    # stages themselves (pipeline.py); None if the parser has no SPEC
+    if module_name not in _scanners:
+        spec = getattr(load_parser(module_name), "SPEC", None)
+        _scanners[module_name] = linescan.compile_spec(spec) if spec else None
+    return _scanners[module_name]
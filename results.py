@@ -0,0 +1,101 @@
+import argparse
+import json
+import sqlite3
+import sys
+from contextlib import closing
+
+import registry
+from output import COLUMNS, SCHEMA
+
+PAGE_SIZE = 100
+
+
+class ResultStore:
+    # Read side of a SqliteRowWriter file: filtered, paged queries that only
+    # ever load one page of rows. Every filter is on an indexed column;
+    # text filters match exactly or, ending in "*", by prefix (a range scan
+    # on the index, unlike LIKE).
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        return closing(sqlite3.connect(f"file:{self.path}?mode=ro", uri=True))
+
+    def _where(self, check_needed=None, invoice_number="", source_file="", vendor_name=""):
+        clauses, params = [], []
+        if check_needed is not None:
+            clauses.append("check_needed = ?")
+            params.append(int(check_needed))
+        for col, value in (("invoice_number", invoice_number), ("source_file", source_file),
+                           ("vendor_name", vendor_name)):
+            value = (value or "").strip()
+            if not value:
+                continue
+            if value.endswith("*"):
+                # prefix → [prefix, prefix + U+10FFFF)
+                clauses.append(f"{col} >= ? AND {col} < ?")
+                params += [value[:-1], value[:-1] + "\U0010ffff"]
+            else:
+                clauses.append(f"{col} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM rows" + where, params).fetchone()[0]
+
+    def page(self, page=0, page_size=PAGE_SIZE, **filters):
+        # rows [page * page_size, (page + 1) * page_size) of the filtered
+        # result, in output order, as dicts with SCHEMA types
+        where, params = self._where(**filters)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM rows{where} ORDER BY rowid LIMIT ? OFFSET ?"
+        with self._connect() as db:
+            cur = db.execute(sql, params + [page_size, page * page_size])
+            rows = [dict(zip(COLUMNS, r)) for r in cur]
+        for row in rows:
+            if row["check_needed"] is not None:
+                row["check_needed"] = bool(row["check_needed"])
+        return rows
+
+    def distinct(self, column):
+        if column not in SCHEMA:
+            raise ValueError(f"unknown column {column!r}")
+        with self._connect() as db:
+            return [v for (v,) in db.execute(f"SELECT DISTINCT {column} FROM rows ORDER BY {column}")]
+
+
+def vendor_arg(name):
+    # a vendor label or parser module ("Dale", "parse_dale") → the vendor
+    # name its rows carry; anything else is matched as given
+    try:
+        module_name = registry.resolve_vendor(name)
+    except ValueError:
+        return name
+    return (registry.vendor_name(module_name) or name) if module_name else ""
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Query a parsed-results SQLite file one page at a time.")
+    ap.add_argument("path", help="results file written with -o results.sqlite")
+    ap.add_argument("--check-needed", action="store_true", help="only rows flagged for review")
+    ap.add_argument("--invoice", default="", help="invoice number (trailing * for a prefix)")
+    ap.add_argument("--file", default="", help="source file (trailing * for a prefix)")
+    ap.add_argument("--vendor", default="", type=vendor_arg,
+                    help="vendor label (e.g. Dale) or vendor name as in the rows (trailing * for a prefix)")
+    ap.add_argument("--page", type=int, default=1)
+    ap.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    args = ap.parse_args(argv)
+
+    store = ResultStore(args.path)
+    filters = dict(check_needed=True if args.check_needed else None, invoice_number=args.invoice,
+                   source_file=args.file, vendor_name=args.vendor)
+    print(f"{store.count(**filters)} matching rows", file=sys.stderr)
+    for row in store.page(args.page - 1, args.page_size, **filters):
+        print(json.dumps(row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+import argparse
+import random
+import zlib
+from io import BytesIO
+
+# Synthetic invoices laid out the way each parser expects them, for
+# benchmarking. Text-layer PDFs use a built-in font; "scanned" variants are
+# the same pages drawn into a greyscale image and embedded as JPEG, with no
+# text layer, so they take the OCR path.
+
+PAGE_W, PAGE_H = 612, 792
+LINE_H = 13
+LEFT, RIGHT_COL = 40, 340
+
+PRODUCTS = ["ULSD CLEAR", "Unleaded 87", "Premium 93", "Diesel #2", "Propane", "DEF Bulk", "Kerosene"]
+FEES = ["Federal Excise Tax", "State Fuel Tax", "Env Fee", "LUST Fee", "Freight", "Inspection Fee"]
+
+
+def _amounts(rng, n):
+    return [round(rng.uniform(20, 9000), 2) for _ in range(n)]
+
+
+def _money(v):
+    return f"{v:,.2f}"
+
+
+def _flinthills(rng, doc, page_no, pages, items):
+    # one invoice across all pages; the total on the last page covers them all
+    inv_no = doc.setdefault("invoice_number", "7%06d" % rng.randrange(10**6))
+    lines = [(LEFT, "FLINT HILLS RESOURCES LP"), (RIGHT_COL, f"Invoice No: {inv_no}"),
+             (RIGHT_COL, "Invoice Date: 03/14/2024"), (LEFT, "TICKET DATE TIME")]
+    amts = _amounts(rng, items)
+    doc["total"] = doc.get("total", 0) + sum(amts)
+    for a in amts:
+        lines.append((LEFT, f"{rng.choice(PRODUCTS)} {rng.randrange(1000, 9000)} GAL {_money(a)}"))
+    if page_no == pages - 1:
+        lines.append((LEFT, f"Invoice Total: {_money(doc['total'])}"))
+    return lines
+
+
+def _boyett(rng, doc, page_no, pages, items):
+    amts = _amounts(rng, items)
+    taxes = _amounts(rng, 2)
+    lines = [(LEFT, "Boyett Petroleum"), (RIGHT_COL, f"Invoice No: 2024-{rng.randrange(10000, 99999)}A"),
+             (RIGHT_COL, "Invoice Date: 03/14/2024"), (LEFT, "Description Qty Unit Price Amount")]
+    for a in amts:
+        lines.append((LEFT, f"{rng.choice(PRODUCTS)} {rng.randrange(100, 9000)} 2.{rng.randrange(100, 999)} {_money(a)}"))
+    lines.append((LEFT, "Tax and Other Charges Summary"))
+    for name, t in zip(FEES, taxes):
+        lines.append((LEFT, f"{name} {_money(t)}"))
+    lines += [(LEFT, "Invoice Total"), (LEFT, _money(sum(amts) + sum(taxes)))]
+    return lines
+
+
+def _dale(rng, doc, page_no, pages, items):
+    amts = _amounts(rng, items)
+    lines = [(LEFT, "Dale Petroleum Company"), (RIGHT_COL, f"Invoice No: IN-{rng.randrange(100000, 999999)}"),
+             (RIGHT_COL, "Invoice Date: Thu 03/14/2024"), (LEFT, "Description Qty Price Total")]
+    for a in amts:
+        lines.append((LEFT, f"{rng.choice(PRODUCTS)} {rng.randrange(100, 9000)} 3.{rng.randrange(100, 999)} {_money(a)}"))
+    lines.append((LEFT, f"Invoice Total: {_money(sum(amts))}"))
+    return lines
+
+
+def _marathon(rng, doc, page_no, pages, items):
+    fuel = _amounts(rng, max(1, items // 2))
+    fees = _amounts(rng, items - len(fuel))
+    lines = [(LEFT, "Marathon Petroleum Company LP"), (RIGHT_COL, f"Invoice Number: {rng.randrange(10**9, 10**10)}"),
+             (RIGHT_COL, "Invoice Date: 03/14/2024"), (LEFT, "Ship Date BOL Product Gallons Price USD")]
+    for a in fuel:
+        lines.append((LEFT, f"03/13/24 {rng.randrange(10000, 99999)} {rng.choice(PRODUCTS)} {rng.randrange(1000, 9000)} {_money(a)}"))
+    lines.append((LEFT, "Basis Rate Amount"))
+    for a in fees:
+        lines.append((LEFT, f"{rng.choice(FEES)} {rng.randrange(1000, 9000)} 0.{rng.randrange(100, 999)} {_money(a)}"))
+    lines.append((LEFT, f"Invoice Total {_money(sum(fuel) + sum(fees))}"))
+    return lines
+
+
+def _bbenergy(rng, doc, page_no, pages, items):
+    amts = _amounts(rng, items)
+    lines = [(LEFT, "BB Energy USA LLC"), (RIGHT_COL, f"Invoice Number: BB-{rng.randrange(10000, 99999)}"),
+             (RIGHT_COL, "Invoice Date: 03/14/2024"), (LEFT, "Date Time BOL Product Gallons Amount")]
+    for a in amts:
+        lines.append((LEFT, f"03/13/2024 {rng.randrange(10, 23)}:{rng.randrange(10, 59)} {rng.randrange(10000, 99999)} {rng.choice(PRODUCTS)} {_money(a)}"))
+    lines += [(LEFT, f"Total: {_money(sum(amts))}"), (LEFT, "Invoice Terms Net 10"),
+              (LEFT, f"Invoice Total {_money(sum(amts))}")]
+    return lines
+
+
+LAYOUTS = {
+    "parse_flinthills": _flinthills,
+    "parse_boyett": _boyett,
+    "parse_dale": _dale,
+    "parse_marathon": _marathon,
+    "parse_bbenergy": _bbenergy,
+}
+
+
+def invoice_pages(module_name, pages=1, items=10, seed=0):
+    # → list of pages, each a list of (x, text) lines from the top down
+    rng = random.Random(seed)
+    layout = LAYOUTS[module_name]
+    doc = {}
+    return [layout(rng, doc, p, pages, items) for p in range(pages)]
+
+
+def _pdf(page_streams, resources):
+    # minimal PDF writer: one content stream (+ optional XObject) per page
+    objects = [None, None]  # 1: catalog, 2: pages
+    kids = []
+    for content, xobject in page_streams:
+        res = resources
+        if xobject is not None:
+            objects.append(xobject)
+            res = "<< /XObject << /Im0 %d 0 R >> >>" % len(objects)
+        data = zlib.compress(content)
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data) + data + b"\nendstream")
+        content_id = len(objects)
+        objects.append(("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources %s /Contents %d 0 R >>"
+                        % (PAGE_W, PAGE_H, res, content_id)).encode())
+        kids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = ("<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids), len(kids))).encode()
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + obj + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def text_pdf(pages):
+    font = "<< /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >>"
+    streams = []
+    for lines in pages:
+        ops = []
+        for i, (x, text) in enumerate(lines):
+            y = PAGE_H - 40 - i * LINE_H
+            ops.append(f"BT /F1 10 Tf {x} {y} Td ({_escape(text)}) Tj ET")
+        streams.append(("\n".join(ops).encode("latin-1"), None))
+    return _pdf(streams, font)
+
+
+def scanned_pdf(pages, dpi=200, seed=0):
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+    rng = random.Random(seed)
+    scale = dpi / 72
+    try:
+        font = ImageFont.load_default(size=int(10 * scale))
+    except TypeError:  # Pillow < 10.1 has no scalable default font
+        font = ImageFont.load_default()
+    streams = []
+    for lines in pages:
+        img = Image.new("L", (int(PAGE_W * scale), int(PAGE_H * scale)), 255)
+        draw = ImageDraw.Draw(img)
+        for i, (x, text) in enumerate(lines):
+            draw.text((x * scale, (40 + i * LINE_H) * scale - 10 * scale), text, fill=0, font=font)
+        # a slight skew and blur so it looks like a scan
+        img = img.rotate(rng.uniform(-0.7, 0.7), fillcolor=255).filter(ImageFilter.GaussianBlur(0.6))
+        buf = BytesIO()
+        img.save(buf, "JPEG", quality=80)
+        jpeg = buf.getvalue()
+        xobject = (b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray"
+                   b" /BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n"
+                   % (img.width, img.height, len(jpeg)) + jpeg + b"\nendstream")
+        streams.append((b"q %d 0 0 %d 0 0 cm /Im0 Do Q" % (PAGE_W, PAGE_H), xobject))
+    return _pdf(streams, "<< >>")
+
+
+def generate(module_name, pages=1, items=10, scanned=False, seed=0, dpi=200):
+    layout = invoice_pages(module_name, pages, items, seed)
+    return scanned_pdf(layout, dpi, seed) if scanned else text_pdf(layout)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Write a synthetic invoice PDF for one vendor layout.")
+    ap.add_argument("parser", choices=sorted(LAYOUTS))
+    ap.add_argument("-o", "--output", required=True)
+    ap.add_argument("--pages", type=int, default=1)
+    ap.add_argument("--items", type=int, default=10, help="line items per page")
+    ap.add_argument("--scanned", action="store_true", help="image-only pages (no text layer)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    with open(args.output, "wb") as fh:
+        fh.write(generate(args.parser, args.pages, args.items, args.scanned, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# keep the tests off the user's result cache, invoice index and journals
+os.environ["PARSER_CACHE_DIR"] = tempfile.mkdtemp(prefix="invoice-tests-")
+for name in ("PARSER_INVOICE_INDEX", "PARSER_JOURNAL_DIR", "PARSER_STAGE_LIMITS", "PARSER_OCR_REGIONS"):
+    os.environ.pop(name, None)
+
+import cache  # noqa: E402
+import synth  # noqa: E402
+
+VENDORS = sorted(synth.LAYOUTS)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # a fresh cache directory for this test and the processes it starts
+    path = str(tmp_path / "cache")
+    monkeypatch.setenv("PARSER_CACHE_DIR", path)
+    monkeypatch.setattr(cache, "CACHE_DIR", path)
+    monkeypatch.setattr(cache, "_result_cache", None)
+    monkeypatch.setattr(cache, "_ocr_cache", None)
+    return path
+
+
+@pytest.fixture
+def invoices(tmp_path):
+    # write one synthetic text-layer PDF per (vendor, seed) → their paths
+    def write(seeds=(0,), vendors=VENDORS, directory="pdfs"):
+        out = tmp_path / directory
+        out.mkdir(exist_ok=True)
+        paths = []
+        for vendor in vendors:
+            for seed in seeds:
+                path = out / f"{vendor}_{seed}.pdf"
+                path.write_bytes(synth.generate(vendor, items=4, seed=seed))
+                paths.append(path)
+        return paths
+    return write
+
+
+@pytest.fixture
+def run_cli(cache_dir):
+    # run cli.py in a subprocess (the cache directory's env included)
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, os.path.join(ROOT, "cli.py"), "-w", "2", *map(str, args)],
+            capture_output=True, text=True, cwd=ROOT, timeout=600,
+        )
+    return run
+
+
+@pytest.fixture(scope="session")
+def executor():
+    import engine
+
+    with engine.start_engine(2) as executor:
+        yield executor
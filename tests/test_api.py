@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import api
+import engine
+import registry
+
+
+class GatedExecutor:
+    # parse tasks run on a thread in this process once the gate is opened
+    def __init__(self):
+        self.gate = threading.Event()
+        self.pool = ThreadPoolExecutor(1)
+
+    def submit(self, fn, *args):
+        def run():
+            self.gate.wait(60)
+            return fn(*args)
+        return self.pool.submit(run)
+
+
+@pytest.fixture
+def server(cache_dir, monkeypatch):
+    monkeypatch.setattr(engine, "_parsers", {m: registry.load_parser(m).parse
+                                             for m in registry.VENDOR_PARSERS.values()})
+    executor = GatedExecutor()
+    server = api.make_server(executor, port=0, runners=1, max_queue=1, use_cache=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", executor.gate
+    executor.gate.set()
+    server.shutdown()
+    server.server_close()
+    executor.pool.shutdown()
+
+
+def _request(url, data=None):
+    # → (status, headers, body); error statuses too
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=30) as res:
+            return res.status, res.headers, res.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def _submit(base, data, **params):
+    query = "&".join(f"{k}={v}" for k, v in params.items())
+    return _request(f"{base}/jobs?{query}", data)
+
+
+def _wait(base, job_id, *statuses):
+    deadline = time.time() + 60
+    while True:
+        status = json.loads(_request(f"{base}/jobs/{job_id}")[2])
+        if status["status"] in statuses:
+            return status
+        assert time.time() < deadline, status
+        time.sleep(0.02)
+
+
+def _zip(invoices):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for path in invoices:
+            z.writestr(path.name, path.read_bytes())
+    return buf.getvalue()
+
+
+def test_job_lifecycle(server, invoices):
+    base, gate = server
+    paths = invoices(vendors=["parse_boyett", "parse_dale"])
+    code, headers, body = _submit(base, _zip(paths), filename="batch.zip")
+    assert code == 202
+    first = json.loads(body)["job_id"]
+    assert headers["Location"] == f"/jobs/{first}"
+    _wait(base, first, "running")
+
+    # the runner is busy and the queue holds one job: a third is turned away
+    code, _, body = _submit(base, paths[0].read_bytes(), vendor="Boyett", filename="one.pdf")
+    assert code == 202
+    second = json.loads(body)["job_id"]
+    code, headers, _ = _submit(base, paths[0].read_bytes(), filename="one.pdf")
+    assert code == 429
+    assert headers["Retry-After"] == "5"
+    assert json.loads(_request(f"{base}/health")[2]) == {"status": "ok", "queue_depth": 1}
+
+    # results of unfinished jobs are not served yet
+    assert _request(f"{base}/jobs/{first}/results")[0] == 409
+    assert _request(f"{base}/jobs/{second}/results")[0] == 409
+    assert json.loads(_request(f"{base}/jobs/{second}")[2])["status"] == "queued"
+
+    gate.set()
+    status = _wait(base, first, "done", "failed")
+    assert status["status"] == "done"
+    assert status["files_done"] == 2 and status["counts"] == {"parsed": 2}
+    # Boyett's two tax lines are rows too
+    assert status["rows"] == 10
+    assert {info["parser"] for info in status["files"].values()} == {"parse_boyett", "parse_dale"}
+    assert _wait(base, second, "done", "failed")["status"] == "done"
+
+    code, headers, body = _request(f"{base}/jobs/{first}/results")
+    assert code == 200 and headers["Content-Type"] == "application/json"
+    rows = json.loads(body)
+    assert len(rows) == 10
+    assert {r["vendor_name"] for r in rows} == {"Boyett Petroleum", "Dale Petroleum Company"}
+    assert all(isinstance(r["line_item_amount"], float) for r in rows)
+
+    code, headers, body = _request(f"{base}/jobs/{first}/results?format=csv")
+    assert code == 200 and headers["Content-Type"] == "text/csv"
+    table = list(csv.DictReader(io.StringIO(body.decode("utf-8"))))
+    assert [r["line_item_amount"] for r in table] == [f"{r['line_item_amount']:.2f}" for r in rows]
+
+
+def test_bad_requests(server):
+    base, _ = server
+    assert _submit(base, b"%PDF", vendor="nobody")[0] == 400
+    assert _submit(base, b"")[0] == 400
+    assert _request(f"{base}/jobs/nope")[0] == 404
+    assert _request(f"{base}/jobs/nope/results")[0] == 404
+    assert _request(f"{base}/elsewhere")[0] == 404
@@ -0,0 +1,30 @@
+import pytest
+
+import bench
+
+META = {"docs": 2, "pages": 1, "items": 3}
+
+
+def _result(pages_per_sec, parser="parse_dale", error=None):
+    return {"parser": parser, "variant": "text", "pages_per_sec": pages_per_sec, "error": error}
+
+
+def test_compare_flags_slower_cases():
+    baseline = {"meta": META, "results": [_result(100.0), _result(50.0, "parse_boyett")]}
+    results = [_result(79.0), _result(45.0, "parse_boyett"), _result(1.0, "parse_marathon")]
+    assert bench.compare(results, baseline, 0.2, META) == ["parse_dale/text: 100.0 → 79.0 pages/s"]
+    assert bench.compare([_result(0.0, error="OSError: x")], baseline, 0.2, META) == []
+
+
+def test_compare_refuses_other_parameters():
+    baseline = {"meta": dict(META, pages=3), "results": [_result(100.0)]}
+    with pytest.raises(ValueError, match="pages 3 → 1"):
+        bench.compare([_result(100.0)], baseline, 0.2, META)
+
+
+def test_warm_up_is_not_timed(cache_dir):
+    result, = bench.run(["parse_dale"], ["text"], **META)
+    assert result["error"] is None
+    # the untimed warm-up document is in neither the counts nor the rows
+    assert (result["docs"], result["pages"], result["text_pages"], result["ocr_pages"]) == (2, 2, 2, 0)
+    assert result["rows"] == 6
@@ -0,0 +1,55 @@
+import sqlite3
+from contextlib import closing
+
+import cache
+
+
+def _summed(c):
+    with closing(sqlite3.connect(c.path)) as db:
+        return db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+def test_total_size_follows_puts_replaces_and_clears(tmp_path):
+    c = cache.DiskCache(str(tmp_path / "c.sqlite"), 10_000)
+    c.put("a", b"x" * 100, tag="one")
+    c.put("b", b"x" * 200, tag="two")
+    assert c.total_size() == 300
+    # replacing an entry accounts for the old size
+    c.put("a", b"x" * 50, tag="one")
+    assert c.total_size() == _summed(c) == 250
+    assert c.get("a") == b"x" * 50
+    assert c.clear("one") == 1
+    assert c.total_size() == 200
+    assert c.stats() == [("two", 1, 200)]
+    c.clear()
+    assert c.total_size() == 0
+
+
+def test_evicts_oldest_only_over_the_cap(tmp_path):
+    c = cache.DiskCache(str(tmp_path / "c.sqlite"), 1000)
+    for i in range(9):
+        c.put(f"k{i}", b"x" * 100)
+    assert c.total_size() == 900
+    c.get("k0")  # now the most recently used
+    c.put("k9", b"x" * 100)
+    assert c.total_size() == 1000
+    assert c.stats() == [("", 10, 1000)]
+    # over the cap: back under 90%, least recently used first
+    c.put("k10", b"x" * 100)
+    assert c.total_size() == _summed(c) == 900
+    assert c.get("k1") is None and c.get("k2") is None
+    assert c.get("k0") is not None and c.get("k10") is not None
+
+
+def test_total_size_of_an_existing_cache(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    with closing(sqlite3.connect(path)) as db:
+        db.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, tag TEXT, value BLOB, size INTEGER, last_used REAL)")
+        db.executemany("INSERT INTO entries VALUES (?, '', ?, ?, 0)", [("a", b"x" * 70, 70), ("b", b"x" * 30, 30)])
+        db.commit()
+    c = cache.DiskCache(path, 1000)
+    assert c.total_size() == 100
+    c.put("c", b"x" * 5)
+    assert c.total_size() == 105
+    # reopening does not count the entries twice
+    assert cache.DiskCache(path, 1000).total_size() == 105
@@ -0,0 +1,109 @@
+import io
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+from streamlit.testing.v1 import AppTest
+
+import classify
+import cli
+import engine
+import ocr
+import raster
+import registry
+import synth
+from conftest import ROOT, VENDORS
+
+L = synth.LEFT
+UNKNOWN = synth.text_pdf([[(L, "Acme Fuels"), (L, "Invoice 12345"), (L, "Total 10.00")]])
+
+
+@pytest.mark.parametrize("module_name", VENDORS)
+def test_each_layout_is_classified_to_its_vendor(module_name):
+    assert classify.classify(synth.generate(module_name, items=3)) == module_name
+
+
+def test_secondary_fingerprints_break_a_missing_name():
+    # the vendor name is in a logo: table headers still point to the vendor
+    assert classify.classify_text("Ship Date BOL Product Gallons Price USD\nBasis Rate Amount") == "parse_marathon"
+
+
+def test_a_tie_is_unrecognised():
+    assert classify.classify_text("Boyett Petroleum\nDale Petroleum") is None
+    assert classify.classify_text("Tax and Other Charges Summary\nInvoice No: IN-42") is None
+    assert classify.classify(UNKNOWN) is None
+
+
+def test_a_scanned_first_page_is_read_by_ocr(monkeypatch):
+    # a first page without a text layer: the top of a low-DPI render is OCR'd
+    seen = []
+
+    def render_pages(pdf_bytes, page_indices, dpi):
+        seen.append((list(page_indices), dpi))
+        yield 0, Image.new("L", (100, 200), 255)
+
+    def image_to_string(image, dpi):
+        seen.append((image.size, dpi))
+        return "DALE PETROLEUM\nInvoice No: IN-1"
+
+    monkeypatch.setattr(raster, "render_pages", render_pages)
+    monkeypatch.setattr(ocr, "image_to_string", image_to_string)
+    assert classify.classify(synth.text_pdf([[]])) == "parse_dale"
+    assert seen == [([0], classify.HEADER_OCR_DPI), ((100, 80), classify.HEADER_OCR_DPI)]
+
+
+def test_cli_reports_unrecognised_files_apart_from_failures(tmp_path, invoices, run_cli):
+    (dale,) = invoices(vendors=["parse_dale"])
+    (tmp_path / "acme.pdf").write_bytes(UNKNOWN)
+    res = run_cli(dale, tmp_path / "acme.pdf", "-o", tmp_path / "out.csv")
+    assert res.returncode == cli.EXIT_FILE_FAILURES
+    assert f"UNRECOGNISED {tmp_path / 'acme.pdf'}" in res.stderr
+    assert "FAILED" not in res.stderr
+    assert "Files: 2  Parsed: 1  Failed: 0  Unrecognised: 1" in res.stderr
+
+
+APP_SCRIPT = """
+import io
+import sys
+
+import streamlit as st
+
+sys.path.insert(0, {root!r})
+data = open({zip_path!r}, "rb").read()
+
+
+class Upload(io.BytesIO):
+    name = "batch.zip"
+
+
+st.file_uploader = lambda *args, **kwargs: Upload(data)
+st.button = lambda *args, **kwargs: True
+exec(compile(open({app!r}).read(), {app!r}, "exec"), {{"__name__": "__main__"}})
+"""
+
+
+def test_app_reports_unrecognised_files_apart_from_failures(tmp_path, cache_dir, monkeypatch):
+    # parse on a thread in this process: spawned workers would start from
+    # the script AppTest runs as __main__ (and leaves there afterwards)
+    monkeypatch.setitem(sys.modules, "__main__", sys.modules["__main__"])
+    monkeypatch.setattr(engine, "_parsers", {m: registry.load_parser(m).parse
+                                             for m in registry.VENDOR_PARSERS.values()})
+    pool = ThreadPoolExecutor(1)
+    monkeypatch.setattr(engine.SharedEngine, "get", lambda self, workers: pool)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("dale.pdf", synth.generate("parse_dale", items=3))
+        z.writestr("acme.pdf", UNKNOWN)
+    (tmp_path / "batch.zip").write_bytes(buf.getvalue())
+    script = tmp_path / "app_script.py"
+    script.write_text(APP_SCRIPT.format(root=ROOT, zip_path=str(tmp_path / "batch.zip"),
+                                        app=f"{ROOT}/app.py"))
+
+    at = AppTest.from_file(str(script), default_timeout=300).run()
+    summary = [md.value.split() for md in at.markdown if "**Uploaded:**" in md.value]
+    assert summary == [["**Uploaded:**", "2", "**Parsed:**", "1", "**Failed:**", "0", "**Unrecognised:**", "1"]]
+    assert [w.value for w in at.warning] == ["Files not matched to any vendor (quarantined):"]
+    assert not at.error
+    pool.shutdown()
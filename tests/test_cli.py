@@ -0,0 +1,72 @@
+import csv
+import json
+import zipfile
+
+import cli
+import journal
+import synth
+
+
+def _rows(path):
+    with open(path, newline="") as fh:
+        return list(csv.DictReader(fh))
+
+
+def _zip(path, members):
+    with zipfile.ZipFile(path, "w") as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+
+
+def test_corrupt_zip_next_to_good_one(tmp_path, invoices, run_cli):
+    good, other = invoices(seeds=(0,), vendors=["parse_dale", "parse_boyett"])
+    _zip(tmp_path / "a_good.zip", {"dale.pdf": good.read_bytes()})
+    (tmp_path / "b_corrupt.zip").write_bytes((tmp_path / "a_good.zip").read_bytes()[:200])
+    # stored uncompressed, then the PDF's bytes are damaged: the CRC check fails
+    _zip(tmp_path / "c_bad_member.zip", {"boyett.pdf": other.read_bytes()})
+    data = bytearray((tmp_path / "c_bad_member.zip").read_bytes())
+    data[100:110] = b"x" * 10
+    (tmp_path / "c_bad_member.zip").write_bytes(bytes(data))
+    out = tmp_path / "out.csv"
+
+    res = run_cli(tmp_path / "a_good.zip", tmp_path / "b_corrupt.zip", tmp_path / "c_bad_member.zip", other,
+              "-o", out, "--metrics", tmp_path / "m.json")
+    assert res.returncode == cli.EXIT_FILE_FAILURES, res.stderr
+    assert f"FAILED {tmp_path / 'b_corrupt.zip'}: BadZipFile" in res.stderr
+    assert f"FAILED {tmp_path / 'c_bad_member.zip'}/boyett.pdf: BadZipFile" in res.stderr
+    assert "Files: 4  Parsed: 2  Failed: 2" in res.stderr
+    assert {row["source_file"] for row in _rows(out)} == {f"{tmp_path / 'a_good.zip'}/dale.pdf", str(other)}
+
+
+
+def test_journal_of_another_run_is_not_replayed(tmp_path, invoices, run_cli):
+    dale, boyett = invoices(vendors=["parse_dale", "parse_boyett"])
+    out, jnl = tmp_path / "out.csv", tmp_path / "run.sqlite"
+    assert run_cli(dale, "-o", out, "--journal", jnl).returncode == 0
+    res = run_cli(boyett, "-o", out, "--vendor", "Boyett", "--journal", jnl)
+    assert res.returncode == 0, res.stderr
+    assert {row["source_file"] for row in _rows(out)} == {str(boyett)}
+
+
+def test_interrupted_run_replays_only_unchanged_inputs(tmp_path, invoices, run_cli):
+    first, second = invoices(seeds=(0, 1), vendors=["parse_dale"])
+    out, path = tmp_path / "out.csv", tmp_path / "run.sqlite"
+    assert run_cli(tmp_path / "pdfs", "-o", out, "--journal", path).returncode == 0
+    # as if the run had stopped: mark the job unfinished and the journaled
+    # rows recognisable, then change the second file
+    jnl = journal.Journal(str(path))
+    with jnl._connect() as db:
+        db.execute("UPDATE meta SET value = '\"running\"' WHERE key = 'status'")
+        for fname, rows in db.execute("SELECT fname, rows FROM files").fetchall():
+            rows = [dict(row, invoice_number="JOURNALED") for row in json.loads(rows)]
+            db.execute("UPDATE files SET rows = ? WHERE fname = ?", (json.dumps(rows), fname))
+    second.write_bytes(synth.generate("parse_dale", items=4, seed=7))
+
+    res = run_cli(tmp_path / "pdfs", "-o", out, "--journal", path)
+    assert res.returncode == 0, res.stderr
+    numbers = {}
+    for row in _rows(out):
+        numbers.setdefault(row["source_file"], set()).add(row["invoice_number"])
+    assert numbers[str(first)] == {"JOURNALED"}
+    assert "JOURNALED" not in numbers[str(second)]
+    assert jnl.meta()["status"] == "done"
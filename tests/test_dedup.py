@@ -0,0 +1,78 @@
+import pytest
+
+import cache
+import dedup
+import engine
+import pipeline
+import synth
+
+
+def _pdf(*extra_pages, seed=0):
+    return synth.text_pdf(synth.invoice_pages("parse_dale", items=3, seed=seed) + list(extra_pages))
+
+
+def test_fingerprint_matches_resent_pdf():
+    data = _pdf()
+    resent = data + b"\n% re-saved\n"
+    assert dedup.fingerprint(data) is not None
+    assert dedup.fingerprint(resent) == dedup.fingerprint(data)
+    assert dedup.fingerprint(_pdf(seed=1)) != dedup.fingerprint(data)
+
+
+def test_fingerprint_none_for_page_without_text_or_images():
+    # the second pages differ but have too little text to tell them apart
+    first = _pdf([(40, "Page 2")])
+    second = _pdf([(40, "VOID")])
+    blank = _pdf([])
+    assert dedup.fingerprint(first) is None
+    assert dedup.fingerprint(second) is None
+    assert dedup.fingerprint(blank) is None
+
+
+def test_fingerprint_none_for_unreadable_pdf():
+    assert dedup.fingerprint(b"%PDF-1.4 not really") is None
+
+
+def _batch(invoices):
+    # copies next to and far from their original, re-sends, and two PDFs
+    # that have no fingerprint
+    a, b, *others = [p.read_bytes() for p in invoices(seeds=(0, 1))]
+    batch = [("a.pdf", a), ("b.pdf", b), ("a_copy.pdf", a), ("a_resent.pdf", a + b"\n% re-saved\n")]
+    batch += [(f"other{i}.pdf", data) for i, data in enumerate(others)]
+    batch += [("a_late.pdf", a), ("b_late.pdf", b + b"\n% re-saved\n")]
+    batch += [("short1.pdf", _pdf([(40, "Page 2")])), ("short2.pdf", _pdf([(40, "VOID")]))]
+    return batch
+
+
+def _plain(result):
+    fname, module, rows, err, m = result
+    return fname, module, rows, err
+
+
+@pytest.mark.parametrize("max_inflight", [1, 64])
+@pytest.mark.parametrize("use_cache", [True, False])
+@pytest.mark.parametrize("backend", [engine.parse_pdfs, pipeline.parse_pdfs])
+def test_copies_match_their_own_parse_with_evicting_cache(monkeypatch, cache_dir, invoices, executor,
+                                                          backend, use_cache, max_inflight):
+    # PARSER_CACHE_MAX_MB=0: every result is evicted as soon as it is stored
+    monkeypatch.setattr(cache, "RESULT_CACHE_MAX_MB", 0)
+    batch = _batch(invoices)
+    expected = [_plain(r) for r in engine.parse_pdfs(executor, None, batch, use_cache=False)]
+    results = list(dedup.parse_unique(executor, None, iter(batch), use_cache=use_cache,
+                                      parse_pdfs=backend, max_inflight=max_inflight))
+    assert [_plain(r) for r in results] == expected
+    # (the short pages go to OCR, which may not be installed)
+    assert all(rows and not err for _, _, rows, err in expected[:-2])
+    dupes = {r[0]: r[4].get("duplicate_of") for r in results}
+    assert dupes["short2.pdf"] is None
+    if backend is engine.parse_pdfs and max_inflight > len(batch):
+        # the whole batch is read before the first result
+        assert dupes["a_copy.pdf"] == dupes["a_resent.pdf"] == dupes["a_late.pdf"] == "a.pdf"
+
+
+def test_later_copy_comes_from_the_cache(cache_dir, invoices, executor):
+    batch = _batch(invoices)
+    results = list(dedup.parse_unique(executor, None, iter(batch), max_inflight=1))
+    dupes = {r[0]: r[4].get("duplicate_of") for r in results}
+    assert dupes["a_late.pdf"] == "a.pdf"
+    assert dupes["b_late.pdf"] == "b.pdf"
@@ -0,0 +1,147 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import engine
+import registry
+import synth
+
+# page-independent vendors, whose documents the engine splits into ranges
+SPLIT_VENDORS = ["parse_boyett", "parse_dale", "parse_marathon"]
+
+
+def _batch():
+    # big documents between small ones, so reassembly has to keep the order
+    batch = []
+    for n, vendor in enumerate(SPLIT_VENDORS):
+        batch.append((f"{vendor}_big.pdf", synth.generate(vendor, pages=7, items=3, seed=n)))
+        batch.append((f"{vendor}_small.pdf", synth.generate(vendor, pages=1, items=3, seed=n)))
+    batch.append(("flinthills.pdf", synth.generate("parse_flinthills", pages=7, items=3)))
+    return batch
+
+
+def _rows(results):
+    return [(fname, module, rows, err) for fname, module, rows, err, _ in results]
+
+
+@pytest.mark.parametrize("module_name", [None, "parse_marathon"])
+def test_split_documents_give_the_whole_document_result(executor, cache_dir, monkeypatch, module_name):
+    batch = _batch() if module_name is None else [(f, d) for f, d in _batch() if "marathon" in f]
+    whole = list(engine.parse_pdfs(executor, module_name, batch, use_cache=False))
+    monkeypatch.setattr(engine, "SPLIT_MIN_PAGES", 4)
+    split = list(engine.parse_pdfs(executor, module_name, batch, use_cache=False, pages_per_task=2))
+
+    assert _rows(split) == _rows(whole)
+    assert [fname for fname, *_ in split] == [fname for fname, _ in batch]
+    assert all(rows and err is None for _, _, rows, err, _ in split)
+    metrics = {fname: m for fname, _, _, _, m in split}
+    detect = 1 if module_name is None else 0
+    for fname, _ in batch:
+        tasks = metrics[fname].get("tasks")
+        if "big" in fname:
+            # four 2-page ranges, after the detection task in auto mode
+            assert tasks == 4 + detect
+            assert [p["page"] for p in metrics[fname]["pages"]] == list(range(7))
+        elif fname == "flinthills.pdf":
+            # document scope: detected, then parsed whole
+            assert tasks == 2
+        else:
+            assert tasks is None
+
+
+@pytest.fixture
+def failing_range(monkeypatch):
+    # run tasks on a thread in this process, with a Marathon parser that
+    # fails on the range holding page 4
+    parse = registry.load_parser("parse_marathon").parse
+
+    def fail_on_page_4(f, pages=None):
+        if pages is not None and 4 in pages:
+            raise ValueError("page 4 is damaged")
+        return parse(f, pages=pages)
+
+    parsers = {m: registry.load_parser(m).parse for m in registry.VENDOR_PARSERS.values()}
+    parsers["parse_marathon"] = fail_on_page_4
+    monkeypatch.setattr(engine, "_parsers", parsers)
+    monkeypatch.setattr(engine, "SPLIT_MIN_PAGES", 4)
+    with ThreadPoolExecutor(1) as executor:
+        yield executor
+
+
+@pytest.mark.parametrize("module_name", [None, "parse_marathon"])
+def test_a_failed_range_fails_the_whole_file(failing_range, cache_dir, module_name):
+    batch = [("big.pdf", synth.generate("parse_marathon", pages=7, items=3)),
+             ("small.pdf", synth.generate("parse_marathon", pages=1, items=3))]
+    results = list(engine.parse_pdfs(failing_range, module_name, batch, use_cache=False, pages_per_task=2))
+
+    (fname, module, rows, err, m), small = results
+    assert (fname, module, rows, err) == ("big.pdf", "parse_marathon", [], "ValueError: page 4 is damaged")
+    assert "page 4 is damaged" in m["traceback"]
+    assert small[0] == "small.pdf" and small[2] and small[3] is None
+
+
+def test_a_new_pool_size_shuts_the_old_pool_down():
+    shared = engine.SharedEngine(warm=False)
+    try:
+        first = shared.get(1)
+        assert shared.get(1) is first
+        second = shared.get(2)
+        assert second is not first
+        with pytest.raises(RuntimeError):
+            first.submit(engine._ready)
+        assert second.submit(engine._ready).result(timeout=120) != os.getpid()
+    finally:
+        shared.shutdown()
+    assert shared.executor is None
+
+
+
+@pytest.fixture
+def in_process(monkeypatch, cache_dir):
+    monkeypatch.setattr(engine, "_parsers", {m: registry.load_parser(m).parse
+                                             for m in registry.VENDOR_PARSERS.values()})
+    with ThreadPoolExecutor(1) as executor:
+        yield executor
+
+
+def _pdfs(n, pad=0):
+    # Dale invoices, each made `pad` bytes bigger by a comment after its end
+    return [(f"{i}.pdf", synth.generate("parse_dale", items=2, seed=i) + b"%" + b"x" * pad + b"\n")
+            for i in range(n)]
+
+
+def _read_ahead(executor, pdfs, **kwargs):
+    # the most PDFs read from the input but not yet taken as results: those
+    # in flight, and the one read that waits for room
+    read = []
+
+    def source():
+        for fname, data in pdfs:
+            read.append(fname)
+            yield fname, data
+
+    most = taken = 0
+    for _, _, rows, err, _ in engine.parse_pdfs(executor, "parse_dale", source(), use_cache=False, **kwargs):
+        assert rows and err is None
+        most = max(most, len(read) - taken)
+        taken += 1
+    assert taken == len(pdfs)
+    return most
+
+
+def test_ingest_reads_at_most_max_inflight_ahead(in_process):
+    pdfs = _pdfs(10)
+    assert _read_ahead(in_process, pdfs, max_inflight=3) == 3 + 1
+    assert _read_ahead(in_process, pdfs, max_inflight=100) == 10
+
+
+def test_ingest_holds_back_over_the_memory_budget(in_process, monkeypatch):
+    monkeypatch.setattr(engine, "rss_mb", lambda: 0)
+    # half of a 2 MB budget holds three 300 KB PDFs
+    pdfs = _pdfs(10, pad=300 * 1024)
+    assert _read_ahead(in_process, pdfs, max_inflight=100, memory_mb=2) == 3 + 1
+    assert _read_ahead(in_process, pdfs, max_inflight=100, memory_mb=0) == 10
+    # with the process over budget one PDF at a time is in flight
+    monkeypatch.setattr(engine, "rss_mb", lambda: 3)
+    assert _read_ahead(in_process, pdfs, max_inflight=100, memory_mb=2) == 1 + 1
@@ -0,0 +1,51 @@
+import io
+import zipfile
+
+import pytest
+
+import ingest
+
+PDF = b"%PDF-1.4 test"
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return buf.getvalue()
+
+
+def _archive():
+    inner = _zip({"c.pdf": PDF, "__MACOSX/._c.pdf": b"\x00\x05\x16\x07"})
+    return _zip({
+        "a.pdf": PDF,
+        "sub/b.PDF": PDF,
+        "__MACOSX/._a.pdf": b"\x00\x05\x16\x07",
+        "__MACOSX/sub/._inner.zip": b"\x00\x05\x16\x07",
+        "sub/._b.pdf": b"\x00\x05\x16\x07",
+        "notes.txt": b"hello",
+        "broken.zip": b"PK\x03\x04 not really a zip",
+        "inner.zip": inner,
+        "z.pdf": PDF,
+    })
+
+
+def test_zip_walk_skips_resource_forks_and_reports_bad_nested_zips():
+    errors = []
+    names = [name for name, _ in ingest.iter_zip_pdfs(_archive(), errors=errors)]
+    assert names == ["a.pdf", "sub/b.PDF", "inner.zip/c.pdf", "z.pdf"]
+    assert [name for name, _ in errors] == ["broken.zip"]
+    assert errors[0][1].startswith("BadZipFile: ")
+
+
+def test_zip_walk_raises_without_an_errors_list():
+    with pytest.raises(zipfile.BadZipFile):
+        list(ingest.iter_zip_pdfs(_archive()))
+
+
+def test_failed_inputs_are_failed_results():
+    errors = [("x.zip/broken.zip", "BadZipFile: File is not a zip file")]
+    assert list(ingest.failed_inputs(errors)) == [
+        ("x.zip/broken.zip", None, [], "BadZipFile: File is not a zip file", {"file": "x.zip/broken.zip"}),
+    ]
@@ -0,0 +1,80 @@
+import json
+import time
+
+import pytest
+
+import cache
+import journal
+import registry
+
+
+@pytest.fixture
+def journal_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "JOURNAL_DIR", str(tmp_path / "jobs"))
+    return tmp_path / "jobs"
+
+
+def _row(fname):
+    return fname, "parse_dale", [{"source_file": fname}], None, {"sha256": "ab"}
+
+
+def test_job_id_depends_on_parser_versions(monkeypatch):
+    job = journal.job_id("digest", "parse_dale", registry.versions("parse_dale"))
+    assert job == journal.job_id("digest", "parse_dale", registry.versions("parse_dale"))
+    assert job != journal.job_id("digest", None, registry.versions(None))
+    auto = registry.versions(None)
+    monkeypatch.setattr(registry.load_parser("parse_dale"), "PARSER_VERSION", "999")
+    assert journal.job_id("digest", "parse_dale", registry.versions("parse_dale")) != job
+    assert registry.versions(None) != auto
+
+
+def test_open_job_resumes_only_unfinished_jobs(journal_dir):
+    jnl = journal.open_job("job1")
+    jnl.start(source="a.zip")
+    jnl.record(*_row("a.pdf"))
+    assert journal.open_job("job1").completed() == {"a.pdf": "ab"}
+    assert journal.open_job("job1", resume=False).completed() == {}
+
+    jnl.record(*_row("a.pdf"))
+    jnl.finish()
+    jnl = journal.open_job("job1")
+    assert jnl.completed() == {}
+    assert jnl.meta() == {}
+
+
+def test_open_job_with_another_key_starts_over(journal_dir):
+    jnl = journal.open_job("run", key="k1")
+    jnl.start(key="k1")
+    jnl.record(*_row("a.pdf"))
+    assert journal.open_job("run", key="k1").completed() == {"a.pdf": "ab"}
+    assert journal.open_job("run", key="k2").completed() == {}
+
+
+def test_remaining_compares_content(journal_dir):
+    jnl = journal.open_job("job1")
+    for fname, data in [("a.pdf", b"one"), ("b.pdf", b"two"), ("c.pdf", b"three")]:
+        jnl.record(fname, "parse_dale", [{"source_file": fname}], None, {"sha256": cache.pdf_digest(data)})
+    replay = set()
+    # b.pdf changed since; d.pdf is new; c.pdf is not among the inputs
+    pdfs = [("a.pdf", b"one"), ("b.pdf", b"changed"), ("d.pdf", b"four")]
+    assert list(jnl.remaining(iter(pdfs), replay)) == pdfs[1:]
+    assert replay == {"a.pdf"}
+    assert [r[0] for r in jnl.results(fnames=replay)] == ["a.pdf"]
+    assert [r[0] for r in jnl.results()] == ["a.pdf", "b.pdf", "c.pdf"]
+
+
+def test_prune_removes_old_finished_journals(journal_dir):
+    for job, status in [("old_done", "done"), ("new_done", "done"), ("old_running", "running")]:
+        jnl = journal.open_job(job)
+        jnl.start(source=job)
+        if status == "done":
+            jnl.finish()
+    # finished (or started) ten days ago
+    for job in ("old_done", "old_running"):
+        jnl = journal.Journal(journal.job_path(job))
+        with jnl._connect() as db:
+            db.execute("UPDATE meta SET value = ? WHERE key IN ('finished', 'started')",
+                       (json.dumps(time.time() - 10 * 86400),))
+    assert journal.prune(keep_days=7) == ["old_done"]
+    assert sorted(job for job, _, _ in journal.list_jobs()) == ["new_done", "old_running"]
+    assert not list(journal_dir.glob("old_done*"))
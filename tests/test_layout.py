@@ -0,0 +1,55 @@
+from io import BytesIO
+
+import pdfplumber
+import pytest
+
+import synth
+from conftest import VENDORS
+from layout import PageLayout
+
+# page fractions (x0, y0, x1, y1) whose edges fall between the synthetic
+# pages' lines and columns, so no word straddles them
+REGIONS = [
+    (0.0, 0.0, 1.0, 1.0),
+    (0.0, 0.0, 1.0, 0.2),
+    (synth.RIGHT_COL / synth.PAGE_W - 0.01, 0.0, 1.0, 0.3),
+    (0.0, 0.0, synth.RIGHT_COL / synth.PAGE_W - 0.01, 0.5),
+    (0.0, 0.3, 1.0, 0.7),
+]
+
+
+@pytest.fixture(scope="module")
+def pages():
+    docs = [synth.generate(vendor, pages=2, items=12, seed=3) for vendor in VENDORS]
+    opened = [pdfplumber.open(BytesIO(data)) for data in docs]
+    yield [page for pdf in opened for page in pdf.pages]
+    for pdf in opened:
+        pdf.close()
+
+
+def test_text_is_extract_text(pages):
+    for page in pages:
+        assert PageLayout.from_page(page).text == page.extract_text()
+
+
+@pytest.mark.parametrize("region", REGIONS)
+def test_region_lines_match_a_cropped_page(pages, region):
+    for page in pages:
+        layout = PageLayout.from_page(page)
+        bbox = layout.region(region)
+        assert layout.region_lines(region) == page.crop(bbox).extract_text().splitlines()
+        # words_in keeps reading order and only words inside the box
+        words = layout.words_in(bbox)
+        assert words == [w for w in layout.words if w in words]
+        assert all(bbox[0] <= (w[1] + w[3]) / 2 <= bbox[2] and bbox[1] <= (w[2] + w[4]) / 2 <= bbox[3]
+                   for w in words)
+
+
+def test_words_are_found_by_their_centre():
+    words = [("a", 0, 0, 10, 10, 0), ("b", 45, 0, 55, 10, 0), ("c", 90, 90, 100, 100, 1)]
+    layout = PageLayout(words, (100, 100), "a b\nc")
+    assert layout.words_in((0, 0, 50, 50)) == words[:2]
+    assert layout.words_in((51, 0, 100, 100)) == words[2:]
+    assert layout.lines_in((0, 0, 100, 100)) == ["a b", "c"]
+    assert layout.text_in((40, 0, 100, 100)) == "b\nc"
+    assert layout.region_lines((0.5, 0.5, 1.0, 1.0)) == ["c"]
@@ -0,0 +1,63 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # metrics' perf_counter, advanced by hand
+    now = [100.0]
+    monkeypatch.setattr(metrics.time, "perf_counter", lambda: now[0])
+
+    def advance(seconds):
+        now[0] += seconds
+    return advance
+
+
+def test_stages_and_pages_are_timed(clock):
+    metrics.begin("a.pdf")
+    with metrics.stage("open"):
+        clock(0.5)
+    with metrics.stage("ocr", page=[0, 1]):
+        clock(2.0)
+    with metrics.stage("render", page=1):
+        clock(1.0)
+    metrics.count("ocr_pages", 2)
+    metrics.count("pages", 2)
+    clock(0.25)
+    m = metrics.end()
+
+    assert m["file"] == "a.pdf" and m["seconds"] == 3.75
+    # the time no stage claimed is the parser's own
+    assert m["stages"] == {"open": 0.5, "extract_text": 0.0, "render": 1.0, "ocr": 2.0, "parse": 0.25}
+    assert m["pages"] == [{"page": 0, "ocr": 1.0}, {"page": 1, "ocr": 1.0, "render": 1.0}]
+    assert m["counts"] == {"pages": 2, "ocr_pages": 2, "ocr_escalations": 0}
+    # outside begin()/end() nothing is recorded
+    assert metrics.end() is None
+    with metrics.stage("open"):
+        metrics.count("pages")
+
+
+def test_file_rows_add_up_in_the_summary():
+    parsed = {"seconds": 2.0, "stages": {"open": 0.5, "ocr": 1.0, "parse": 0.5},
+              "counts": {"pages": 3, "ocr_pages": 2, "ocr_escalations": 1}}
+    cached = {"seconds": 0.0, "cached": True, "duplicate_of": "a.pdf", "counts": {"pages": 3}}
+    records = [
+        metrics.file_row("a.pdf", "parse_dale", [{}] * 4, None, parsed),
+        metrics.file_row("b.pdf", "parse_dale", [{}] * 4, None, cached),
+        metrics.file_row("c.pdf", None, [], "ValueError: broken", None),
+    ]
+    assert records[0] == {
+        "file": "a.pdf", "parser": "parse_dale", "rows": 4, "error": "", "cached": False, "seconds": 2.0,
+        "duplicate_of": "", "open_s": 0.5, "extract_text_s": 0.0, "render_s": 0.0, "ocr_s": 1.0,
+        "parse_s": 0.5, "pages": 3, "ocr_pages": 2, "ocr_escalations": 1,
+    }
+    assert records[2]["parser"] == "" and records[2]["error"] == "ValueError: broken"
+
+    assert metrics.summarize(records, wall_seconds=1.23456) == {
+        "files": 3, "failed": 1, "cached": 1, "duplicates": 1, "rows": 8, "pages": 6, "ocr_pages": 2,
+        "ocr_escalations": 1, "worker_seconds": 2.0,
+        "stage_seconds": {"open": 0.5, "extract_text": 0.0, "render": 0.0, "ocr": 1.0, "parse": 0.5},
+        "wall_seconds": 1.235,
+    }
+    assert "wall_seconds" not in metrics.summarize([])
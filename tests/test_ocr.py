@@ -0,0 +1,239 @@
+import json
+import os
+import sys
+from io import BytesIO
+
+import pytest
+import pytesseract
+from PIL import Image
+
+import linescan
+import ocr
+import raster
+import registry
+import synth
+from conftest import VENDORS
+from layout import PageLayout
+
+FONT_SIZE = 10
+
+FAKE_TESSERACT = """#!{python}
+import json, sys
+from PIL import Image
+
+canned = json.load(open({canned!r}))
+list_path, out, *config, fmt = sys.argv[1:]
+config = " ".join(config)
+paths = open(list_path).read().split()
+with open({log!r}, "a") as fh:
+    fh.write(json.dumps({{"config": config, "images": len(paths), "format": fmt}}) + "\\n")
+if "fail" in canned:
+    sys.exit(canned["fail"])
+with open(out + ".tsv", "w") as fh:
+    fh.write("level\\tpage_num\\tblock_num\\tpar_num\\tline_num\\tword_num\\tleft\\ttop\\twidth\\theight\\tconf\\ttext\\n")
+    for n, path in enumerate(paths, 1):
+        w, h = Image.open(path).size
+        rows = canned.get(f"{{config}}|{{w}}x{{h}}", canned.get(f"{{config}}|*"))
+        if rows is None:
+            continue
+        fh.write(f"1\\t{{n}}\\t0\\t0\\t0\\t0\\t0\\t0\\t{{w}}\\t{{h}}\\t-1\\t\\n")
+        for i, (line, left, top, width, height, conf, text) in enumerate(rows, 1):
+            fh.write(f"5\\t{{n}}\\t1\\t1\\t{{line}}\\t{{i}}\\t{{left}}\\t{{top}}\\t{{width}}\\t{{height}}\\t{{conf}}\\t{{text}}\\n")
+"""
+
+
+class FakeTesseract:
+    # a tesseract command that writes canned TSV: the word rows (line, left,
+    # top, width, height, conf, text) for "config|WxH" of each listed image,
+    # or "config|*" for any size; images with neither get no rows at all
+
+    def __init__(self, tmp_path):
+        self.canned_path = str(tmp_path / "canned.json")
+        self.log_path = str(tmp_path / "calls.jsonl")
+        self.cmd = str(tmp_path / "tesseract")
+        with open(self.cmd, "w") as fh:
+            fh.write(FAKE_TESSERACT.format(python=sys.executable, canned=self.canned_path, log=self.log_path))
+        os.chmod(self.cmd, 0o755)
+        self.answer({})
+
+    def answer(self, canned):
+        with open(self.canned_path, "w") as fh:
+            json.dump(canned, fh)
+
+    def calls(self):
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path) as fh:
+            return [json.loads(line) for line in fh]
+
+
+@pytest.fixture
+def tesseract(tmp_path, monkeypatch, cache_dir):
+    fake = FakeTesseract(tmp_path)
+    monkeypatch.setattr(pytesseract.pytesseract, "tesseract_cmd", fake.cmd)
+    monkeypatch.setattr(ocr, "_tesseract_version", "canned")
+    return fake
+
+
+def _image(w, h):
+    return Image.new("L", (w, h), 255)
+
+
+def _boxes(module_name):
+    return [region["box"] for region in registry.load_parser(module_name).SPEC["ocr_regions"]]
+
+
+def _inside(line, box):
+    x0, top, x1, bottom = line
+    return box[0] <= x0 and box[1] <= top and x1 <= box[2] and bottom <= box[3]
+
+
+@pytest.mark.parametrize("module_name", VENDORS)
+def test_ocr_regions_overlap(module_name):
+    boxes = sorted(_boxes(module_name), key=lambda box: box[1])
+    for upper, lower in zip(boxes, boxes[1:]):
+        assert lower[1] < upper[3]
+        assert max(upper[0], lower[0]) < min(upper[2], lower[2])
+
+
+@pytest.mark.parametrize("module_name", VENDORS)
+def test_ocr_regions_cover_every_line_but_the_letterhead(module_name):
+    boxes = _boxes(module_name)
+    for lines in synth.invoice_pages(module_name, pages=2, items=30):
+        for i, (x, text) in enumerate(lines[1:], start=1):
+            baseline = synth.PAGE_H - 40 - i * synth.LINE_H
+            line = (x / synth.PAGE_W, (synth.PAGE_H - baseline - FONT_SIZE) / synth.PAGE_H,
+                    (x + 0.6 * FONT_SIZE * len(text)) / synth.PAGE_W, (synth.PAGE_H - baseline + 3) / synth.PAGE_H)
+            assert any(_inside(line, box) for box in boxes), text
+
+
+@pytest.mark.parametrize("module_name", VENDORS)
+def test_whole_pages_are_ocrd_by_default(monkeypatch, module_name):
+    spec = registry.load_parser(module_name).SPEC
+    assert linescan.compile_spec(spec).ocr_regions is None
+    version = registry.parser_version(module_name)
+    monkeypatch.setattr(linescan, "OCR_REGIONS", True)
+    assert linescan.compile_spec(spec).ocr_regions == spec["ocr_regions"]
+    assert registry.parser_version(module_name) == version + "+regions"
+
+
+def test_tesseract_batch_splits_the_tsv_into_pages(tesseract):
+    tesseract.answer({
+        "--psm 6|10x10": [[1, 1, 2, 30, 9, 91.5, "Invoice"], [2, 1, 20, 30, 9, 88, 'No."7"']],
+        "--psm 6|12x10": [[1, 0, 0, 12, 10, -1, ""]],
+    })
+    pages = ocr._tesseract_batch([_image(10, 10), _image(11, 10), _image(12, 10)], "--psm 6")
+    assert tesseract.calls() == [{"config": "--psm 6", "images": 3, "format": "tsv"}]
+    # the second image has no rows at all
+    assert sorted(pages) == [1, 3]
+    assert pages[1]["text"] == ["", "Invoice", 'No."7"']
+    assert pages[1]["page_num"] == [1, 1, 1]
+    assert pages[1]["line_num"] == [0, 1, 2]
+    assert pages[1]["conf"] == [-1.0, 91.5, 88.0]
+    assert pages[3]["text"] == ["", ""]
+
+
+def test_tesseract_batch_raises_tesseract_errors(tesseract):
+    tesseract.answer({"fail": "canned failure"})
+    with pytest.raises(pytesseract.TesseractError, match="canned failure"):
+        ocr._tesseract_batch([_image(10, 10)])
+
+
+def test_images_to_data_keeps_input_order_and_batches_cache_misses(tesseract):
+    tesseract.answer({
+        "|10x10": [[1, 1, 2, 30, 9, 90, "first"]],
+        "|12x10": [[1, 1, 2, 30, 9, 80, "third"], [1, 40, 2, 30, 9, 70, "page"]],
+    })
+    results = ocr.images_to_data([_image(10, 10), _image(11, 10), _image(12, 10)], 150)
+    assert [r["text"] for r in results] == ["first", "", "third page"]
+    assert results[1] == {"text": "", "confidence": 0.0, "words": [], "size": [11, 10]}
+    assert results[2]["confidence"] == 75.0
+    assert results[2]["words"][1] == ["page", 70.0, 40, 2, 70, 11, 0]
+    # cached pages are not sent again
+    again = ocr.images_to_data([_image(12, 10), _image(13, 10), _image(10, 10)], 150)
+    assert [r["text"] for r in again] == ["third page", "", "first"]
+    assert [c["images"] for c in tesseract.calls()] == [3, 1]
+
+
+def test_regions_to_data_maps_words_back_to_pages(tesseract):
+    # page 0 is 200x300: region 0 is its top half, region 1 overlaps it from
+    # y=120 down. Page 1 (220x300) has no words in either region.
+    header, body, amounts = "--psm 6", "--psm 4", ocr.tesseract_config(6, ocr.AMOUNT_WHITELIST)
+    tesseract.answer({
+        f"{header}|200x150": [[1, 10, 10, 60, 20, 95, "Invoice"], [1, 80, 10, 50, 20, 93, "IN-42"],
+                              [2, 10, 125, 40, 20, 90, "Total"]],
+        f"{body}|200x180": [[1, 10, 5, 40, 20, 60, "Tota1"],  # the same word, seen by region 0
+                            [2, 60, 45, 40, 20, 85, "Due"], [2, 120, 45, 40, 20, 40, "l2.50"]],
+        f"{header}|220x150": [],
+        f"{amounts}|*": [[1, 16, 16, 40, 20, 96, "12.50"]],
+    })
+    regions = [{"box": (0, 0, 1, 0.5), "psm": 6}, {"box": (0, 0.4, 1, 1), "psm": 4}]
+    page0, page1 = ocr.regions_to_data([_image(200, 300), _image(220, 300)], 300, regions)
+
+    assert page0["text"] == "Invoice IN-42\nTotal\nDue 12.50"
+    assert page0["size"] == [200, 300]
+    assert page0["words"][3] == ["Due", 85.0, 60, 165, 100, 185, 2]
+    # the re-read amount keeps its place and takes the better confidence
+    assert page0["words"][4] == ["12.50", 96.0, 120, 165, 160, 185, 2]
+    assert page1 == {"text": "", "confidence": 0.0, "words": [], "size": [220, 300]}
+    # one run per region for both pages, and one for the amount strip
+    assert [(c["config"], c["images"]) for c in tesseract.calls()] == [(header, 2), (body, 2), (amounts, 1)]
+
+
+def _ocr_result(lines, confidence):
+    # an ocr.image_to_data result with one word box per line
+    words = [[text, confidence, 10, 20 * n, 10 + 8 * len(text), 20 * n + 12, n] for n, text in enumerate(lines)]
+    return {"text": "\n".join(lines), "confidence": confidence, "words": words, "size": [1000, 1300]}
+
+
+MARATHON_PAGE = ["Marathon Petroleum Company LP", "Invoice Number: 1234567890", "Invoice Date: 03/14/2024",
+                 "Ship Date BOL Product Gallons Price USD", "03/13/24 55555 Unleaded 87 1000 2,000.00",
+                 "You Owe 2,000.00"]
+
+
+def test_a_missing_key_rereads_every_ocrd_page():
+    keys = linescan.compile_spec(registry.load_parser("parse_marathon").SPEC).ocr_keys
+    layouts = {0: PageLayout([], (1, 1), ""), 1: PageLayout([], (1, 1), "")}
+    results = {0: _ocr_result(MARATHON_PAGE, 90), 1: _ocr_result(["Page 2"], 60)}
+    # "You Owe" stands in for the invoice total; only the blurry page is read again
+    assert not raster.keys_missing(results, layouts, keys)
+    assert raster.escalate([0, 1], results, layouts, keys) == [1]
+    results[0] = _ocr_result([line for line in MARATHON_PAGE if "Invoice Number" not in line], 90)
+    assert raster.keys_missing(results, layouts, keys)
+    assert raster.escalate([1], results, layouts, keys) == [0, 1]
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    # raster.ocr_pages answering from canned pages: {dpi: [lines, conf]}
+    canned, calls = {}, []
+
+    def ocr_pages(pdf_bytes, page_indices, dpi=raster.PDF_DPI, regions=None):
+        calls.append((dpi, list(page_indices)))
+        for pidx in page_indices:
+            yield pidx, _ocr_result(*canned[dpi])
+
+    monkeypatch.setattr(raster, "ocr_pages", ocr_pages)
+    return canned, calls
+
+
+def test_scanned_marathon_page_with_you_owe_is_not_escalated(fake_ocr, cache_dir):
+    canned, calls = fake_ocr
+    canned[150] = (MARATHON_PAGE, 90)
+    canned[300] = (MARATHON_PAGE, 95)
+    f = BytesIO(synth.text_pdf([[]]))
+    f.name = "scan.pdf"
+    rows = registry.load_parser("parse_marathon").parse(f)
+    assert calls == [(150, [0])]
+    assert [(r["invoice_number"], r["total_amount"]) for r in rows] == [("1234567890", "2000.00")]
+
+
+def test_scanned_page_without_a_total_is_escalated(fake_ocr, cache_dir):
+    canned, calls = fake_ocr
+    canned[150] = (MARATHON_PAGE[:-1], 90)
+    canned[300] = (MARATHON_PAGE, 95)
+    f = BytesIO(synth.text_pdf([[]]))
+    f.name = "scan.pdf"
+    rows = registry.load_parser("parse_marathon").parse(f)
+    assert calls == [(150, [0]), (300, [0])]
+    assert {r["total_amount"] for r in rows} == {"2000.00"}
@@ -0,0 +1,91 @@
+import csv
+import datetime
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import output
+
+
+def _row(n, **values):
+    row = {"source_file": f"{n}.pdf", "vendor_name": "Dale Petroleum Company", "invoice_number": f"IN-{n}",
+           "invoice_date": "03/14/2024", "total_amount": "1,050.00", "line_item_description": "ULSD",
+           "line_item_amount": "1050.00", "check_needed": "FALSE", "parsing_issues": "", "ocr_dpi": ""}
+    row.update(values)
+    return row
+
+
+def test_normalize_row_coerces_to_the_schema():
+    row = output.normalize_row(_row(1, total_amount=Decimal("1050.10"), line_item_amount="$ 1,2x",
+                                    invoice_date=datetime.date(2024, 3, 14), check_needed="true",
+                                    ocr_dpi="300", parsing_issues=None, page=2))
+    assert list(row) == output.COLUMNS
+    assert row["total_amount"] == 1050.1 and isinstance(row["total_amount"], float)
+    # an amount that is not a number is missing, not an error
+    assert row["line_item_amount"] is None
+    assert row["invoice_date"] == "2024-03-14"
+    assert row["check_needed"] is True
+    assert row["ocr_dpi"] == 300
+    assert row["parsing_issues"] == ""
+
+    row = output.normalize_row({"invoice_number": 42, "total_amount": 7, "check_needed": False})
+    assert row["invoice_number"] == "42" and row["source_file"] == ""
+    assert row["total_amount"] == 7.0
+    assert row["check_needed"] is False
+    assert row["line_item_amount"] is None and row["ocr_dpi"] is None
+
+
+@pytest.mark.parametrize("batch_rows", [1, 3, 100])
+def test_csv_batches_are_flushed_past_batch_rows(tmp_path, batch_rows):
+    path = tmp_path / "out.csv"
+    writer = output.CsvRowWriter(str(path), batch_rows=batch_rows)
+    writer.write([_row(n) for n in range(2)])
+    # a batch is written once it reaches batch_rows rows
+    assert writer.rows_written == (2 if batch_rows <= 2 else 0)
+    writer.write([_row(n) for n in range(2, 5)])
+    assert writer.rows_written == (5 if batch_rows <= 3 else 0)
+    writer.close()
+    assert writer.rows_written == 5
+
+    with open(path, newline="") as fh:
+        table = list(csv.DictReader(fh))
+    assert [r["source_file"] for r in table] == [f"{n}.pdf" for n in range(5)]
+    assert table[0] == {**_row(0), "total_amount": "1050.00"}
+
+
+def test_parquet_writes_one_row_group_per_batch(tmp_path):
+    path = str(tmp_path / "out.parquet")
+    with output.ParquetRowWriter(path, batch_rows=2) as writer:
+        writer.write([_row(0)])
+        writer.write([_row(1), _row(2, check_needed="TRUE", ocr_dpi="300")])
+        writer.write([_row(3)])
+    assert writer.rows_written == 4
+
+    meta = pq.ParquetFile(path).metadata
+    assert [meta.row_group(i).num_rows for i in range(meta.num_row_groups)] == [3, 1]
+    table = pq.read_table(path)
+    assert table.schema == output.arrow_schema()
+    assert table.column("check_needed").to_pylist() == [False, False, True, False]
+    assert table.column("ocr_dpi").to_pylist() == [None, None, 300, None]
+    assert table.column("total_amount").to_pylist() == [1050.0] * 4
+
+
+def test_arrow_schema_follows_the_output_schema():
+    schema = output.arrow_schema()
+    assert schema.names == output.COLUMNS
+    assert schema.field("total_amount").type == pa.float64()
+    assert schema.field("check_needed").type == pa.bool_()
+    assert schema.field("ocr_dpi").type == pa.int32()
+    assert schema.field("invoice_number").type == pa.string()
+
+
+def test_open_writer_picks_the_format_from_the_extension(tmp_path):
+    for name, kind in [("a.parquet", output.ParquetRowWriter), ("a.sqlite", output.SqliteRowWriter),
+                       ("a.db", output.SqliteRowWriter), ("a.csv", output.CsvRowWriter),
+                       ("a.txt", output.CsvRowWriter)]:
+        with output.open_writer(str(tmp_path / name)) as writer:
+            assert type(writer) is kind
+    with output.open_writer(str(tmp_path / "b.out"), "parquet") as writer:
+        assert type(writer) is output.ParquetRowWriter
@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import cli
+import engine
+import pipeline
+import raster
+import synth
+
+
+def _plain(results):
+    return [(fname, module, rows, err) for fname, module, rows, err, _ in results]
+
+
+def _text_batch(seeds=(0, 1)):
+    batch = []
+    for vendor in sorted(synth.LAYOUTS):
+        for seed in seeds:
+            batch.append((f"{vendor}_{seed}.pdf", synth.generate(vendor, pages=2, items=5, seed=seed)))
+    batch.insert(3, ("broken.pdf", b"%PDF-1.4 not a pdf"))
+    batch.append(("copy.pdf", batch[0][1]))
+    return batch
+
+
+@pytest.mark.parametrize("module_name", [None, "parse_dale"])
+def test_same_results_as_engine(cache_dir, executor, module_name):
+    batch = _text_batch()
+    expected = _plain(engine.parse_pdfs(executor, module_name, batch, use_cache=False))
+    stats = pipeline.PipelineStats(pipeline.LIMITS)
+    got = _plain(pipeline.parse_pdfs(executor, module_name, iter(batch), use_cache=False, stats=stats))
+    assert got == expected
+    assert [fname for fname, *_ in got] == [fname for fname, _ in batch]
+    assert stats.items["extract"] == len(batch)
+    # with the cache: the second run is answered by the read stage alone
+    list(pipeline.parse_pdfs(executor, module_name, iter(batch)))
+    stats = pipeline.PipelineStats(pipeline.LIMITS)
+    assert _plain(pipeline.parse_pdfs(executor, module_name, iter(batch), stats=stats)) == expected
+    assert stats.items["extract"] == sum(1 for *_, err in expected if err)
+
+
+class FakeScans:
+    # render and OCR stand-ins: a "rendered" page carries the synthetic
+    # invoice's lines, and OCR returns them as one word per line. Tracks how
+    # many calls of each run at once.
+
+    def __init__(self, monkeypatch, render_delay=0.0, ocr_delay=0.0):
+        self.pages = {}  # pdf bytes → synth pages
+        self.delay = {"render": render_delay, "ocr": ocr_delay}
+        self.fail = set()  # pdf bytes whose OCR raises
+        self.active = {"render": 0, "ocr": 0}
+        self.peak = {"render": 0, "ocr": 0}
+        self.lock = threading.Lock()
+        monkeypatch.setattr(raster, "render_pages", self.render_pages)
+        monkeypatch.setattr(raster, "ocr_batch", self.ocr_batch)
+
+    def scan(self, module_name, seed):
+        pages = synth.invoice_pages(module_name, pages=2, items=5, seed=seed)
+        data = synth.scanned_pdf([[] for _ in pages], dpi=20, seed=seed) + b"%% %d" % len(self.pages)
+        self.pages[data] = pages
+        return data
+
+    def _enter(self, stage):
+        with self.lock:
+            self.active[stage] += 1
+            self.peak[stage] = max(self.peak[stage], self.active[stage])
+        time.sleep(self.delay[stage])
+        with self.lock:
+            self.active[stage] -= 1
+
+    def render_pages(self, pdf_bytes, page_indices, dpi=raster.PDF_DPI):
+        self._enter("render")
+        for pidx in page_indices:
+            image = Image.new("L", (synth.PAGE_W, synth.PAGE_H), 255)
+            image.info.update(lines=self.pages[pdf_bytes][pidx], fail=pdf_bytes in self.fail)
+            yield pidx, image
+
+    def ocr_batch(self, images, dpi, regions=None):
+        self._enter("ocr")
+        results = []
+        for image in images:
+            if image.info["fail"]:
+                raise ValueError("canned OCR failure")
+            words = []
+            for i, (x, text) in enumerate(image.info["lines"]):
+                top = 40 + i * synth.LINE_H - 10
+                words.append([text, 95.0, x, top, x + 5 * len(text), top + 12, i])
+            results.append({"text": "\n".join(w[0] for w in words), "confidence": 95.0, "words": words,
+                            "size": list(image.size)})
+        return results
+
+
+def test_scans_read_like_their_text_layer(cache_dir, executor, monkeypatch):
+    fake = FakeScans(monkeypatch)
+    batch = [(f"scan{seed}.pdf", fake.scan("parse_dale", seed)) for seed in range(3)]
+    texts = [(f"scan{seed}.pdf", synth.generate("parse_dale", pages=2, items=5, seed=seed)) for seed in range(3)]
+    got = _plain(pipeline.parse_pdfs(executor, "parse_dale", iter(batch), use_cache=False))
+    expected = _plain(engine.parse_pdfs(executor, "parse_dale", texts, use_cache=False))
+    for (fname, _, rows, err), (_, _, text_rows, _) in zip(got, expected):
+        assert err is None
+        assert rows and [dict(r, ocr_dpi="") for r in rows] == text_rows
+        assert {r["ocr_dpi"] for r in rows} == {150}
+
+
+def test_stage_limits_are_kept(cache_dir, executor, monkeypatch):
+    # OCR is the slow stage, so it is the one that fills up
+    fake = FakeScans(monkeypatch, render_delay=0.02, ocr_delay=0.2)
+    batch = [(f"scan{seed}.pdf", fake.scan("parse_boyett", seed)) for seed in range(8)]
+    limits = {"extract": 2, "render": 2, "ocr": 3, "parse": 1}
+    stats = pipeline.PipelineStats(limits)
+    results = list(pipeline.parse_pdfs(executor, "parse_boyett", iter(batch), use_cache=False,
+                                       limits=limits, stats=stats))
+    assert [r[0] for r in results] == [fname for fname, _ in batch]
+    assert all(rows and err is None for _, _, rows, err, _ in results)
+    assert fake.peak["render"] <= 2
+    assert fake.peak["ocr"] == 3
+    summary = stats.summary()
+    assert {stage: summary[stage]["limit"] for stage in limits} == limits
+    assert summary["render"]["items"] == summary["ocr"]["items"] == len(batch)
+    assert summary["parse"]["items"] == len(batch)
+
+
+def test_errors_stay_with_their_file_and_order_is_kept(cache_dir, executor, monkeypatch):
+    fake = FakeScans(monkeypatch, ocr_delay=0.2)
+    slow = fake.scan("parse_boyett", 0)
+    bad = fake.scan("parse_boyett", 1)
+    fake.fail.add(bad)
+    text = synth.generate("parse_boyett", items=3, seed=2)
+    batch = [("slow.pdf", slow), ("text.pdf", text), ("bad.pdf", bad), ("broken.pdf", b"%PDF-1.4 no")]
+    results = list(pipeline.parse_pdfs(executor, "parse_boyett", iter(batch), use_cache=False))
+    assert [r[0] for r in results] == ["slow.pdf", "text.pdf", "bad.pdf", "broken.pdf"]
+    by_name = {fname: (rows, err, m) for fname, _, rows, err, m in results}
+    assert by_name["slow.pdf"][0] and by_name["text.pdf"][0]
+    rows, err, m = by_name["bad.pdf"]
+    assert rows == [] and err == "ValueError: canned OCR failure"
+    assert "canned OCR failure" in m["traceback"]
+    assert by_name["broken.pdf"][1]
+
+
+def test_input_errors_reach_the_consumer(cache_dir, executor):
+    def pdfs():
+        yield "a.pdf", synth.generate("parse_dale", seed=0)
+        raise OSError("input went away")
+
+    results = pipeline.parse_pdfs(executor, None, pdfs(), use_cache=False)
+    with pytest.raises(OSError, match="input went away"):
+        list(results)
+
+
+def test_stage_limits_need_pipeline(capsys):
+    with pytest.raises(SystemExit) as exit:
+        cli.main(["x.pdf", "-o", "out.csv", "--stage-limits", "ocr=2"])
+    assert exit.value.code == cli.EXIT_USAGE
+    assert "--stage-limits only applies with --pipeline" in capsys.readouterr().err
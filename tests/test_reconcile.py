@@ -0,0 +1,67 @@
+import csv
+import os
+import subprocess
+import sys
+
+import pytest
+
+import reconcile
+from conftest import ROOT
+
+
+def _issues(path):
+    with open(path, newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    assert rows
+    return [row.get("parsing_issues") or "" for row in rows]
+
+
+@pytest.mark.parametrize("mode", [[], ["--no-dedup"], ["--pipeline"]])
+def test_rerun_with_and_without_cache_is_not_a_duplicate(tmp_path, invoices, run_cli, mode):
+    invoices(seeds=(0, 1))
+    out = tmp_path / "out.csv"
+    for flags in ([], [], ["--no-cache"], ["--no-cache"]):
+        res = run_cli(tmp_path / "pdfs", "-o", out, *mode, *flags)
+        assert res.returncode == 0, res.stderr
+        assert not any("duplicate_invoice" in issue for issue in _issues(out)), flags
+
+
+def test_resent_invoice_is_a_duplicate(tmp_path, invoices, run_cli):
+    first, = invoices(vendors=["parse_dale"])
+    (tmp_path / "later").mkdir()
+    (tmp_path / "later" / "resent.pdf").write_bytes(first.read_bytes())
+    out = tmp_path / "out.csv"
+    assert run_cli(first, "-o", out, "--no-cache").returncode == 0
+    assert run_cli(tmp_path / "later", "-o", out, "--no-cache").returncode == 0
+    assert all(f"duplicate_invoice (first seen in {os.path.realpath(first)})" in issue for issue in _issues(out))
+
+
+def test_same_directory_by_another_path_is_not_a_duplicate(tmp_path, invoices, run_cli):
+    invoices(seeds=(0, 1))
+    for path in ("pdfs", "./pdfs", tmp_path / "pdfs", "pdfs/../pdfs"):
+        out = tmp_path / "out.csv"
+        res = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "cli.py"), "-w", "2", str(path), "-o", str(out)],
+            capture_output=True, text=True, cwd=tmp_path, timeout=600,
+        )
+        assert res.returncode == 0, res.stderr
+        assert not any("duplicate_invoice" in issue for issue in _issues(out)), path
+
+
+def _result(fname, rows):
+    return fname, "parse_dale", rows, None, {"sha256": "abc"}
+
+
+def _row(page, number, total, amount):
+    return {"vendor_name": "Dale Petroleum Company", "invoice_number": number, "total_amount": total,
+            "line_item_amount": amount, "check_needed": "FALSE", "parsing_issues": "", "page": page}
+
+
+def test_totals_are_checked_per_page(tmp_path):
+    index = reconcile.InvoiceIndex(str(tmp_path / "index.sqlite"))
+    # two invoices on two pages of one file with the same number and total
+    rows = [_row(1, "7", "10.00", "4.00"), _row(1, "7", "10.00", "6.00"),
+            _row(2, "7", "10.00", "10.00"), _row(3, "8", "5.00", "4.00")]
+    reconcile.check_batch([_result("a.pdf", rows)], index)
+    assert [row["parsing_issues"] for row in rows] == ["", "", "", "total_mismatch"]
+    assert [row["check_needed"] for row in rows] == ["FALSE", "FALSE", "FALSE", "TRUE"]
@@ -0,0 +1,60 @@
+import pytest
+
+import classify
+import linescan
+import registry
+from conftest import VENDORS
+
+
+@pytest.fixture
+def parser_dir(tmp_path, monkeypatch):
+    # a directory of parse_*.py modules, importable and forgotten afterwards
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(registry, "_modules", {})
+
+    def write(name, source):
+        (tmp_path / f"{name}.py").write_text(source)
+    return tmp_path, write
+
+
+def test_parsers_are_discovered_by_file_name(parser_dir):
+    path, write = parser_dir
+    write("parse_zeta", 'VENDOR_LABEL = "Alpha Oil"\nPARSER_VERSION = 3\ndef parse(f, pages=None):\n    return []\n')
+    write("parse_beta", "def parse(f):\n    return []\n")
+    write("helper", "def parse(f):\n    return []\n")
+    # sorted by label; a module without VENDOR_LABEL is listed by its name
+    assert list(registry.discover_parsers(str(path)).items()) == [("Alpha Oil", "parse_zeta"),
+                                                                  ("parse_beta", "parse_beta")]
+    assert registry.parser_version("parse_zeta") == "3"
+    assert registry.parser_version("parse_beta") == "0"
+    assert registry.vendor_name("parse_beta") is None
+    assert registry.scanner("parse_beta") is None
+
+
+def test_a_parser_without_parse_is_refused(parser_dir):
+    path, write = parser_dir
+    write("parse_broken", 'VENDOR_LABEL = "Broken"\n')
+    with pytest.raises(RuntimeError, match="parse_broken.py has no parse"):
+        registry.discover_parsers(str(path))
+
+
+def test_every_vendor_is_registered():
+    assert sorted(registry.VENDOR_PARSERS.values()) == VENDORS
+    for label, module_name in registry.VENDOR_PARSERS.items():
+        assert registry.resolve_vendor(label.upper()) == module_name
+        assert registry.resolve_vendor(module_name) == module_name
+        assert registry.vendor_name(module_name)
+    assert registry.resolve_vendor("auto") is None and registry.resolve_vendor("") is None
+    with pytest.raises(ValueError, match="unknown vendor 'Nobody'"):
+        registry.resolve_vendor("Nobody")
+
+
+def test_versions_name_every_parser_auto_detection_depends_on(monkeypatch):
+    auto = registry.versions().split(",")
+    assert auto[0] == f"classify:{classify.CLASSIFIER_VERSION}"
+    assert auto[1:] == [f"{m}:{registry.parser_version(m)}" for m in VENDORS]
+    assert registry.versions("parse_dale") == f"parse_dale:{registry.parser_version('parse_dale')}"
+    # reading scans by region changes the results, so the version too
+    version = registry.parser_version("parse_dale")
+    monkeypatch.setattr(linescan, "OCR_REGIONS", True)
+    assert registry.versions("parse_dale") == f"parse_dale:{version}+regions"
@@ -0,0 +1,69 @@
+from decimal import Decimal
+
+import pytest
+
+import output
+import results
+
+
+def _row(n, vendor):
+    return {"source_file": f"batch/{n % 3}.pdf", "vendor_name": vendor, "invoice_number": f"INV-{n:04d}",
+            "invoice_date": "03/14/2024", "total_amount": "100.00", "line_item_description": f"item {n}",
+            "line_item_amount": Decimal("1.50") * n, "check_needed": "TRUE" if n % 4 == 0 else "FALSE",
+            "parsing_issues": "", "ocr_dpi": ""}
+
+
+@pytest.fixture
+def store(tmp_path):
+    # 250 rows written in batches of 40; every other row from Dale
+    path = str(tmp_path / "results.sqlite")
+    vendors = ["Dale Petroleum Company", "Boyett Petroleum"]
+    with output.SqliteRowWriter(path, batch_rows=40) as writer:
+        for start in range(0, 250, 25):
+            writer.write([_row(n, vendors[n % 2]) for n in range(start, start + 25)])
+    assert writer.rows_written == 250
+    return results.ResultStore(path)
+
+
+def test_count_and_filters(store):
+    assert store.count() == 250
+    assert store.count(vendor_name="Dale Petroleum Company") == 125
+    # exact match only, unless the value ends in *
+    assert store.count(vendor_name="Dale") == 0
+    assert store.count(vendor_name="Dale*") == 125
+    assert store.count(vendor_name="*") == 250
+    assert store.count(check_needed=True) == 63
+    assert store.count(check_needed=False) == 187
+    assert store.count(invoice_number="INV-0012") == 1
+    assert store.count(invoice_number="INV-01*") == 100
+    assert store.count(invoice_number="INV-01*", vendor_name="Boyett*", check_needed=True) == 0
+    assert store.count(source_file="batch/1.pdf", check_needed=False) == 62
+    assert store.count(invoice_number="  ") == 250
+
+
+def test_distinct(store):
+    assert store.distinct("vendor_name") == ["Boyett Petroleum", "Dale Petroleum Company"]
+    assert store.distinct("source_file") == ["batch/0.pdf", "batch/1.pdf", "batch/2.pdf"]
+    with pytest.raises(ValueError):
+        store.distinct("rowid; DROP TABLE rows")
+
+
+def test_pages(store):
+    first = store.page(0, page_size=100)
+    assert [r["invoice_number"] for r in first] == [f"INV-{n:04d}" for n in range(100)]
+    assert first[3]["line_item_amount"] == 4.5 and first[4]["check_needed"] is True
+    assert len(store.page(2, page_size=100)) == 50
+    assert store.page(3, page_size=100) == []
+    # pages of a filtered result follow each other without gaps
+    dale = [r["invoice_number"] for p in range(3) for r in store.page(p, page_size=50, vendor_name="Dale*")]
+    assert dale == [f"INV-{n:04d}" for n in range(0, 250, 2)]
+
+
+def test_vendor_labels(store, capsys):
+    assert results.vendor_arg("Dale") == results.vendor_arg("parse_dale") == "Dale Petroleum Company"
+    assert results.vendor_arg("Boyett*") == "Boyett*"
+    assert results.vendor_arg("auto") == ""
+    assert results.main([store.path, "--vendor", "Dale", "--check-needed", "--page", "2", "--page-size", "10"]) == 0
+    out, err = capsys.readouterr()
+    assert err.strip() == "63 matching rows"
+    assert len(out.splitlines()) == 10
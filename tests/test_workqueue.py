@@ -0,0 +1,141 @@
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import closing
+
+import pytest
+
+import engine
+import synth
+import workqueue
+from conftest import ROOT
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return workqueue.SqliteQueue(str(tmp_path / "queue.sqlite"), lease_seconds=0.2, max_attempts=2)
+
+
+def _status(queue):
+    with closing(sqlite3.connect(queue.path)) as db:
+        return db.execute("SELECT seq, status, attempts, worker FROM tasks ORDER BY seq").fetchall()
+
+
+def test_expired_lease_is_taken_over(queue):
+    queue.put("b", 0, "a.pdf", "parse_dale", b"pdf")
+    task_id, fname, module, data = queue.claim("w1")
+    assert (fname, module, data) == ("a.pdf", "parse_dale", b"pdf")
+    assert queue.claim("w2") is None
+    time.sleep(0.3)
+    assert queue.claim("w2") == (task_id, "a.pdf", "parse_dale", b"pdf")
+    assert _status(queue) == [(0, "running", 2, "w2")]
+
+
+def test_renewed_lease_is_kept(queue):
+    queue.put("b", 0, "a.pdf", "parse_dale", b"pdf")
+    task_id = queue.claim("w1")[0]
+    for _ in range(3):
+        time.sleep(0.1)
+        queue.renew([task_id], "w1")
+        # another worker's renew does not count
+        queue.renew([task_id], "w2")
+    assert queue.claim("w2") is None
+
+
+def test_first_result_is_kept(queue):
+    queue.put("b", 0, "a.pdf", "parse_dale", b"pdf")
+    task_id = queue.claim("w1")[0]
+    time.sleep(0.3)
+    assert queue.claim("w2")[0] == task_id
+    queue.complete(task_id, ("a.pdf", "parse_dale", [{"n": 2}], None, {"worker": "w2"}))
+    queue.complete(task_id, ("a.pdf", "parse_dale", [{"n": 1}], None, {"worker": "w1"}))
+    assert queue.results("b", [0]) == {0: ("a.pdf", "parse_dale", [{"n": 2}], None, {"worker": "w2"})}
+
+
+def test_retry_cap_fails_the_task(queue):
+    queue.put("b", 0, "a.pdf", "parse_dale", b"pdf")
+    queue.put("b", 1, "b.pdf", "parse_dale", b"pdf")
+    for _ in range(2):
+        assert queue.claim("w1")[1] == "a.pdf"
+        assert queue.claim("w1")[1] == "b.pdf"
+        time.sleep(0.3)
+    # a.pdf fails when it would be claimed a third time, b.pdf when reaped
+    assert queue.claim("w1") is None
+    assert [row[:3] for row in _status(queue)] == [(0, "failed", 2), (1, "failed", 2)]
+    results = queue.results("b", [0, 1])
+    assert results[0][2:4] == ([], "WorkerLost: no result after 2 attempts")
+    queue.put("b", 2, "c.pdf", "parse_dale", b"pdf")
+    queue.claim("w1"), time.sleep(0.3), queue.claim("w1"), time.sleep(0.3)
+    queue.reap()
+    assert _status(queue)[2][1] == "failed"
+    assert queue.remove("b") == 3
+    assert queue.counts() == {}
+
+
+def test_open_queue_backends(tmp_path):
+    assert isinstance(workqueue.open_queue(f"sqlite://{tmp_path}/q.sqlite"), workqueue.SqliteQueue)
+    with pytest.raises(ValueError, match="redis"):
+        workqueue.open_queue("redis://host/0")
+
+
+def _worker(path, worker_id, **kwargs):
+    # a worker process in its own session, so its pool dies with it
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "workqueue.py"), "worker", path, "-w", "1", "--id", worker_id],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True, **kwargs,
+    )
+
+
+def test_killed_worker_task_is_finished_once_by_another(tmp_path, cache_dir, executor, monkeypatch):
+    # the first PDF is big enough to still be parsing when its worker is killed
+    batch = [("big.pdf", synth.generate("parse_boyett", pages=120, items=12, seed=0))]
+    batch += [(f"{vendor}_{seed}.pdf", synth.generate(vendor, items=4, seed=seed))
+              for vendor in sorted(synth.LAYOUTS) for seed in range(3)]
+    expected = [(fname, module, rows, err)
+                for fname, module, rows, err, _ in engine.parse_pdfs(executor, None, batch, use_cache=False)]
+
+    path = str(tmp_path / "queue.sqlite")
+    # workers read their lease from the environment
+    monkeypatch.setenv("PARSER_QUEUE_LEASE", "2")
+    queue = workqueue.SqliteQueue(path, lease_seconds=2)
+    results = workqueue.parse_pdfs(queue, None, iter(batch), use_cache=False, poll_seconds=0.05)
+    got = []
+    # the coordinator collects in the background while workers come and go
+    coordinator = threading.Thread(target=lambda: got.extend(results))
+    coordinator.start()
+    doomed = _worker(path, "doomed")
+    workers = []
+    try:
+        # kill the worker while it parses the big PDF
+        deadline = time.time() + 60
+        while ("big.pdf", "doomed") not in _claims(path):
+            assert time.time() < deadline
+            time.sleep(0.02)
+        os.killpg(doomed.pid, signal.SIGKILL)
+        doomed.wait()
+        workers = [_worker(path, f"w{i}") for i in range(3)]
+        coordinator.join(120)
+        assert not coordinator.is_alive()
+    finally:
+        for proc in workers + [doomed]:
+            if proc.poll() is None:
+                os.killpg(proc.pid, signal.SIGTERM)
+                proc.wait()
+
+    assert [(fname, module, rows, err) for fname, module, rows, err, _ in got] == expected
+    m = {r[0]: r[4] for r in got}
+    assert m["big.pdf"]["worker"] in ("w0", "w1", "w2")
+    assert m["big.pdf"]["sha256"]
+    # every task was collected and removed
+    assert queue.counts() == {}
+
+
+def _claims(path):
+    if not os.path.exists(path):
+        return []
+    with closing(sqlite3.connect(path, timeout=30)) as db:
+        return db.execute("SELECT fname, worker FROM tasks WHERE status = 'running'").fetchall()
@@ -0,0 +1,294 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import closing
+
+import cache
+import engine
+
+# Coordinator / worker mode for batches too big for one machine. The
+# coordinator (cli.py --queue) puts every PDF on a work queue as a task and
+# collects the results in input order; any number of workers, on any host
+# that can reach the queue, claim tasks, run the vendor's parse() on their
+# own process pool and push the results back:
+#
+#   python cli.py invoices.zip -o out.csv --queue /shared/queue.sqlite
+#   python workqueue.py worker /shared/queue.sqlite -w 8      # on each node
+#
+# A claimed task is leased for LEASE_SECONDS and the worker renews the lease
+# while it parses. A task whose lease runs out (the worker died or lost the
+# queue) goes back to the queue, up to MAX_ATTEMPTS claims; then it fails
+# with a WorkerLost error. A parse error is a result like any other and is
+# not retried. Should two workers both finish a task, the first result is
+# kept.
+#
+# SqliteQueue is the stand-in backend: one SQLite file on a filesystem all
+# nodes share, in rollback-journal mode (WAL needs shared memory, so one
+# host). Another backend (Redis, SQS, a database server) only needs the
+# methods SqliteQueue has; open_queue() picks the backend from the path.
+# Leases compare wall clocks, so the nodes' clocks should be in sync.
+
+LEASE_SECONDS = float(os.environ.get("PARSER_QUEUE_LEASE") or 120)
+MAX_ATTEMPTS = int(os.environ.get("PARSER_QUEUE_ATTEMPTS") or 3)
+# tasks a coordinator keeps on the queue: enough to keep every node busy
+MAX_INFLIGHT = int(os.environ.get("PARSER_QUEUE_INFLIGHT") or 512)
+POLL_SECONDS = 0.5
+
+
+class SqliteQueue:
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, batch TEXT, seq INTEGER, fname TEXT,"
+                " module TEXT, data BLOB, status TEXT DEFAULT 'queued', attempts INTEGER DEFAULT 0,"
+                " worker TEXT, lease_until REAL, result TEXT, created REAL, finished REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, id)")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_batch ON tasks (batch, seq)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def put(self, batch, seq, fname, module, data):
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT INTO tasks (batch, seq, fname, module, data, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (batch, seq, fname, module, data, time.time()),
+            )
+
+    def claim(self, worker):
+        # → (task id, fname, module name, pdf bytes) or None; expired leases
+        # are taken over, or failed once they used up max_attempts
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = db.execute(
+                        "SELECT id, fname, module, data, attempts FROM tasks"
+                        " WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)"
+                        " ORDER BY id LIMIT 1", (now,),
+                    ).fetchone()
+                    if row is None:
+                        return None
+                    task_id, fname, module, data, attempts = row
+                    if attempts >= self.max_attempts:
+                        self._lost(db, task_id, fname, module, attempts, now)
+                        continue
+                    db.execute(
+                        "UPDATE tasks SET status = 'running', attempts = attempts + 1, worker = ?,"
+                        " lease_until = ? WHERE id = ?",
+                        (worker, now + self.lease_seconds, task_id),
+                    )
+                    return task_id, fname, module, data
+            finally:
+                db.execute("COMMIT")
+
+    def _lost(self, db, task_id, fname, module, attempts, now):
+        err = f"WorkerLost: no result after {attempts} attempts"
+        m = {"file": fname, "seconds": 0.0, "stages": {}, "pages": [], "counts": {}, "attempts": attempts}
+        db.execute(
+            "UPDATE tasks SET status = 'failed', data = NULL, result = ?, finished = ? WHERE id = ?",
+            (json.dumps([fname, module, [], err, m]), now, task_id),
+        )
+
+    def renew(self, task_ids, worker):
+        # extend the leases this worker still holds
+        with closing(self._connect()) as db:
+            db.executemany(
+                "UPDATE tasks SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                [(time.time() + self.lease_seconds, task_id, worker) for task_id in task_ids],
+            )
+
+    def complete(self, task_id, result):
+        # store a parse_pdf() result; ignored if the task already has one
+        with closing(self._connect()) as db:
+            db.execute(
+                "UPDATE tasks SET status = 'done', data = NULL, result = ?, finished = ?"
+                " WHERE id = ? AND status IN ('queued', 'running')",
+                (json.dumps(result, default=str), time.time(), task_id),
+            )
+
+    def reap(self):
+        # fail expired tasks that have no claims left, so a coordinator does
+        # not wait on them when no worker is polling
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            expired = db.execute(
+                "SELECT id, fname, module, attempts FROM tasks"
+                " WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            ).fetchall()
+            for task_id, fname, module, attempts in expired:
+                self._lost(db, task_id, fname, module, attempts, now)
+            db.execute("COMMIT")
+
+    def results(self, batch, seqs):
+        # finished results among seqs of a batch → {seq: result}
+        found = {}
+        with closing(self._connect()) as db:
+            for i in range(0, len(seqs), 500):
+                chunk = list(seqs[i:i + 500])
+                found.update(db.execute(
+                    f"SELECT seq, result FROM tasks WHERE batch = ? AND seq IN ({', '.join('?' * len(chunk))})"
+                    " AND status IN ('done', 'failed')",
+                    [batch] + chunk,
+                ))
+        return {seq: tuple(json.loads(result)) for seq, result in found.items()}
+
+    def remove(self, batch, seqs=None):
+        with closing(self._connect()) as db:
+            if seqs is None:
+                return db.execute("DELETE FROM tasks WHERE batch = ?", (batch,)).rowcount
+            marks = ", ".join("?" * len(seqs))
+            return db.execute(f"DELETE FROM tasks WHERE batch = ? AND seq IN ({marks})",
+                              [batch] + list(seqs)).rowcount
+
+    def counts(self):
+        # batch → {status: tasks}
+        with closing(self._connect()) as db:
+            counts = {}
+            for batch, status, n in db.execute("SELECT batch, status, COUNT(*) FROM tasks GROUP BY batch, status"):
+                counts.setdefault(batch, {})[status] = n
+            return counts
+
+
+def open_queue(path, **kwargs):
+    # sqlite:///path/queue.sqlite or a plain path → SqliteQueue
+    if path.startswith("sqlite://"):
+        path = path[len("sqlite://"):]
+    elif "://" in path:
+        raise ValueError(f"no work queue backend for {path.split('://')[0]!r}")
+    return SqliteQueue(path, **kwargs)
+
+
+def parse_pdfs(queue, module_name, pdfs, use_cache=True, max_inflight=MAX_INFLIGHT,
+               poll_seconds=POLL_SECONDS):
+    # Coordinator: engine.parse_pdfs() with the PDFs parsed by queue workers
+    # (queue takes the executor's place). Same results, in input order;
+    # cached PDFs are answered locally, and at most max_inflight tasks are on
+    # the queue at a time. Tasks are removed from the queue as their results
+    # are collected, and all of the batch's if the run is abandoned.
+    batch = uuid.uuid4().hex
+    pending = deque()  # (seq, fname, digest, cached (module, rows) or None)
+    finished = {}  # seq → result taken off the queue
+    seq = 0
+
+    def collect(block):
+        while pending:
+            waiting = [p[0] for p in pending if p[3] is None and p[0] not in finished]
+            if waiting:
+                found = queue.results(batch, waiting)
+                if found:
+                    queue.remove(batch, list(found))
+                    finished.update(found)
+            ready = False
+            while pending and (pending[0][3] is not None or pending[0][0] in finished):
+                s, fname, digest, hit = pending.popleft()
+                if hit is not None:
+                    yield (fname,) + hit + (None, {"file": fname, "cached": True, "sha256": digest})
+                else:
+                    yield engine.store_result(module_name, digest, finished.pop(s), use_cache)
+                ready = True
+            if ready or not block:
+                return
+            queue.reap()
+            time.sleep(poll_seconds)
+
+    try:
+        for fname, data in pdfs:
+            while len(pending) >= max_inflight:
+                yield from collect(block=True)
+            digest = cache.pdf_digest(data)
+            module, rows = engine.lookup_cached(module_name, fname, digest, use_cache)
+            if rows is not None:
+                pending.append((seq, fname, digest, (module, rows)))
+            else:
+                queue.put(batch, seq, fname, module, data)
+                pending.append((seq, fname, digest, None))
+            seq += 1
+            del data
+            yield from collect(block=False)
+        while pending:
+            yield from collect(block=True)
+    finally:
+        queue.remove(batch)
+
+
+def run_worker(queue, workers=engine.DEFAULT_WORKERS, worker_id=None, exit_when_idle=False,
+               poll_seconds=POLL_SECONDS):
+    # Claim tasks while fewer than `workers` are parsing, parse them on a
+    # local process pool and push the results; leases are renewed every
+    # third of the lease while parsing. Returns the number of tasks done.
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    done = 0
+    with engine.start_engine(workers) as executor:
+        inflight = {}  # task id → future
+        while True:
+            while len(inflight) < workers:
+                task = queue.claim(worker_id)
+                if task is None:
+                    break
+                task_id, fname, module, data = task
+                inflight[task_id] = executor.submit(engine.parse_pdf, module, fname, data)
+            if not inflight:
+                if exit_when_idle:
+                    return done
+                time.sleep(poll_seconds)
+                continue
+            wait(list(inflight.values()), timeout=queue.lease_seconds / 3, return_when=FIRST_COMPLETED)
+            for task_id, fut in list(inflight.items()):
+                if fut.done():
+                    del inflight[task_id]
+                    fname, module, rows, err, m = fut.result()
+                    m["worker"] = worker_id
+                    queue.complete(task_id, (fname, module, rows, err, m))
+                    done += 1
+            queue.renew(list(inflight), worker_id)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Work queue workers for multi-host batch parsing.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="claim and parse tasks until stopped")
+    worker.add_argument("queue", help="queue path (sqlite:// or a file on a shared filesystem)")
+    worker.add_argument("-w", "--workers", type=int, default=engine.DEFAULT_WORKERS)
+    worker.add_argument("--id", help="worker name in the queue (default host:pid)")
+    worker.add_argument("--exit-when-idle", action="store_true", help="stop once the queue is empty")
+    status = sub.add_parser("status", help="tasks per batch and status")
+    status.add_argument("queue")
+    clear = sub.add_parser("clear", help="remove a batch's tasks")
+    clear.add_argument("queue")
+    clear.add_argument("batch")
+    args = ap.parse_args(argv)
+
+    queue = open_queue(args.queue)
+    if args.command == "worker":
+        try:
+            n = run_worker(queue, args.workers, args.id, args.exit_when_idle)
+        except KeyboardInterrupt:
+            return 0
+        print(f"{n} tasks done", file=sys.stderr)
+    elif args.command == "status":
+        for batch, counts in queue.counts().items():
+            print(f"{batch}  " + "  ".join(f"{k} {v}" for k, v in sorted(counts.items())))
+    else:
+        print(f"Removed {queue.remove(args.batch)} tasks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())